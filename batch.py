@@ -0,0 +1,244 @@
+"""
+批量检索：网络请求按数据源轮转在线程池中执行，页面解析交给按 CPU 核数分配的进程池
+
+用法:
+    python batch.py keywords.txt --sources douban,amazon --details 1 --output results.jsonl
+
+关键词文件每行一个，传 - 表示从标准输入读取。每个 (数据源, 关键词) 输出一行 JSON:
+    {"source": "douban", "query": "三体", "results": [...], "details": [...], "elapsed_ms": 123.4}
+
+每个 (数据源, 关键词) 的搜索和详情共用 --deadline 秒的时间预算（默认取 settings 的 lookup_deadline），
+超出后记为失败；Ctrl-C 会取消所有正在进行的检索。
+
+关键词文件逐行读取，任务按需提交，内存占用与输入行数无关。输入中的重复行由布隆过滤器加精确确认跳过；
+--resume 追加写入同一输出文件，并跳过上次已成功完成的 (数据源, 关键词)；上次失败或未确认完成的记录先从输出文件中移除，
+重新检索后每个 (数据源, 关键词) 仍然只有一行：
+    python batch.py isbns.txt --sources all --output results.jsonl --resume --expected-items 5000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from typing import Dict, Iterator, Optional
+
+from sources.registry import get_source, source_names
+from sources.parallel import ParsePool, DEFAULT_RECYCLE_AFTER
+from sources.utils import make_request, response_encoding, retry_on_failure
+from sources.metrics import trace, phase, count_failure, write_metrics
+from sources.deadline import deadline, budget
+from sources.exceptions import DeadlineExceeded
+from sources.settings import get_settings
+from sources.dedupe import ProcessedFilter
+from sources.isbn_index import find_known_book, remember_book
+from sources.scheduler import HostScheduler, BATCH
+
+# 网络请求失败时的重试包装，最终失败返回 None
+fetch = retry_on_failure()(make_request)
+
+def parse_in_pool(pool: ParsePool, func, response, *args):
+    """把响应字节交给进程池解析，等待时间计入 parse 阶段，最多等到本次检索的截止时间"""
+    with phase('parse'):
+        future = pool.submit(func, response.content, *args, response_encoding(response))
+        try:
+            return future.result(timeout=budget(None))
+        except FutureTimeoutError:
+            future.cancel()
+            raise DeadlineExceeded()
+
+def process_keyword(source: str, keyword: str, pool: ParsePool, details: int,
+                    seconds: Optional[float] = None) -> Dict:
+    """
+    检索单个 (数据源, 关键词)，按需获取前几条结果的详情
+
+    Args:
+        source: 数据源代号
+        keyword: 关键词
+        pool: 解析进程池
+        details: 获取详情的结果条数
+        seconds: 时间预算（秒），None 或 0 表示不限
+
+    Returns:
+        可直接序列化的结果记录
+    """
+    module = get_source(source)
+    record = {'source': source, 'query': keyword, 'results': []}
+    started = time.perf_counter()
+    known = find_known_book(keyword, source)
+    if known:
+        # 本地 ISBN 索引中已有，不访问网络
+        record.update(results=[known], index=True)
+        if details:
+            record['details'] = [known]
+        record['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+    with trace(source, 'batch'), deadline(seconds):
+        try:
+            response = fetch(*module.build_search_request(keyword))
+            if response is None:
+                record['error'] = '搜索请求失败'
+            else:
+                record['results'] = parse_in_pool(pool, module.parse_search_results, response)
+
+            if details and record['results']:
+                record['details'] = [fetch_details(module, book['url'], pool)
+                                     for book in record['results'][:details]]
+                for book_details in record['details']:
+                    remember_book(book_details, source)
+        except Exception as e:
+            count_failure(e)
+            record['error'] = str(e)
+    record['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return record
+
+def fetch_details(module, book_ref: str, pool: ParsePool) -> Optional[Dict]:
+    """获取并解析一条详情，需要再次访问网络的补充步骤回到当前线程执行"""
+    response = fetch(*module.build_details_request(book_ref))
+    if response is None:
+        return None
+    details = parse_in_pool(pool, module.parse_book_details, response, book_ref)
+    complete = getattr(module, 'complete_book_details', None)
+    if details and complete:
+        details = complete(details, book_ref)
+    return details
+
+def iter_keywords(path: str) -> Iterator[str]:
+    """逐行读取关键词文件，跳过空行（重复项由 ProcessedFilter 处理）"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def drop_unfinished(path: str, processed: ProcessedFilter) -> int:
+    """
+    续跑前从输出文件中移除失败和未确认完成的记录
+
+    这些条目会重新检索并追加新记录，保留旧记录会让同一 (数据源, 关键词) 出现多行。
+    逐行改写到临时文件后替换，内存占用与文件大小无关。
+
+    Args:
+        path: 输出文件
+        processed: 已加载上次状态的 ProcessedFilter
+
+    Returns:
+        移除的行数
+    """
+    if not os.path.exists(path):
+        return 0
+    dropped = 0
+    tmp_path = f"{path}.tmp"
+    with open(path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+        for line in src:
+            try:
+                record = json.loads(line)
+                keep = 'error' not in record and processed.is_done(f"{record['source']}\t{record['query']}")
+            except (ValueError, KeyError, TypeError):
+                # 中断时只写了一半的行
+                keep = False
+            if keep:
+                dst.write(line if line.endswith('\n') else line + '\n')
+            else:
+                dropped += 1
+    if dropped:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+    return dropped
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder 批量检索')
+    parser.add_argument('keywords', help='关键词文件，每行一个，- 表示标准输入')
+    parser.add_argument('--sources', default='douban', help='逗号分隔的数据源代号，或 all')
+    parser.add_argument('--output', default='results.jsonl', help='输出文件（JSON Lines）')
+    parser.add_argument('--details', type=int, default=0, help='每个关键词获取详情的结果条数')
+    parser.add_argument('--fetch-workers', type=int, default=32, help='网络请求线程数')
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1, help='解析进程数，默认等于CPU核数')
+    parser.add_argument('--recycle-after', type=int, default=DEFAULT_RECYCLE_AFTER,
+                        help='平均每个解析进程处理多少个页面后回收，0 表示不回收')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='每个 (数据源, 关键词) 的时间预算（秒），默认取 settings 的 lookup_deadline，0 表示不限')
+    parser.add_argument('--resume', action='store_true',
+                        help='追加写入输出文件，跳过上次已成功完成的 (数据源, 关键词)')
+    parser.add_argument('--expected-items', type=int, default=10_000_000,
+                        help='预期的 (数据源, 关键词) 条数，决定去重过滤器的大小')
+    parser.add_argument('--dedupe-error-rate', type=float, default=0.01,
+                        help='去重过滤器的误判率，误判只会多一次精确查询，不会漏处理')
+    parser.add_argument('--metrics-out', help='导出分阶段指标的文件（.json 或 Prometheus 文本）')
+    args = parser.parse_args()
+
+    sources = source_names() if args.sources == 'all' else [s.strip() for s in args.sources.split(',') if s.strip()]
+    unknown = [s for s in sources if s not in source_names()]
+    if unknown:
+        parser.error(f"未知的搜索源: {', '.join(unknown)}")
+    tasks = ((source, keyword) for keyword in iter_keywords(args.keywords) for source in sources)
+    processed = ProcessedFilter(args.output, args.expected_items, args.dedupe_error_rate, args.resume)
+    dropped = drop_unfinished(args.output, processed) if args.resume else 0
+    print(f"数据源: {', '.join(sources)}，网络线程: {args.fetch_workers}，解析进程: {args.parse_workers}"
+          + (f"，上次已完成: {processed.resumed}，移除失败或未完成的记录: {dropped}" if args.resume else ''))
+
+    seconds = get_settings().lookup_deadline if args.deadline is None else args.deadline
+    # 同时提交的任务数上限，避免一次性为全部输入创建 future
+    max_pending = args.fetch_workers * 4
+
+    started = time.perf_counter()
+    submitted = done = failed = skipped = 0
+    pending: Dict = {}
+    with ParsePool(args.parse_workers, args.recycle_after) as pool, \
+            HostScheduler(args.fetch_workers, thread_name_prefix='bookfinder-fetch') as scheduler, \
+            open(args.output, 'a' if args.resume else 'w', encoding='utf-8') as out, \
+            deadline() as root:
+
+        def collect(futures):
+            nonlocal done, failed
+            for future in futures:
+                key = pending.pop(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                done += 1
+                if 'error' in record:
+                    failed += 1
+                else:
+                    processed.complete(key)
+
+        try:
+            for source, keyword in tasks:
+                key = f"{source}\t{keyword}"
+                if not processed.claim(key):
+                    skipped += 1
+                    continue
+                # 任务按数据源轮转执行，每个数据源同时执行的任务数有上限，慢的数据源不会占满所有线程；
+                # 任务继承 root，Ctrl-C 时取消 root 即可让正在进行的检索尽快结束
+                future = scheduler.submit(source, process_keyword, source, keyword, pool, args.details, seconds,
+                                          level=BATCH)
+                pending[future] = key
+                submitted += 1
+                if len(pending) >= max_pending:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        except KeyboardInterrupt:
+            print("\n已中断，取消正在进行的检索")
+            root.cancel()
+            scheduler.shutdown(wait=False, cancel_futures=True)
+        finally:
+            processed.close()
+        generations = pool.generations
+
+    elapsed = time.perf_counter() - started
+    print(f"完成: {done}/{submitted}，失败: {failed}，跳过重复或已完成: {skipped}"
+          f"（过滤器误判 {processed.false_positives} 次），耗时: {elapsed:.2f} 秒，"
+          f"吞吐: {done / elapsed if elapsed else 0:.2f} 条/秒，解析进程批次: {generations}")
+    print(f"结果已写入: {args.output}")
+    if args.metrics_out:
+        write_metrics(args.metrics_out)
+        print(f"指标已写入: {args.metrics_out}")
+
+if __name__ == '__main__':
+    main()
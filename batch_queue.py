@@ -0,0 +1,273 @@
+"""
+分布式批量检索：把关键词拆成任务放进共享队列，多个工作进程（可以在多台机器上）领取执行，最后合并为一个输出文件
+
+用法:
+    python batch_queue.py enqueue keywords.txt --sources douban,amazon --details 1
+    python batch_queue.py work --processes 4            # 每台机器上运行，可以同时运行多个
+    python batch_queue.py status
+    python batch_queue.py collect --output results.jsonl
+
+多台机器共享时，在队列所在的机器上运行 serve，其他机器用 --queue 指向它。
+HTTP 队列用共享令牌鉴权，服务端和工作进程设置相同的 BOOKFINDER_JOB_QUEUE_TOKEN，
+没有令牌时 serve 只允许监听本机地址:
+    BOOKFINDER_JOB_QUEUE_TOKEN=... python batch_queue.py --queue jobs.db serve --host 10.0.0.5 --port 8765
+    BOOKFINDER_JOB_QUEUE_TOKEN=... python batch_queue.py --queue http://10.0.0.5:8765 work
+
+工作进程执行每个任务的方式与 batch.py 相同（网络请求按数据源轮转，解析在进程池中进行），
+执行中的任务定期续约；进程退出或崩溃后，它持有的任务在租约到期后由其他进程重做。
+失败的任务按指数退避重试，达到 --max-attempts 次后进入死信，用 requeue 重新放回队列。
+collect 输出的结果记录格式与 batch.py 相同，每个 (数据源, 关键词) 恰好一条，死信任务的记录带 error。
+"""
+import argparse
+import ipaddress
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, Iterator
+
+from batch import process_keyword, iter_keywords
+from sources.job_queue import (open_queue, QueueServer, JobQueue, LEASE_SECONDS, MAX_ATTEMPTS, RETRY_DELAY,
+                               PENDING)
+from sources.metrics import count_queue_job, write_metrics
+from sources.parallel import ParsePool, DEFAULT_RECYCLE_AFTER
+from sources.registry import source_names
+from sources.scheduler import HostScheduler, BATCH
+from sources.settings import get_settings
+
+# 没有可领取的任务时，两次查询队列的间隔（秒）
+POLL_INTERVAL = 1.0
+
+def iter_jobs(path: str, sources, details: int) -> Iterator[Dict]:
+    """把关键词文件展开为 (数据源, 关键词) 任务"""
+    for line, keyword in enumerate(iter_keywords(path), 1):
+        for source in sources:
+            yield {'line': line, 'source': source, 'keyword': keyword, 'details': details}
+
+def settle(queue: JobQueue, job: Dict, record: Dict, retry_delay: float) -> str:
+    """
+    把任务结果提交给队列
+
+    Returns:
+        done / retry / dead / lost
+    """
+    if 'error' in record:
+        state = queue.fail(job['token'], record, retry_delay)
+        result = 'lost' if state is None else 'retry' if state == PENDING else 'dead'
+    else:
+        result = 'done' if queue.complete(job['token'], record) else 'lost'
+    count_queue_job(job['source'], result)
+    return result
+
+def run_worker(location: str, worker_id: str, fetch_workers: int, parse_workers: int,
+               recycle_after: int = DEFAULT_RECYCLE_AFTER, seconds=None, lease_seconds: float = LEASE_SECONDS,
+               retry_delay: float = RETRY_DELAY, follow: bool = False,
+               metrics_out=None) -> Dict[str, int]:
+    """
+    领取并执行任务，直到队列中的任务全部完成（follow 为 True 时一直运行）
+
+    Args:
+        location: 队列地址
+        worker_id: 工作进程标识
+        fetch_workers: 网络请求线程数
+        parse_workers: 解析进程数
+        recycle_after: 平均每个解析进程处理多少个页面后回收
+        seconds: 每个任务的时间预算（秒），None 或 0 表示不限
+        lease_seconds: 租约时长
+        retry_delay: 第一次失败后的重试等待（秒）
+        follow: 队列暂时为空时是否继续等待新任务
+        metrics_out: 退出时导出指标的文件
+
+    Returns:
+        各结果的任务数，例如 {'done': 95, 'retry': 3, 'dead': 1, 'lost': 1}
+    """
+    stats = {'done': 0, 'retry': 0, 'dead': 0, 'lost': 0}
+    in_flight: Dict = {}
+    lock = threading.Lock()
+    stopped = threading.Event()
+    queue = open_queue(location)
+
+    def keep_alive():
+        """定期为执行中的任务续约"""
+        while not stopped.wait(lease_seconds / 3):
+            with lock:
+                tokens = [job['token'] for job in in_flight.values()]
+            try:
+                held = queue.heartbeat(tokens, lease_seconds)
+            except Exception as e:
+                print(f"[{worker_id}] 续约失败: {e}")
+                continue
+            if len(held) < len(tokens):
+                print(f"[{worker_id}] {len(tokens) - len(held)} 个任务的租约已被其他进程接手，结果将丢弃")
+
+    heartbeat = threading.Thread(target=keep_alive, name='bookfinder-heartbeat', daemon=True)
+    heartbeat.start()
+    # 同时持有的任务数上限；执行中的任务不足一半时才再次领取，减少对队列的写入
+    max_in_flight = fetch_workers * 2
+    try:
+        with ParsePool(parse_workers, recycle_after) as pool, \
+                HostScheduler(fetch_workers, thread_name_prefix='bookfinder-fetch') as scheduler:
+            while True:
+                if len(in_flight) <= max_in_flight // 2:
+                    jobs = queue.lease(worker_id, max_in_flight - len(in_flight), lease_seconds)
+                    with lock:
+                        for job in jobs:
+                            future = scheduler.submit(job['source'], process_keyword, job['source'], job['keyword'],
+                                                      pool, job['details'], seconds, level=BATCH)
+                            in_flight[future] = job
+                if not in_flight:
+                    if not follow and queue.finished():
+                        break
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                for future in wait(list(in_flight), timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED).done:
+                    with lock:
+                        job = in_flight.pop(future)
+                    stats[settle(queue, job, future.result(), retry_delay)] += 1
+    except KeyboardInterrupt:
+        print(f"\n[{worker_id}] 已中断，{len(in_flight)} 个执行中的任务将在租约到期后由其他进程重做")
+    finally:
+        stopped.set()
+        queue.close()
+        if metrics_out:
+            write_metrics(metrics_out)
+    print(f"[{worker_id}] 完成 {stats['done']}，待重试 {stats['retry']}，死信 {stats['dead']}，"
+          f"租约失效 {stats['lost']}")
+    return stats
+
+def print_status(queue: JobQueue):
+    counts = queue.stats()
+    total = sum(counts.values())
+    print(f"共 {total} 个任务: 待执行 {counts['pending']}，执行中 {counts['leased']}，"
+          f"已完成 {counts['done']}，死信 {counts['dead']}")
+
+def is_loopback(host: str) -> bool:
+    """监听地址是否只接受本机连接"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder 分布式批量检索')
+    parser.add_argument('--queue', default=get_settings().job_queue,
+                        help='队列地址：SQLite 文件，或 serve 的 http://主机:端口')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='把关键词文件加入队列')
+    enqueue_parser.add_argument('keywords', help='关键词文件，每行一个，- 表示标准输入')
+    enqueue_parser.add_argument('--sources', default='douban', help='逗号分隔的数据源代号，或 all')
+    enqueue_parser.add_argument('--details', type=int, default=0, help='每个关键词获取详情的结果条数')
+    enqueue_parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='每个任务最多执行的次数')
+
+    work_parser = commands.add_parser('work', help='领取并执行任务')
+    work_parser.add_argument('--processes', type=int, default=1, help='本机启动的工作进程数')
+    work_parser.add_argument('--fetch-workers', type=int, default=32, help='每个工作进程的网络请求线程数')
+    work_parser.add_argument('--parse-workers', type=int, default=None,
+                             help='每个工作进程的解析进程数，默认为 CPU 核数除以工作进程数')
+    work_parser.add_argument('--recycle-after', type=int, default=DEFAULT_RECYCLE_AFTER,
+                             help='平均每个解析进程处理多少个页面后回收，0 表示不回收')
+    work_parser.add_argument('--deadline', type=float, default=None,
+                             help='每个任务的时间预算（秒），默认取 settings 的 lookup_deadline，0 表示不限')
+    work_parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help='租约时长（秒）')
+    work_parser.add_argument('--retry-delay', type=float, default=RETRY_DELAY, help='第一次失败后的重试等待（秒）')
+    work_parser.add_argument('--follow', action='store_true', help='队列为空时继续等待新任务')
+    work_parser.add_argument('--worker-id', default=None, help='工作进程标识，默认为 主机名:进程号')
+    work_parser.add_argument('--metrics-out', help='退出时导出指标的文件（多进程时按进程号加后缀）')
+
+    collect_parser = commands.add_parser('collect', help='按加入顺序合并全部结果')
+    collect_parser.add_argument('--output', default='results.jsonl', help='输出文件（JSON Lines）')
+    collect_parser.add_argument('--partial', action='store_true', help='还有未完成的任务时也输出已有结果')
+
+    commands.add_parser('status', help='查看各状态的任务数')
+    commands.add_parser('requeue', help='把死信任务重新放回队列')
+
+    serve_parser = commands.add_parser('serve', help='通过 HTTP 发布本地队列，供其他机器使用')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--verbose', action='store_true', help='打印访问日志')
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        processes = max(1, args.processes)
+        parse_workers = args.parse_workers or max(1, (os.cpu_count() or 1) // processes)
+        seconds = get_settings().lookup_deadline if args.deadline is None else args.deadline
+        base_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+
+        def options(index: int) -> Dict:
+            metrics_out = args.metrics_out
+            if metrics_out and processes > 1:
+                root, ext = os.path.splitext(metrics_out)
+                metrics_out = f"{root}.{index}{ext}"
+            return dict(location=args.queue, worker_id=base_id if processes == 1 else f"{base_id}/{index}",
+                        fetch_workers=args.fetch_workers, parse_workers=parse_workers,
+                        recycle_after=args.recycle_after, seconds=seconds, lease_seconds=args.lease,
+                        retry_delay=args.retry_delay, follow=args.follow, metrics_out=metrics_out)
+
+        if processes == 1:
+            run_worker(**options(0))
+            return
+        workers = [multiprocessing.Process(target=run_worker, kwargs=options(i), name=f"bookfinder-worker-{i}")
+                   for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.join()
+        return
+
+    if args.command == 'serve':
+        token = get_settings().job_queue_token
+        if not token and not is_loopback(args.host):
+            parser.error('监听非本机地址时需要设置共享令牌 BOOKFINDER_JOB_QUEUE_TOKEN')
+        queue = open_queue(args.queue)
+        server = QueueServer((args.host, args.port), queue, args.verbose, token)
+        print(f"任务队列已发布: http://{args.host}:{args.port}（{args.queue}，{'已启用令牌鉴权' if token else '未鉴权'}）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            queue.close()
+        return
+
+    with open_queue(args.queue) as queue:
+        if args.command == 'enqueue':
+            sources = source_names() if args.sources == 'all' else [s.strip() for s in args.sources.split(',')]
+            unknown = [s for s in sources if s not in source_names()]
+            if unknown:
+                parser.error(f"未知的搜索源: {', '.join(unknown)}")
+            added = queue.enqueue(iter_jobs(args.keywords, sources, args.details), args.max_attempts)
+            print(f"新加入 {added} 个任务")
+            print_status(queue)
+
+        elif args.command == 'status':
+            print_status(queue)
+
+        elif args.command == 'requeue':
+            print(f"已放回 {queue.requeue_dead()} 个死信任务")
+
+        elif args.command == 'collect':
+            if not args.partial and not queue.finished():
+                print_status(queue)
+                print("还有未完成的任务，等全部完成后再合并，或使用 --partial")
+                return
+            written = 0
+            tmp_path = f"{args.output}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as out:
+                for record in queue.results():
+                    out.write(record + '\n')
+                    written += 1
+            os.replace(tmp_path, args.output)
+            print(f"已写入 {written} 条结果: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+文本规范化基准测试：在真实页面文本上比较 sources.text 与原先各数据源的正则清理函数
+
+默认按每个数据源的搜索页和第一条结果的详情页取样（建议配合本地模拟服务器），也可以传入保存好的页面文件:
+    BOOKFINDER_MOCK_URL=http://127.0.0.1:8800 python bench_text.py --sources all
+    python bench_text.py pages/*.html --repeat 50
+"""
+import argparse
+import json
+import re
+import time
+from typing import Callable, Dict, List
+
+from bs4 import BeautifulSoup
+
+from sources.registry import get_source, source_names
+from sources.utils import make_request, retry_on_failure
+from sources.text import normalize, normalize_many
+
+# ------------------------------------------------------------ 原先的实现（对照组）
+
+def legacy_utils(text: str) -> str:
+    """sources/utils.py 中原来的 clean_text"""
+    if not text:
+        return ""
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+def legacy_split(text: str) -> str:
+    """sources/utils.py 中原来的 clean_text_new"""
+    if not text:
+        return ""
+    return ' '.join(text.split())
+
+def legacy_google(text: str) -> str:
+    """Google 模块中原来的 clean_text"""
+    if not text:
+        return ''
+    text = text.replace('\n', ' ').replace('\r', ' ')
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\[.*?\]', '', text)
+    return text.strip()
+
+def legacy_amazon(text: str) -> str:
+    """亚马逊模块中原来的 clean_text"""
+    if not text:
+        return ''
+    text = re.sub(r'[\u200e\u200f\u202a\u202b\u202c\u202d\u202e]', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'^[:\s：‏‎]+|[:\s：‏‎]+$', '', text)
+    return text.strip()
+
+# ------------------------------------------------------------ 取样
+
+fetch = retry_on_failure()(make_request)
+
+def page_texts(content: bytes) -> List[str]:
+    """提取页面中的全部文本节点；JSON 响应取其中的全部字符串"""
+    stripped = content.lstrip()
+    if stripped[:1] in (b'{', b'['):
+        try:
+            strings: List[str] = []
+            collect_strings(json.loads(content), strings)
+            return strings
+        except ValueError:
+            pass
+    soup = BeautifulSoup(content, 'html.parser')
+    return [str(node) for node in soup.find_all(string=True)]
+
+def collect_strings(data, out: List[str]):
+    """递归收集 JSON 中的字符串"""
+    if isinstance(data, str):
+        out.append(data)
+    elif isinstance(data, dict):
+        for value in data.values():
+            collect_strings(value, out)
+    elif isinstance(data, list):
+        for value in data:
+            collect_strings(value, out)
+
+def sample_source(source: str, keyword: str) -> List[str]:
+    """取一个数据源的搜索页和第一条结果详情页的文本"""
+    module = get_source(source)
+    texts: List[str] = []
+    response = fetch(*module.build_search_request(keyword))
+    if response is None:
+        print(f"{source}: 搜索请求失败，跳过")
+        return texts
+    texts.extend(page_texts(response.content))
+    results = module.parse_search_results(response.content, response.encoding)
+    if results:
+        response = fetch(*module.build_details_request(results[0]['url']))
+        if response is not None:
+            texts.extend(page_texts(response.content))
+    return texts
+
+# ------------------------------------------------------------ 计时
+
+def bench(name: str, func: Callable[[List[str]], List[str]], texts: List[str], repeat: int) -> float:
+    """返回每秒处理的文本条数（取多轮中最快的一轮）"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(texts)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best if best else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description='文本规范化基准测试')
+    parser.add_argument('pages', nargs='*', help='保存好的页面文件（HTML 或 JSON），不传则从数据源取样')
+    parser.add_argument('--sources', default='all', help='逗号分隔的数据源代号，或 all')
+    parser.add_argument('--keyword', default='三体', help='取样使用的搜索关键词')
+    parser.add_argument('--repeat', type=int, default=20, help='每个函数运行的轮数')
+    args = parser.parse_args()
+
+    texts: List[str] = []
+    if args.pages:
+        for path in args.pages:
+            with open(path, 'rb') as f:
+                texts.extend(page_texts(f.read()))
+    else:
+        sources = source_names() if args.sources == 'all' else [s.strip() for s in args.sources.split(',')]
+        for source in sources:
+            texts.extend(sample_source(source, args.keyword))
+    if not texts:
+        print("没有取到页面文本")
+        return
+
+    total_chars = sum(len(text) for text in texts)
+    print(f"样本: {len(texts)} 条文本，{total_chars} 个字符，每个函数运行 {args.repeat} 轮")
+
+    candidates: Dict[str, Callable[[List[str]], List[str]]] = {
+        'utils.clean_text（原）': lambda items: [legacy_utils(t) for t in items],
+        'utils.clean_text_new（原）': lambda items: [legacy_split(t) for t in items],
+        'google.clean_text（原）': lambda items: [legacy_google(t) for t in items],
+        'amazon.clean_text（原）': lambda items: [legacy_amazon(t) for t in items],
+        'text.normalize': lambda items: [normalize(t) for t in items],
+        "text.normalize(strip=':：')": lambda items: [normalize(t, ':：') for t in items],
+        'text.normalize_many': normalize_many,
+    }
+    baseline = None
+    for name, func in candidates.items():
+        rate = bench(name, func, texts, args.repeat)
+        baseline = baseline or rate
+        print(f"{name:<32} {rate:>12,.0f} 条/秒  {rate * total_chars / len(texts) / 1e6:>8.1f} M字符/秒  "
+              f"{rate / baseline:>5.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+本地 ISBN 索引维护工具
+
+从 batch.py 的输出（或每行一条图书详情的 JSON Lines 文件）导入图书，查询、合并和查看索引:
+    python build_isbn_index.py build results.jsonl
+    python build_isbn_index.py lookup 9787536692930
+    python build_isbn_index.py merge
+    python build_isbn_index.py stats
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, Iterator, Tuple
+
+from sources.isbn_index import IsbnIndex
+from sources.settings import get_settings
+
+# 每批写入的图书数
+BATCH_SIZE = 5000
+
+def iter_books(path: str) -> Iterator[Tuple[Dict, str]]:
+    """
+    逐行读取图书详情
+
+    batch.py 的输出取其中的 details（没有时取 results），数据源取记录的 source 字段；
+    其他行按单条图书详情处理。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            source = record.get('source', '')
+            if 'query' in record:
+                for book in record.get('details') or record.get('results') or []:
+                    if book:
+                        yield book, source
+            else:
+                yield record, source
+
+def build(index: IsbnIndex, paths):
+    started = time.perf_counter()
+    total = added = 0
+    batch: Dict[str, list] = {}
+    for path in paths:
+        for book, source in iter_books(path):
+            total += 1
+            batch.setdefault(source, []).append(book)
+            if total % BATCH_SIZE == 0:
+                added += sum(index.add_many(books, source) for source, books in batch.items())
+                batch.clear()
+    added += sum(index.add_many(books, source) for source, books in batch.items())
+    index.merge()
+    print(f"读取 {total} 条图书，写入 {added} 条（其余没有有效 ISBN），"
+          f"耗时 {time.perf_counter() - started:.1f} 秒")
+
+def main():
+    parser = argparse.ArgumentParser(description='本地 ISBN 索引维护')
+    parser.add_argument('--dir', default=get_settings().isbn_index_dir, help='索引目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='从 JSON Lines 文件导入图书')
+    build_parser.add_argument('files', nargs='+')
+    lookup_parser = commands.add_parser('lookup', help='按 ISBN 查询')
+    lookup_parser.add_argument('isbn')
+    lookup_parser.add_argument('--source', default=None, help='只显示该数据源的记录')
+    commands.add_parser('merge', help='把未合并的条目并入有序索引')
+    commands.add_parser('stats', help='显示索引大小')
+    args = parser.parse_args()
+
+    index = IsbnIndex(args.dir)
+    if args.command == 'build':
+        build(index, args.files)
+    elif args.command == 'lookup':
+        records = index.lookup(args.isbn, args.source)
+        if not records:
+            print("索引中没有该 ISBN")
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False, indent=2))
+    elif args.command == 'merge':
+        index.merge()
+        print(f"已合并，共 {len(index)} 条")
+    elif args.command == 'stats':
+        print(f"索引目录: {args.dir}")
+        print(f"条目数: {len(index)}")
+        for path in (index.records_path, index.index_path, index.pending_path):
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            print(f"{os.path.basename(path)}: {size / 1024:.1f} KB")
+    index.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,11 @@
 """配置文件"""
 from typing import Dict
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 env_path = os.path.join(os.path.dirname(__file__), '.env')
-print(f"尝试加载环境变量文件: {env_path}")
 load_dotenv(env_path)
 
 # HTTP请求配置
@@ -27,45 +27,76 @@ HEADERS: Dict[str, str] = {
 }
 
 # URL配置
-DOUBAN_BASE_URL = 'https://book.douban.com'
+# 设置 BOOKFINDER_MOCK_URL（例如 http://127.0.0.1:8800）后，所有数据源默认指向本地模拟服务器；
+# 也可以通过同名环境变量单独覆盖每个地址
+MOCK_BASE_URL = os.getenv('BOOKFINDER_MOCK_URL', '').strip().rstrip('/')
+
+def normalize_imghost_url(url: str) -> str:
+    """补全协议、去掉末尾斜杠和 /api/v1 后缀"""
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    url = url.rstrip('/')
+    if '/api/v1' in url:
+        url = url.split('/api/v1')[0]
+    return url
+
+def _source_url(name: str, default: str, mock_path: str) -> str:
+    """读取数据源地址，优先使用环境变量，其次是模拟服务器地址"""
+    value = os.getenv(name, '').strip()
+    if value:
+        return value.rstrip('/')
+    if MOCK_BASE_URL:
+        return f"{MOCK_BASE_URL}{mock_path}"
+    return default
+
+DOUBAN_BASE_URL = _source_url('DOUBAN_BASE_URL', 'https://book.douban.com', '/douban')
 DOUBAN_SEARCH_URL = f'{DOUBAN_BASE_URL}/j/subject_suggest?q={{}}'
+DOUBAN_SUBJECT_SEARCH_URL = _source_url('DOUBAN_SUBJECT_SEARCH_URL', 'https://search.douban.com/book/subject_search', '/douban/search/book/subject_search')
+
+MEGBOOKHK_BASE_URL = _source_url('MEGBOOKHK_BASE_URL', 'http://www.megbook.hk', '/megbookhk')
+MEGBOOKHK_SEARCH_URL = _source_url('MEGBOOKHK_SEARCH_URL', 'http://search.megbook.hk/mall/search.jsp', '/megbookhk/mall/search.jsp')
+
+MEGBOOKTW_BASE_URL = _source_url('MEGBOOKTW_BASE_URL', 'http://www.megbook.com.tw', '/megbooktw')
+MEGBOOKTW_SEARCH_URL = _source_url('MEGBOOKTW_SEARCH_URL', 'http://search.megbook.com.tw/mall/search.jsp', '/megbooktw/mall/search.jsp')
+
+AMAZON_BASE_URL = _source_url('AMAZON_BASE_URL', 'https://www.amazon.com', '/amazon')
+
+GOOGLE_BOOKS_API = _source_url('GOOGLE_BOOKS_API', 'https://www.googleapis.com/books/v1/volumes', '/google/books/v1/volumes')
+GOOGLE_BOOKS_WEB = _source_url('GOOGLE_BOOKS_WEB', 'https://books.google.com/books', '/google/books')
+# Google Books 搜索的语言限制（ISO 639-1，留空表示不限制）
+GOOGLE_BOOKS_LANG = os.getenv('GOOGLE_BOOKS_LANG', 'zh').strip()
 
 # 图床配置
 IMGHOST_ENABLED = os.getenv('IMGHOST_ENABLED', 'false').lower() == 'true'
 IMGHOST_BASE_URL = os.getenv('IMGHOST_BASE_URL', '').strip()
-
-print("\n=== 图床配置信息 ===")
-print(f"IMGHOST_ENABLED: {IMGHOST_ENABLED}")
-print(f"原始 IMGHOST_BASE_URL: {IMGHOST_BASE_URL}")
+if not IMGHOST_BASE_URL and MOCK_BASE_URL:
+    IMGHOST_BASE_URL = f"{MOCK_BASE_URL}/imghost"
 
 # 确保 BASE_URL 格式正确
 if IMGHOST_ENABLED and IMGHOST_BASE_URL:
-    # 如果URL不以http://或https://开头，添加https://
-    if not IMGHOST_BASE_URL.startswith(('http://', 'https://')):
-        IMGHOST_BASE_URL = 'https://' + IMGHOST_BASE_URL
-        print(f"添加https://后: {IMGHOST_BASE_URL}")
-
-    # 移除末尾的斜杠
-    IMGHOST_BASE_URL = IMGHOST_BASE_URL.rstrip('/')
-    print(f"移除末尾斜杠后: {IMGHOST_BASE_URL}")
-
-    # 检查是否包含 /api/v1
-    if '/api/v1' in IMGHOST_BASE_URL:
-        base_parts = IMGHOST_BASE_URL.split('/api/v1')
-        IMGHOST_BASE_URL = base_parts[0]
-        print(f"移除 /api/v1 后: {IMGHOST_BASE_URL}")
+    IMGHOST_BASE_URL = normalize_imghost_url(IMGHOST_BASE_URL)
 
 # 构建API URLs
 IMGHOST_API_BASE = f"{IMGHOST_BASE_URL}/api/v1" if IMGHOST_BASE_URL else ""
 IMGHOST_UPLOAD_URL = f"{IMGHOST_API_BASE}/upload" if IMGHOST_API_BASE else ""
 
-print(f"IMGHOST_API_BASE: {IMGHOST_API_BASE}")
-print(f"IMGHOST_UPLOAD_URL: {IMGHOST_UPLOAD_URL}")
-print("=== 图床配置信息 ===\n")
+def print_imghost_config():
+    """打印图床配置，用于排查配置问题"""
+    print("\n=== 图床配置信息 ===")
+    print(f"环境变量文件: {env_path}")
+    print(f"IMGHOST_ENABLED: {IMGHOST_ENABLED}")
+    print(f"IMGHOST_BASE_URL: {IMGHOST_BASE_URL}")
+    print(f"IMGHOST_API_BASE: {IMGHOST_API_BASE}")
+    print(f"IMGHOST_UPLOAD_URL: {IMGHOST_UPLOAD_URL}")
+    print(f"IMGHOST_TOKEN_FILE: {IMGHOST_TOKEN_FILE}")
+    print("=== 图床配置信息 ===\n")
 
 IMGHOST_EMAIL = os.getenv('IMGHOST_EMAIL', '').strip()
 IMGHOST_PASSWORD = os.getenv('IMGHOST_PASSWORD', '').strip()
 
-# 请求配置
-REQUEST_TIMEOUT = 10  # 请求超时时间（秒）
-MAX_RETRIES = 3      # 最大重试次数
+# 图床token的保存位置；指向模拟服务器时默认放到临时目录，避免模拟登录返回的token覆盖真实凭据
+_default_token_file = (os.path.join(tempfile.gettempdir(), 'bookfinder-mock-token.json') if MOCK_BASE_URL
+                       else os.path.join(os.path.dirname(__file__), 'token.json'))
+IMGHOST_TOKEN_FILE = os.path.expanduser(os.getenv('IMGHOST_TOKEN_FILE', '').strip() or _default_token_file)
+
+# 超时、重试、连接池、并发和限流等性能参数，以及封面规范化和本地封面缓存的设置见 sources/settings.py
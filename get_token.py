@@ -2,9 +2,11 @@
 获取 Lsky Pro token 的命令行工具
 """
 from sources.image import get_lsky_token
+from config import print_imghost_config
 import getpass
 
 def main():
+    print_imghost_config()
     print("Lsky Pro 登录")
     print("-" * 20)
     email = input("请输入邮箱: ")
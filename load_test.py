@@ -0,0 +1,152 @@
+"""
+负载生成器：以 N 个并发用户驱动 搜索 -> 详情 -> 封面 流程，统计延迟分位数和吞吐量
+
+建议配合本地模拟服务器使用，避免对真实站点造成压力:
+    python mock_server.py --latency lognormal:80:0.5 &
+    BOOKFINDER_MOCK_URL=http://127.0.0.1:8800 python load_test.py --sources all --users 16 --iterations 20
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from sources.registry import get_source, source_names
+from sources.image import download_image, upload_local_image, sanitize_filename
+from sources.metrics import write_metrics
+from config import IMGHOST_ENABLED
+
+DEFAULT_KEYWORDS = ['三体', '活着', '围城', '水浒传', '三国演义', '白鹿原', '平凡的世界']
+
+class LoadStats:
+    """线程安全的延迟记录"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, elapsed: float, ok: bool = True):
+        with self._lock:
+            if ok:
+                self.samples.setdefault(stage, []).append(elapsed)
+            else:
+                self.failures[stage] = self.failures.get(stage, 0) + 1
+                self.samples.setdefault(stage, [])
+
+class KeywordFeed:
+    """多个用户线程共享的关键词循环"""
+
+    def __init__(self, keywords: List[str]):
+        self._cycle = itertools.cycle(keywords)
+        self._lock = threading.Lock()
+
+    def __next__(self) -> str:
+        with self._lock:
+            return next(self._cycle)
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def run_cover(book_info: Dict[str, str], temp_dir: str) -> bool:
+    """下载封面，启用图床时继续上传"""
+    path = os.path.join(temp_dir, f"{threading.get_ident()}_{sanitize_filename(book_info.get('title', 'cover'))}.jpg")
+    try:
+        if not download_image(book_info['cover_url'], path):
+            return False
+        if IMGHOST_ENABLED:
+            result = upload_local_image(path)
+            return bool(result and result.get('url'))
+        return True
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def user_loop(source: str, keywords, stats: LoadStats, args, stop_at: float, temp_dir: str):
+    """单个模拟用户：依次执行搜索、详情和封面处理"""
+    module = get_source(source)
+    for i in range(args.iterations):
+        if stop_at and time.monotonic() >= stop_at:
+            break
+        keyword = next(keywords)
+        started = time.perf_counter()
+
+        t0 = time.perf_counter()
+        results = module.search_books(keyword)
+        stats.record(f'{source}.search', time.perf_counter() - t0, bool(results))
+        if not results or args.search_only:
+            stats.record(f'{source}.total', time.perf_counter() - started, bool(results))
+            continue
+
+        t0 = time.perf_counter()
+        details = module.get_book_details(results[i % len(results)]['url'])
+        stats.record(f'{source}.detail', time.perf_counter() - t0, bool(details))
+
+        if details and args.cover and details.get('cover_url'):
+            t0 = time.perf_counter()
+            ok = run_cover(details, temp_dir)
+            stats.record(f'{source}.cover', time.perf_counter() - t0, ok)
+
+        stats.record(f'{source}.total', time.perf_counter() - started, bool(details))
+
+def print_report(stats: LoadStats, elapsed: float):
+    """打印各阶段的延迟分位数和吞吐量"""
+    header = f"{'阶段':<20}{'成功':>8}{'失败':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'吞吐(/s)':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for stage in sorted(stats.samples):
+        values = sorted(stats.samples[stage])
+        failed = stats.failures.get(stage, 0)
+        print(f"{stage:<20}{len(values):>8}{failed:>8}"
+              f"{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}"
+              f"{(len(values) + failed) / elapsed:>10.2f}")
+    print(f"\n总耗时: {elapsed:.2f} 秒")
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder 负载生成器')
+    parser.add_argument('--sources', default='all', help='逗号分隔的数据源代号，或 all')
+    parser.add_argument('--users', type=int, default=8, help='每个数据源的并发用户数')
+    parser.add_argument('--iterations', type=int, default=10, help='每个用户执行的查询次数')
+    parser.add_argument('--duration', type=float, default=0, help='最长运行时间（秒），0 表示不限')
+    parser.add_argument('--keywords', help='关键词文件，每行一个')
+    parser.add_argument('--cover', action='store_true', help='同时执行封面下载（及上传）')
+    parser.add_argument('--search-only', action='store_true', help='只执行搜索')
+    parser.add_argument('--metrics-out', help='导出分阶段指标的文件（.json 或 Prometheus 文本）')
+    args = parser.parse_args()
+
+    sources = source_names() if args.sources == 'all' else [s.strip() for s in args.sources.split(',') if s.strip()]
+    keywords = DEFAULT_KEYWORDS
+    if args.keywords:
+        with open(args.keywords, 'r', encoding='utf-8') as f:
+            keywords = [line.strip() for line in f if line.strip()]
+    feed = KeywordFeed(keywords)
+    stats = LoadStats()
+    stop_at = time.monotonic() + args.duration if args.duration else 0
+    print(f"数据源: {', '.join(sources)}，每源并发用户: {args.users}，每用户迭代: {args.iterations}")
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with ThreadPoolExecutor(max_workers=args.users * len(sources)) as executor:
+            futures = [
+                executor.submit(user_loop, source, feed, stats, args, stop_at, temp_dir)
+                for source in sources
+                for _ in range(args.users)
+            ]
+            for future in futures:
+                future.result()
+    print_report(stats, time.perf_counter() - started)
+    if args.metrics_out:
+        write_metrics(args.metrics_out)
+        print(f"指标已写入: {args.metrics_out}")
+
+if __name__ == '__main__':
+    main()
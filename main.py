@@ -1,16 +1,24 @@
 """主程序入口"""
 import os
-from sources.douban.search import search_books as douban_search, get_book_details as douban_details
-from sources.megbookhk.search import search_books as megbookhk_search, get_book_details as megbookhk_details
-from sources.megbooktw.search import search_books as megbooktw_search, get_book_details as megbooktw_details
-from sources.amazon.search import search_books as amazon_search, get_book_details as amazon_details
-from sources.google.search import search_books as google_search, get_book_details as google_details
-from sources.image import download_image, upload_local_image, sanitize_filename
+import argparse
+import itertools
+from sources.registry import get_source
+from sources.prewarm import prewarm
+from sources.image import upload_cover
+from sources.isbn_index import find_known_book, remember_book
+from sources.metrics import write_metrics
+from sources.deadline import deadline
+from sources.exceptions import DeadlineExceeded
+from sources.settings import get_settings
+from sources import profiling
 import tempfile
 import json
 import requests
 import config
-from typing import Dict
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 每次显示的搜索结果条数
+RESULTS_PER_PAGE = 10
 
 def select_search_source() -> str:
     """
@@ -103,6 +111,52 @@ def format_book_info(book: dict, detailed: bool = False) -> None:
             print("\n【封面图片】")
             print(book['cover_url'])
 
+def print_results(books: List[dict], start: int = 1) -> None:
+    """按序号显示搜索结果"""
+    for i, book in enumerate(books, start):
+        print(f"\n{i}. ", end='')
+        format_book_info(book)
+
+def next_results(books: Iterator[dict]) -> List[dict]:
+    """从结果迭代器中取下一页，只在需要时才请求数据源的下一页"""
+    return list(itertools.islice(books, RESULTS_PER_PAGE))
+
+def lookup(func: Callable, *args):
+    """
+    在 lookup_deadline 的时间预算内执行一次查询
+
+    查询期间按 Ctrl-C 只取消这一次查询并回到菜单，不退出程序。
+
+    Returns:
+        查询结果，超时或被取消时返回 None
+    """
+    with deadline(get_settings().lookup_deadline) as d:
+        try:
+            return func(*args)
+        except KeyboardInterrupt:
+            d.cancel()
+            print("\n已取消本次查询")
+        except DeadlineExceeded as e:
+            print(f"\n{e}")
+    return None
+
+def fetch_book(get_details: Callable, url: str, source: str) -> Optional[dict]:
+    """获取详情并处理封面，两者共用一次查询的时间预算"""
+    book_info = get_details(url)
+    if not book_info:
+        return None
+    # 处理封面图片
+    try:
+        book_info = process_book_cover(book_info)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print(f"处理封面时出错: {str(e)}")
+        # 即使封面处理失败，也继续显示其他信息
+    # 记入本地 ISBN 索引，之后按 ISBN 搜索这本书时不再访问网络
+    remember_book(book_info, source)
+    return book_info
+
 def process_book_cover(book_info: dict) -> dict:
     """处理图书封面：下载并上传到图床"""
     if not book_info.get('cover_url'):
@@ -111,18 +165,15 @@ def process_book_cover(book_info: dict) -> dict:
     # 创建临时目录
     with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            # 下载封面
-            filename = sanitize_filename(book_info['title']) + "_cover.jpg"
-            cover_path = os.path.join(temp_dir, filename)
-            
-            if download_image(book_info['cover_url'], cover_path):
-                # 上传到图床
-                upload_result = upload_local_image(cover_path)
-                if upload_result and upload_result.get('url'):
-                    book_info['cover_url'] = upload_result['url']
-                    print(f"封面已上传到: {book_info['cover_url']}")
-                else:
-                    print("上传封面失败")
+            # 下载并上传到图床（命中本地封面缓存时跳过）
+            hosted_url = upload_cover(book_info['cover_url'], book_info['title'], temp_dir)
+            if hosted_url:
+                book_info['cover_url'] = hosted_url
+                print(f"封面已上传到: {book_info['cover_url']}")
+            else:
+                print("上传封面失败")
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             print(f"处理封面时出错: {str(e)}")
     
@@ -135,50 +186,57 @@ def main():
         source = select_search_source()
         if not source:
             break
+
+        # 用户输入关键词期间在后台导入数据源、预热解析器并预先建立连接
+        prewarm([source])
             
         # 获取搜索关键词
         keyword = input("\n请输入搜索关键词: ").strip()
         if not keyword:
             continue
             
+        # 关键词是本地索引中已知的 ISBN 时直接显示详情
+        known = find_known_book(keyword, source)
+        if known:
+            print(f"\n本地索引中已有 ISBN {keyword}，无需联网")
+            format_book_info(known, detailed=True)
+            return known
+
         print(f"\n正在搜索 {keyword}...")
         
-        # 根据选择的源进行搜索
-        if source == "douban":
-            search_results = douban_search(keyword)
-            get_details = douban_details
-        elif source == "megbookhk":
-            search_results = megbookhk_search(keyword)
-            get_details = megbookhk_details
-        elif source == "megbooktw":
-            search_results = megbooktw_search(keyword)
-            get_details = megbooktw_details
-        elif source == "amazon":
-            search_results = amazon_search(keyword)
-            get_details = amazon_details
-        elif source == "google":
-            search_results = google_search(keyword)
-            get_details = google_details
-        else:
+        # 根据选择的源进行搜索（数据源模块按需导入）
+        try:
+            module = get_source(source)
+        except KeyError:
             print("暂不支持该搜索源")
             continue
+        books = module.iter_books(keyword)
+        get_details = module.get_book_details
             
+        search_results = lookup(next_results, books)
         if not search_results:
             print("未找到相关图书")
             continue
             
         # 显示搜索结果
         print("\n搜索结果:")
-        for i, book in enumerate(search_results, 1):
-            print(f"\n{i}. ", end='')
-            format_book_info(book)
+        print_results(search_results)
                 
         # 获取用户选择
         while True:
-            choice = input("\n请选择图书序号（输入 'b' 返回搜索）: ").strip()
+            choice = input("\n请选择图书序号（输入 'm' 加载更多，'b' 返回搜索）: ").strip()
             
             if choice.lower() == 'b':
                 break
+
+            if choice.lower() == 'm':
+                more_results = lookup(next_results, books)
+                if not more_results:
+                    print("没有更多结果了")
+                    continue
+                print_results(more_results, len(search_results) + 1)
+                search_results.extend(more_results)
+                continue
                 
             try:
                 index = int(choice)
@@ -186,18 +244,11 @@ def main():
                     book = search_results[index - 1]
                     
                     print(f"\n获取《{book['title']}》的详细信息...")
-                    book_info = get_details(book['url'])
+                    book_info = lookup(fetch_book, get_details, book['url'], source)
                     
                     if not book_info:
                         print("无法获取图书详细信息，请尝试其他图书")
                         continue
-                    
-                    # 处理封面图片
-                    try:
-                        book_info = process_book_cover(book_info)
-                    except Exception as e:
-                        print(f"处理封面时出错: {str(e)}")
-                        # 即使封面处理失败，也继续显示其他信息
 
                     # 显示图书详情
                     format_book_info(book_info, detailed=True)
@@ -208,7 +259,26 @@ def main():
             except ValueError:
                 print("请输入有效的数字！")
 
+def parse_args() -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='BookFinder 多源图书搜索')
+    parser.add_argument('--profile', action='store_true',
+                        help='剖析搜索/详情/封面操作，输出 pstats 和火焰图折叠栈')
+    parser.add_argument('--profile-scope', default=None,
+                        help='剖析范围，例如 douban、douban:search、cover（逗号分隔）')
+    parser.add_argument('--profile-dir', default=None, help='剖析结果输出目录（默认 profiles）')
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    book = main()
-    if book:
-        print(f"\n已选择《{book['title']}》")
+    args = parse_args()
+    if args.profile:
+        profiling.configure(True, args.profile_scope, args.profile_dir)
+    try:
+        book = main()
+        if book:
+            print(f"\n已选择《{book['title']}》")
+    finally:
+        # 设置 BOOKFINDER_METRICS_FILE 时导出本次运行的指标（.json 或 Prometheus 文本）
+        metrics_file = os.getenv('BOOKFINDER_METRICS_FILE')
+        if metrics_file:
+            write_metrics(metrics_file)
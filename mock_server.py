@@ -0,0 +1,874 @@
+"""
+本地模拟服务器：在本机模拟所有数据源和图床，用于并发与吞吐测试
+
+页面结构按各站点真实页面的标记录制整理，书目数据来自 mock_data/catalog.json。
+启动后设置环境变量 BOOKFINDER_MOCK_URL=http://127.0.0.1:8800 即可让所有数据源指向本服务器。
+
+用法:
+    python mock_server.py --port 8800 --latency lognormal:80:0.5 --error-rate 0.02
+    python mock_server.py --block-rate 0.1       # 按数据源返回验证码/封禁页
+    python mock_server.py --price-drift 0.3      # 书店和亚马逊详情页的售价随机变动（测试关注列表刷新）
+    python mock_server.py --config mock_profile.json
+
+配置文件格式（按数据源覆盖默认行为）:
+    {"amazon": {"latency": "lognormal:300:0.6", "error_rate": 0.05, "rate_limit": 5, "burst": 5, "block_rate": 0.1}}
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse, quote
+
+MOCK_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_data')
+ID_BASE = 1000001           # 模拟图书编号起点
+TOTAL_RESULTS = 60          # 每次搜索可翻页得到的结果总数
+PAGE_SIZE = 10              # 书店类数据源每页结果数
+
+with open(os.path.join(MOCK_DATA_DIR, 'catalog.json'), 'r', encoding='utf-8') as f:
+    CATALOG: List[Dict[str, str]] = json.load(f)
+
+with open(os.path.join(MOCK_DATA_DIR, 'cover.jpg'), 'rb') as f:
+    COVER_BYTES = f.read()
+
+def parse_latency(spec: str):
+    """
+    解析延迟分布描述，返回一个采样函数（单位：秒）
+
+    支持: fixed:MS, uniform:LO:HI, normal:MEAN:SD, lognormal:MEDIAN:SIGMA, exp:MEAN
+    """
+    parts = spec.split(':')
+    kind = parts[0]
+    args = [float(x) for x in parts[1:]]
+    if kind == 'fixed':
+        return lambda: args[0] / 1000
+    if kind == 'uniform':
+        return lambda: random.uniform(args[0], args[1]) / 1000
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(args[0], args[1])) / 1000
+    if kind == 'lognormal':
+        mu = math.log(args[0])
+        return lambda: random.lognormvariate(mu, args[1]) / 1000
+    if kind == 'exp':
+        return lambda: random.expovariate(1 / args[0]) / 1000
+    raise ValueError(f"无法识别的延迟分布: {spec}")
+
+class Behaviour:
+    """单个数据源的模拟行为：延迟、错误率、封禁率和限流"""
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0,
+                 rate_limit: float = 0.0, burst: Optional[float] = None, block_rate: float = 0.0):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(rate_limit, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """令牌桶限流，rate_limit 为 0 时不限流"""
+        if not self.rate_limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+def book_at(index: int) -> Dict[str, str]:
+    """按结果序号生成模拟图书，超出目录长度的部分作为分卷"""
+    base = CATALOG[index % len(CATALOG)]
+    book = dict(base)
+    book['id'] = str(ID_BASE + index)
+    volume = index // len(CATALOG)
+    if volume:
+        book['title'] = f"{base['title']}（第{volume + 1}卷）"
+    return book
+
+def book_by_id(book_id: str) -> Optional[Dict[str, str]]:
+    """按模拟编号查找图书"""
+    digits = re.sub(r'\D', '', book_id)
+    if not digits:
+        return None
+    index = int(digits) - ID_BASE
+    if index < 0 or index >= TOTAL_RESULTS:
+        return None
+    return book_at(index)
+
+def result_page(start: int, count: int) -> List[Dict[str, str]]:
+    """返回从 start 开始的 count 条结果"""
+    return [book_at(i) for i in range(start, min(start + count, TOTAL_RESULTS))]
+
+def escape(text: str) -> str:
+    """HTML 转义"""
+    return (text.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;'))
+
+# ---------------------------------------------------------------- 豆瓣
+
+DOUBAN_SUBJECT_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN" class="ua-linux">
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8">
+<title>{title} (豆瓣)</title>
+<meta property="og:title" content="{title}" />
+<meta property="og:description" content="{description}" />
+<meta property="og:type" content="book" />
+<meta property="og:url" content="{url}" />
+<meta property="og:image" content="{cover}" />
+<meta property="book:author" content="{author}" />
+<meta property="book:isbn" content="{isbn}" />
+<script type="application/ld+json">
+{{
+  "@context":"http://schema.org",
+  "@type":"Book",
+  "workExample": [],
+  "name" : "{title}",
+  "author": [{{"@type": "Person", "name": "{author}"}}],
+  "url" : "{url}",
+  "isbn" : "{isbn}",
+  "sameAs": "{url}"
+}}
+</script>
+</head>
+<body>
+<div id="db-global-nav" class="global-nav"><div class="bd"><div class="top-nav-info"><a href="#" class="nav-login">登录/注册</a></div></div></div>
+<div id="wrapper">
+<h1>
+    <span property="v:itemreviewed">{title}</span>
+    <div class="clear"></div>
+</h1>
+<div id="content">
+<div class="grid-16-8 clearfix">
+<div class="article">
+<div class="indent">
+<div class="subjectwrap clearfix">
+<div class="subject clearfix">
+<div id="mainpic" class="">
+  <a class="nbg" href="{cover}" title="{title}">
+    <img src="{cover}" title="点击看更多图片" alt="{title}" rel="v:photo" style="max-width: 135px;max-height: 200px;">
+  </a>
+</div>
+<div id="info" class="">
+    <span>
+      <span class="pl"> 作者</span>:
+        <a class="" href="/search/{author_q}">{author}</a>
+    </span><br/>
+    <span class="pl">出版社:</span>
+      <a href="/press/{isbn}">{press}</a>
+    <br>
+    <span class="pl">出版年:</span> {year}<br/>
+    <span class="pl">页数:</span> {pages}<br/>
+    <span class="pl">定价:</span> {price}元<br/>
+    <span class="pl">装帧:</span> 平装<br/>
+    <span class="pl">ISBN:</span> {isbn}<br/>
+</div>
+</div>
+<div id="interest_sectl"><div class="rating_wrap clearbox"><strong class="ll rating_num" property="v:average"> 8.8 </strong></div></div>
+</div>
+</div>
+<div class="related_info">
+  <h2>
+    <span class="">内容简介</span>
+    &nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;
+  </h2>
+  <div class="indent" id="link-report">
+    <div class="">
+      <div class="intro">
+        <p>{description}</p>
+      </div>
+    </div>
+  </div>
+  <h2>
+    <span class="">作者简介</span>
+    &nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;&nbsp;&middot;
+  </h2>
+  <div class="indent ">
+    <div class="">
+      <div class="intro">
+        <p>{author_intro}</p>
+      </div>
+    </div>
+  </div>
+  <h2><span class="">目录</span></h2>
+  <div class="indent" id="dir_{id}_short">第一部分<br/>第二部分<br/></div>
+</div>
+</div>
+<div class="aside"><div class="gray_ad"><h2>在哪儿买这本书</h2></div></div>
+</div>
+</div>
+</div>
+</body>
+</html>
+"""
+
+def douban_suggest(handler, query):
+    origin = handler.origin
+    items = []
+    for book in result_page(0, PAGE_SIZE):
+        items.append({
+            'title': book['title'],
+            'url': f"{origin}/douban/subject/{book['id']}/",
+            'pic': f"{origin}/covers/{book['id']}.jpg",
+            'author_name': book['author'],
+            'year': book['year'][:4],
+            'type': 'b',
+            'id': book['id'],
+        })
+    return json_response(items)
+
+DOUBAN_SEARCH_PAGE_SIZE = 15    # 豆瓣完整搜索页每页条数
+
+DOUBAN_SEARCH_TEMPLATE = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>{keyword} - 读书 - 豆瓣搜索</title>
+</head>
+<body>
+<div id="root"></div>
+<script type="text/javascript">
+window.__DATA__ = {data};
+</script>
+</body>
+</html>
+"""
+
+def douban_search_page(handler, query):
+    """完整搜索页：结果以 JSON 内嵌在 window.__DATA__ 中，首页带一条作者条目"""
+    origin = handler.origin
+    start = max(0, int(query.get('start', ['0'])[0] or 0))
+    keyword = query.get('search_text', [''])[0]
+    items = []
+    if start == 0:
+        items.append({'tpl_name': 'search_common', 'title': f"{keyword}（作者）",
+                      'url': f"{origin}/douban/author/1/", 'abstract': ''})
+    for book in result_page(start, DOUBAN_SEARCH_PAGE_SIZE):
+        items.append({
+            'tpl_name': 'search_subject',
+            'id': int(book['id']),
+            'title': book['title'],
+            'url': f"{origin}/douban/subject/{book['id']}/",
+            'cover_url': f"{origin}/covers/{book['id']}.jpg",
+            'abstract': f"{book['author']} / {book['press']} / {book['year']} / {book['price']}元",
+        })
+    data = {'count': DOUBAN_SEARCH_PAGE_SIZE, 'items': items, 'start': start,
+            'text': keyword, 'total': TOTAL_RESULTS}
+    html = DOUBAN_SEARCH_TEMPLATE.format(keyword=escape(keyword), data=json.dumps(data, ensure_ascii=False))
+    return 200, {'Content-Type': 'text/html; charset=utf-8'}, html.encode('utf-8')
+
+def douban_subject(handler, query, book_id):
+    book = book_by_id(book_id)
+    if not book:
+        return 404, {'Content-Type': 'text/html; charset=utf-8'}, b'<html><body>404</body></html>'
+    origin = handler.origin
+    fields = {k: escape(v) for k, v in book.items()}
+    html = DOUBAN_SUBJECT_TEMPLATE.format(
+        url=f"{origin}/douban/subject/{book['id']}/",
+        cover=f"{origin}/covers/{book['id']}.jpg",
+        author_q=quote(book['author']),
+        **fields,
+    )
+    return 200, {'Content-Type': 'text/html; charset=utf-8'}, html.encode('utf-8')
+
+# ---------------------------------------------------------------- 美国书店
+
+MEGBOOK_SITES = {
+    'megbookhk': {'charset': 'gb18030', 'currency': 'HK'},
+    'megbooktw': {'charset': 'big5', 'currency': 'NT'},
+}
+
+MEGBOOK_SEARCH_ITEM = """
+      <table width="100%" border="0" cellspacing="0" cellpadding="4" class="list">
+        <tr>
+          <td width="90" valign="top"><a href="{base}/mall/detail.jsp?proID={id}"><img src="/covers/{id}.jpg" width="80" border="0"></a></td>
+          <td valign="top" class="desc">
+            <a href="{base}/mall/detail.jsp?proID={id}">{title}</a>『簡體書』<br>
+            作者：{author} 出版：{press} 日期：{date} 『簡體書』<br>
+            售價：{currency}$ {price}
+          </td>
+        </tr>
+      </table>"""
+
+MEGBOOK_SEARCH_TEMPLATE = """<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset={charset}">
+<title>搜尋結果 - 美國書店</title>
+</head>
+<body>
+<table width="980" border="0" align="center" cellpadding="0" cellspacing="0">
+  <tr><td>
+    <table width="100%" border="0"><tr><td class="nav">首頁 &gt; 搜尋結果 &gt; {keyword}</td></tr></table>
+    <table width="100%" border="0"><tr>
+      <td width="180" valign="top">
+        <table width="100%"><tr><td>分類瀏覽</td></tr><tr><td>文學</td></tr><tr><td>小說</td></tr></table>
+      </td>
+      <td valign="top">
+{items}
+        <table width="100%"><tr><td class="pager">第 {page} 頁，共 {pages} 頁</td></tr></table>
+      </td>
+    </tr></table>
+  </td></tr>
+</table>
+<table width="980" align="center"><tr><td>書城介紹 | 聯絡方式 | 送貨方式 | 付款方式 Copyright megBook</td></tr></table>
+</body>
+</html>
+"""
+
+MEGBOOK_DETAIL_TEMPLATE = """<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset={charset}">
+<title>{title} - 美國書店</title>
+</head>
+<body>
+<table width="980" border="0" align="center" cellpadding="0" cellspacing="0">
+  <tr><td>
+    <table width="100%"><tr><td class="nav">首頁 &gt; 簡體書 &gt; 文學</td></tr></table>
+    <table width="100%"><tr><td class="desc">『簡體書』{title} 書城自編碼: {id}</td></tr></table>
+    <table width="100%"><tr>
+      <td width="220" valign="top"><img src="/covers/{id}.jpg" alt="封面" width="200"></td>
+      <td valign="top">
+        作者：{author}<br>
+        出版社：{press}<br>
+        出版日期：{date}<br>
+        ISBN：{isbn}<br>
+        頁數：{pages}<br>
+        售價：&nbsp;{currency}$ {price}<br>
+      </td>
+    </tr></table>
+    <table width="100%"><tr><td>
+      【内容简介】 {description}<br><br>
+      【作者简介】 {author_intro}<br>
+    </td></tr></table>
+  </td></tr>
+</table>
+<table width="980" align="center"><tr><td>書城介紹 | 聯絡方式 | 送貨方式 | 付款方式 Copyright megBook</td></tr></table>
+</body>
+</html>
+"""
+
+def megbook_encode(site: str, html: str) -> Tuple[int, Dict[str, str], bytes]:
+    """按站点字符集编码页面，不发送 Content-Type 以模拟不可靠的响应头"""
+    charset = MEGBOOK_SITES[site]['charset']
+    return 200, {}, html.encode(charset, errors='xmlcharrefreplace')
+
+def megbook_search(handler, query, site):
+    page = max(1, int(query.get('page', ['1'])[0] or 1))
+    base = f"{handler.origin}/{site}"
+    items = []
+    for book in result_page((page - 1) * PAGE_SIZE, PAGE_SIZE):
+        fields = {k: escape(v) for k, v in book.items()}
+        fields['date'] = book['year'].replace('-', '/') + '/01'
+        items.append(MEGBOOK_SEARCH_ITEM.format(base=base, currency=MEGBOOK_SITES[site]['currency'], **fields))
+    html = MEGBOOK_SEARCH_TEMPLATE.format(
+        charset=MEGBOOK_SITES[site]['charset'],
+        keyword=escape(query.get('keywords', [''])[0]),
+        items=''.join(items),
+        page=page,
+        pages=math.ceil(TOTAL_RESULTS / PAGE_SIZE),
+    )
+    return megbook_encode(site, html)
+
+def megbook_detail(handler, query, site):
+    book = book_by_id(query.get('proID', [''])[0])
+    if not book:
+        return 404, {}, b'<html><body>404</body></html>'
+    fields = {k: escape(v) for k, v in book.items()}
+    fields['price'] = handler.server.current_price(book)
+    html = MEGBOOK_DETAIL_TEMPLATE.format(
+        charset=MEGBOOK_SITES[site]['charset'],
+        currency=MEGBOOK_SITES[site]['currency'],
+        date=book['year'],
+        **fields,
+    )
+    return megbook_encode(site, html)
+
+# ---------------------------------------------------------------- 亚马逊
+
+AMAZON_SEARCH_ITEM = """
+<div data-asin="{asin}" data-index="{index}" data-component-type="s-search-result" class="s-result-item s-asin">
+  <div class="sg-col-inner">
+    <div class="s-product-image-container">
+      <img class="s-image" src="{origin}/covers/{id}.jpg?w=218" alt="{title}">
+    </div>
+    <div class="a-section">
+      <h2 class="a-size-mini a-spacing-none a-color-base s-line-clamp-2">
+        <a class="a-link-normal s-underline-text s-link-style a-text-normal" href="/dp/{asin}"><span class="a-size-medium a-color-base a-text-normal">{title}</span></a>
+      </h2>
+      <div class="a-row"><span class="a-size-base">作者: {author}</span></div>
+      <div class="a-row a-size-base a-color-secondary"><span>出版社: {press} ({date})</span></div>
+    </div>
+  </div>
+</div>"""
+
+AMAZON_SEARCH_TEMPLATE = """<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8"><title>Amazon.com : {keyword}</title></head>
+<body>
+<div id="search">
+<div class="s-main-slot s-result-list s-search-results sg-row">
+{items}
+</div>
+<span class="s-pagination-strip"><span class="s-pagination-item s-pagination-selected">{page}</span></span>
+</div>
+</body>
+</html>
+"""
+
+AMAZON_DETAIL_TEMPLATE = """<!doctype html>
+<html lang="zh-CN">
+<head><meta charset="utf-8"><title>{title}: {author}: Amazon.com: Books</title></head>
+<body>
+<div id="dp-container">
+  <div id="imageBlock">
+    <img id="imgBlkFront" src="{origin}/covers/{id}.jpg?w=300" data-a-dynamic-image='{{"{origin}/covers/{id}.jpg?w=300":[300,450],"{origin}/covers/{id}.jpg?w=600":[600,900]}}'>
+  </div>
+  <div id="centerCol">
+    <h1 id="title"><span id="productTitle" class="a-size-extra-large">{title}</span></h1>
+    <div id="bylineInfo" class="a-section a-spacing-micro bylineHidden feature">
+      <span class="author notFaded" data-width=""><a class="a-link-normal" href="/s?field-author={author}">{author}</a>
+      <span class="contribution"><span class="a-color-secondary">(作者)</span></span></span>
+    </div>
+    <div id="corePrice_feature_div"><span class="a-price"><span class="a-offscreen">US${price}</span></span></div>
+    <div id="availability" class="a-section a-spacing-base"><span class="a-size-medium a-color-success">现在有货。</span></div>
+    <div id="bookDescription_feature_div" data-feature-name="bookDescription">
+      <div class="a-expander-content a-expander-partial-collapse-content"><span>{description}</span></div>
+    </div>
+  </div>
+  <div id="detailBullets_feature_div">
+    <ul class="a-unordered-list a-nostyle a-vertical a-spacing-none detail-bullet-list">
+      <li><span class="a-list-item"><span class="a-text-bold">出版社 &rlm; : &lrm;</span> <span>{press}; 第1版 ({date})</span></span></li>
+      <li><span class="a-list-item"><span class="a-text-bold">语言 &rlm; : &lrm;</span> <span>中文</span></span></li>
+      <li><span class="a-list-item"><span class="a-text-bold">平装 &rlm; : &lrm;</span> <span>{pages}页</span></span></li>
+      <li><span class="a-list-item"><span class="a-text-bold">ISBN-13 &rlm; : &lrm;</span> <span>{isbn_dash}</span></span></li>
+    </ul>
+  </div>
+</div>
+</body>
+</html>
+"""
+
+def amazon_date(year: str) -> str:
+    """模拟亚马逊中文站日期格式"""
+    y, m = year.split('-')
+    return f"{y}年{int(m)}月1日"
+
+def amazon_search(handler, query):
+    page = max(1, int(query.get('page', ['1'])[0] or 1))
+    items = []
+    for i, book in enumerate(result_page((page - 1) * PAGE_SIZE, PAGE_SIZE)):
+        fields = {k: escape(v) for k, v in book.items()}
+        items.append(AMAZON_SEARCH_ITEM.format(
+            origin=handler.origin, asin=f"B{book['id']}", index=i,
+            date=amazon_date(book['year']), **fields))
+    html = AMAZON_SEARCH_TEMPLATE.format(
+        keyword=escape(query.get('k', [''])[0]), items=''.join(items), page=page)
+    return 200, {'Content-Type': 'text/html;charset=UTF-8'}, html.encode('utf-8')
+
+def amazon_detail(handler, query, asin):
+    book = book_by_id(asin)
+    if not book:
+        return 404, {'Content-Type': 'text/html;charset=UTF-8'}, b'<html><body>404</body></html>'
+    fields = {k: escape(v) for k, v in book.items()}
+    fields['price'] = handler.server.current_price(book)
+    html = AMAZON_DETAIL_TEMPLATE.format(
+        origin=handler.origin, date=amazon_date(book['year']),
+        isbn_dash=f"{book['isbn'][:3]}-{book['isbn'][3:]}", **fields)
+    return 200, {'Content-Type': 'text/html;charset=UTF-8'}, html.encode('utf-8')
+
+# ---------------------------------------------------------------- Google Books
+
+def google_volume(handler, book: Dict[str, str]) -> Dict:
+    """生成 Google Books API 的完整 volume 对象"""
+    index = int(book['id']) - ID_BASE
+    info = {
+        'title': book['title'],
+        'authors': [book['author']],
+        'publisher': book['press'],
+        'publishedDate': book['year'],
+        'industryIdentifiers': [
+            {'type': 'ISBN_10', 'identifier': book['isbn'][3:12] + 'X'},
+            {'type': 'ISBN_13', 'identifier': book['isbn']},
+        ],
+        'readingModes': {'text': False, 'image': False},
+        'pageCount': int(book['pages']),
+        'printType': 'BOOK',
+        'categories': ['Fiction'],
+        'maturityRating': 'NOT_MATURE',
+        'allowAnonLogging': False,
+        'contentVersion': '0.1.0.0.preview.0',
+        'language': book['language'],
+        'previewLink': f"{handler.origin}/google/books?id=gb{book['id']}&hl=&source=gbs_api",
+        'infoLink': f"{handler.origin}/google/books?id=gb{book['id']}&hl=&source=gbs_api",
+        'canonicalVolumeLink': f"{handler.origin}/google/books/about/?id=gb{book['id']}",
+    }
+    # 每三本书中有一本缺少简介和封面，需要网页版补充
+    if index % 3 != 2:
+        info['description'] = book['description']
+        info['imageLinks'] = {
+            'smallThumbnail': f"{handler.origin}/google/books/content?id=gb{book['id']}&printsec=frontcover&img=1&zoom=5&source=gbs_api",
+            'thumbnail': f"{handler.origin}/google/books/content?id=gb{book['id']}&printsec=frontcover&img=1&zoom=1&source=gbs_api",
+        }
+    return {
+        'kind': 'books#volume',
+        'id': f"gb{book['id']}",
+        'etag': hashlib.md5(book['id'].encode()).hexdigest()[:11],
+        'selfLink': f"{handler.origin}/google/books/v1/volumes/gb{book['id']}",
+        'volumeInfo': info,
+        'saleInfo': {'country': 'US', 'saleability': 'NOT_FOR_SALE', 'isEbook': False},
+        'accessInfo': {'country': 'US', 'viewability': 'NO_PAGES', 'embeddable': False,
+                       'publicDomain': False, 'textToSpeechPermission': 'ALLOWED',
+                       'epub': {'isAvailable': False}, 'pdf': {'isAvailable': False},
+                       'accessViewStatus': 'NONE', 'quoteSharingAllowed': False},
+        'searchInfo': {'textSnippet': escape(book['description'][:60])},
+    }
+
+# projection=lite 时保留的 volumeInfo 字段
+GOOGLE_LITE_FIELDS = ('title', 'authors', 'publisher', 'publishedDate', 'description',
+                      'industryIdentifiers', 'pageCount', 'printType', 'imageLinks', 'language',
+                      'previewLink', 'infoLink', 'canonicalVolumeLink')
+
+FIELD_NAME_PATTERN = re.compile(r'\w+')
+
+def parse_fields(spec: str) -> Dict:
+    """
+    解析 Google API 的 fields 参数，例如 totalItems,items(id,volumeInfo(title,authors))
+
+    Returns:
+        字段树，叶子为 None 表示保留整个字段
+    """
+    tree, pos = _parse_field_list(spec, 0)
+    if pos != len(spec):
+        raise ValueError(f"无效的 fields 参数: {spec}")
+    return tree
+
+def _parse_field_list(spec: str, pos: int) -> Tuple[Dict, int]:
+    tree = {}
+    while pos < len(spec):
+        match = FIELD_NAME_PATTERN.match(spec, pos)
+        if not match:
+            raise ValueError(f"无效的 fields 参数: {spec}")
+        pos = match.end()
+        sub = None
+        if pos < len(spec) and spec[pos] == '(':
+            sub, pos = _parse_field_list(spec, pos + 1)
+            if pos >= len(spec) or spec[pos] != ')':
+                raise ValueError(f"无效的 fields 参数: {spec}")
+            pos += 1
+        tree[match.group(0)] = sub
+        if pos < len(spec) and spec[pos] == ',':
+            pos += 1
+        elif pos < len(spec) and spec[pos] == ')':
+            break
+    return tree, pos
+
+def apply_fields(data, tree: Optional[Dict]):
+    """按字段树裁剪响应（partial response）"""
+    if tree is None:
+        return data
+    if isinstance(data, list):
+        return [apply_fields(item, tree) for item in data]
+    if isinstance(data, dict):
+        return {key: apply_fields(data[key], sub) for key, sub in tree.items() if key in data}
+    return data
+
+def google_project(handler, query, volume: Dict) -> Dict:
+    """按 projection=lite 精简 volume 对象"""
+    if query.get('projection', ['full'])[0] != 'lite':
+        return volume
+    info = volume['volumeInfo']
+    volume = {k: v for k, v in volume.items() if k not in ('saleInfo', 'searchInfo')}
+    volume['volumeInfo'] = {k: info[k] for k in GOOGLE_LITE_FIELDS if k in info}
+    return volume
+
+def google_response(query, data: Dict):
+    """应用 fields 参数后返回 JSON，参数无效时与真实接口一样返回 400"""
+    spec = query.get('fields', [''])[0]
+    if spec:
+        try:
+            data = apply_fields(data, parse_fields(spec))
+        except ValueError as e:
+            return json_response({'error': {'code': 400, 'message': str(e)}}, status=400)
+    return json_response(data)
+
+def google_search(handler, query):
+    start = int(query.get('startIndex', ['0'])[0] or 0)
+    count = min(40, int(query.get('maxResults', ['10'])[0] or 10))
+    lang = query.get('langRestrict', [''])[0]
+    indexes = range(TOTAL_RESULTS)
+    if lang:
+        indexes = [i for i in indexes if book_at(i)['language'].startswith(lang)]
+    books = [book_at(i) for i in list(indexes)[start:start + count]]
+    data = {'kind': 'books#volumes', 'totalItems': len(indexes)}
+    if books:
+        data['items'] = [google_project(handler, query, google_volume(handler, book)) for book in books]
+    return google_response(query, data)
+
+def google_detail(handler, query, volume_id):
+    book = book_by_id(volume_id)
+    if not book:
+        return json_response({'error': {'code': 404, 'message': 'The volume ID could not be found.'}}, status=404)
+    return google_response(query, google_project(handler, query, google_volume(handler, book)))
+
+def google_web(handler, query):
+    book = book_by_id(query.get('id', [''])[0])
+    if not book:
+        return 404, {'Content-Type': 'text/html; charset=UTF-8'}, b'<html><body>404</body></html>'
+    cover = f"{handler.origin}/google/books/content?id=gb{book['id']}&printsec=frontcover&img=1&zoom=1&edge=curl"
+    html = (
+        '<!DOCTYPE html><html><head><meta charset="UTF-8"><title>{title} - Google 图书</title></head><body>'
+        '<div id="summary_content_table"><img id="summary-frontcover" src="{cover}" alt="{title}"></div>'
+        '<div id="synopsis"><div id="synopsistext" dir="ltr" class="sa">{description}</div></div>'
+        '</body></html>'
+    ).format(cover=escape(cover), title=escape(book['title']), description=escape(book['description']))
+    return 200, {'Content-Type': 'text/html; charset=UTF-8'}, html.encode('utf-8')
+
+# ---------------------------------------------------------------- 封面与图床
+
+def cover_image(handler, query, *args):
+    return 200, {'Content-Type': 'image/jpeg', 'Cache-Control': 'max-age=86400'}, COVER_BYTES
+
+def imghost_token(handler, query):
+    try:
+        data = json.loads(handler.body or b'{}')
+    except ValueError:
+        data = {}
+    if not data.get('email') or not data.get('password'):
+        return json_response({'status': False, 'message': '邮箱或密码不能为空'}, status=422)
+    return json_response({'status': True, 'message': '登录成功', 'data': {'token': 'mock-token'}})
+
+def imghost_upload(handler, query):
+    if not handler.headers.get('Authorization', '').startswith('Bearer '):
+        return json_response({'status': False, 'message': 'Unauthenticated.'}, status=401)
+    content = extract_multipart_file(handler.headers.get('Content-Type', ''), handler.body)
+    if not content:
+        return json_response({'status': False, 'message': '图片不能为空'}, status=422)
+    key = hashlib.sha1(content).hexdigest()
+    with handler.server.lock:
+        handler.server.uploads[key] = content
+    return json_response({'status': True, 'message': '上传成功', 'data': {
+        'key': key,
+        'id': key[:8],
+        'url': f"{handler.origin}/imghost/i/{key}.jpg",
+        'size': len(content) / 1024,
+    }})
+
+def imghost_image(handler, query, key):
+    content = handler.server.uploads.get(key)
+    if content is None:
+        return 404, {'Content-Type': 'text/plain'}, b'not found'
+    return 200, {'Content-Type': 'image/jpeg'}, content
+
+def extract_multipart_file(content_type: str, body: bytes) -> bytes:
+    """从 multipart/form-data 请求体中取出第一个文件"""
+    match = re.search(r'boundary=("?)([^";]+)\1', content_type)
+    if not match or not body:
+        return b''
+    boundary = b'--' + match.group(2).encode()
+    for part in body.split(boundary):
+        head, sep, content = part.partition(b'\r\n\r\n')
+        if sep and b'filename=' in head:
+            return content[:-2] if content.endswith(b'\r\n') else content
+    return b''
+
+# ---------------------------------------------------------------- 封禁页
+
+AMAZON_CAPTCHA_PAGE = """<!doctype html>
+<html><head><title>Amazon.com</title></head><body>
+<h4>Enter the characters you see below</h4>
+<p>Sorry, we just need to make sure you're not a robot.</p>
+<form method="get" action="/errors/validateCaptcha">
+<p>Type the characters you see in this image:</p>
+<input type="text" id="captchacharacters" name="field-keywords">
+</form></body></html>
+"""
+
+DOUBAN_BLOCK_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>禁止访问</title></head>
+<body><div>检测到有异常请求从你的 IP 发出，请 <a href="https://www.douban.com/accounts/login">登录</a> 使用豆瓣。</div></body></html>
+"""
+
+GOOGLE_SORRY_PAGE = """<html><head><title>Sorry...</title></head><body>
+<p>Our systems have detected unusual traffic from your computer network.</p>
+</body></html>
+"""
+
+MEGBOOK_BLOCK_PAGE = """<html><head><title>403 Forbidden</title></head>
+<body><h1>403 Forbidden</h1><p>訪問過於頻繁，請稍後再試。</p></body></html>
+"""
+
+def block_page(handler, source: str) -> Tuple[int, Dict[str, str], bytes]:
+    """按数据源返回对应站点的封禁响应"""
+    if source == 'amazon':
+        return 200, {'Content-Type': 'text/html; charset=utf-8'}, AMAZON_CAPTCHA_PAGE.encode('utf-8')
+    if source == 'douban':
+        return 403, {'Content-Type': 'text/html; charset=utf-8'}, DOUBAN_BLOCK_PAGE.encode('utf-8')
+    if source == 'google':
+        return 429, {'Content-Type': 'text/html; charset=utf-8'}, GOOGLE_SORRY_PAGE.encode('utf-8')
+    if source in MEGBOOK_SITES:
+        return 403, {}, MEGBOOK_BLOCK_PAGE.encode(MEGBOOK_SITES[source]['charset'], errors='xmlcharrefreplace')
+    return 429, {'Content-Type': 'text/plain', 'Retry-After': '30'}, b'Too Many Requests'
+
+def json_response(data, status: int = 200):
+    return status, {'Content-Type': 'application/json; charset=UTF-8'}, json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+# (方法, 路径正则, 处理函数)
+ROUTES = [
+    ('GET', r'/douban/j/subject_suggest', douban_suggest),
+    ('GET', r'/douban/search/book/subject_search', douban_search_page),
+    ('GET', r'/douban/subject/(\d+)/?', douban_subject),
+    ('GET', r'/(megbookhk|megbooktw)/mall/search\.jsp', megbook_search),
+    ('GET', r'/(megbookhk|megbooktw)/mall/detail\.jsp', megbook_detail),
+    ('GET', r'/amazon/s', amazon_search),
+    ('GET', r'/amazon/dp/(\w+)', amazon_detail),
+    ('GET', r'/google/books/v1/volumes', google_search),
+    ('GET', r'/google/books/v1/volumes/(\w+)', google_detail),
+    ('GET', r'/google/books/content', cover_image),
+    ('GET', r'/google/books', google_web),
+    ('GET', r'/covers/(\w+)\.jpg', cover_image),
+    ('POST', r'/imghost/api/v1/tokens', imghost_token),
+    ('POST', r'/imghost/api/v1/upload', imghost_upload),
+    ('GET', r'/imghost/i/(\w+)\.jpg', imghost_image),
+]
+
+class MockHandler(BaseHTTPRequestHandler):
+    """按路径前缀分发到各数据源的模拟实现"""
+    server_version = 'BookFinderMock/1.0'
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出，不关闭 Nagle 会与客户端的延迟确认叠加出约 40ms 的额外延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    @property
+    def origin(self) -> str:
+        return f"http://{self.headers.get('Host') or '%s:%d' % self.server.server_address[:2]}"
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method: str):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        source = parsed.path.strip('/').split('/', 1)[0]
+        behaviour = self.server.behaviour_for(source)
+
+        if not behaviour.allow():
+            self.respond(429, {'Content-Type': 'text/plain', 'Retry-After': '1'}, b'Too Many Requests')
+            return
+        delay = behaviour.sample_latency()
+        if delay > 0:
+            time.sleep(delay)
+        if behaviour.error_rate and random.random() < behaviour.error_rate:
+            self.respond(503, {'Content-Type': 'text/plain'}, b'Service Unavailable')
+            return
+        if behaviour.block_rate and random.random() < behaviour.block_rate:
+            self.respond(*block_page(self, source))
+            return
+
+        for route_method, pattern, func in ROUTES:
+            if route_method != method:
+                continue
+            match = re.fullmatch(pattern, parsed.path)
+            if match:
+                status, headers, body = func(self, query, *match.groups())
+                self.respond(status, headers, body)
+                return
+        self.respond(404, {'Content-Type': 'text/plain'}, b'Not Found')
+
+    def respond(self, status: int, headers: Dict[str, str], body: bytes):
+        if status == 200 and self.command == 'GET' and 'ETag' not in headers:
+            # 按内容生成 ETag，支持条件请求
+            headers = dict(headers, ETag=f'"{hashlib.md5(body).hexdigest()[:16]}"')
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, b''
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+class MockServer(ThreadingHTTPServer):
+    """带有按数据源配置行为的线程化 HTTP 服务器"""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, default: Behaviour, overrides: Dict[str, Behaviour], verbose: bool = False,
+                 price_drift: float = 0.0):
+        super().__init__(address, MockHandler)
+        self.default = default
+        self.overrides = overrides
+        self.verbose = verbose
+        self.price_drift = price_drift
+        self.uploads: Dict[str, bytes] = {}
+        self.prices: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def behaviour_for(self, source: str) -> Behaviour:
+        return self.overrides.get(source, self.default)
+
+    def current_price(self, book: Dict[str, str]) -> str:
+        """图书当前的售价；编号能被 4 整除的图书每次请求有 price_drift 的概率变价，其余图书不变"""
+        with self.lock:
+            price = self.prices.get(book['id'], book['price'])
+            if int(book['id']) % 4 == 0 and random.random() < self.price_drift:
+                price = self.prices[book['id']] = f"{float(price) * random.uniform(0.8, 1.2):.2f}"
+            return price
+
+def load_overrides(path: Optional[str]) -> Dict[str, Behaviour]:
+    """读取按数据源覆盖的行为配置"""
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {name: Behaviour(**options) for name, options in data.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder 本地模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', default='fixed:0', help='默认延迟分布，例如 uniform:20:200 或 lognormal:80:0.5（毫秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 503 的概率')
+    parser.add_argument('--block-rate', type=float, default=0.0, help='返回封禁/验证码页面的概率')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='每个数据源每秒允许的请求数，超出返回 429（0 表示不限）')
+    parser.add_argument('--burst', type=float, default=None, help='限流令牌桶容量')
+    parser.add_argument('--price-drift', type=float, default=0.0,
+                        help='编号能被 4 整除的图书每次请求详情时变价的概率，用于测试关注列表刷新')
+    parser.add_argument('--config', help='按数据源覆盖行为的 JSON 配置文件')
+    parser.add_argument('--verbose', action='store_true', help='打印访问日志')
+    args = parser.parse_args()
+
+    default = Behaviour(args.latency, args.error_rate, args.rate_limit, args.burst, args.block_rate)
+    server = MockServer((args.host, args.port), default, load_overrides(args.config), args.verbose, args.price_drift)
+    print(f"模拟服务器已启动: http://{args.host}:{args.port}")
+    print(f"使用方法: 设置环境变量 BOOKFINDER_MOCK_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+BookFinder HTTP API 服务
+
+长期运行的服务进程，在多次请求之间复用连接池、已导入的数据源模块、语言检测模型和图床token。
+
+用法:
+    python server.py --host 127.0.0.1 --port 8080
+
+接口:
+    GET  /health                                  健康检查
+    GET  /metrics[?format=json]                   Prometheus 文本或 JSON 指标
+    GET  /search?q=三体&source=douban              单个数据源搜索
+    GET  /search?q=三体[&source=all]               全部数据源搜索，结果汇总后返回
+    GET  /search/stream?q=三体[&sources=a,b]        Server-Sent Events，各数据源返回一个推送一个
+    GET  /details?source=douban&id=<url或ID>        图书详情
+    POST /cover  {"title": ..., "cover_url": ...}   下载封面并上传到图床
+
+每个请求的时间预算默认取 settings 的 lookup_deadline，可用 timeout 参数（POST 为 JSON 字段）缩短；
+SSE 客户端断开时取消仍在进行的搜索。
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from sources.registry import get_source, source_names
+from sources.image import process_cover_image
+from sources.metrics import export_prometheus, export_json
+from sources.deadline import deadline, submit
+from sources.settings import get_settings
+from sources.prewarm import prewarm
+from sources.isbn_index import find_known_book, remember_book
+
+# 服务启动时间
+STARTED_AT = time.time()
+
+def run_search(source: str, keyword: str) -> Dict:
+    """执行单个数据源的搜索，返回可直接序列化的结果"""
+    started = time.perf_counter()
+    known = find_known_book(keyword, source)
+    if known:
+        return {'source': source, 'query': keyword, 'results': [known], 'index': True,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+    try:
+        results = get_source(source).search_books(keyword) or []
+        return {'source': source, 'query': keyword, 'results': results,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        return {'source': source, 'query': keyword, 'results': [], 'error': str(e),
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+def warm_up():
+    """导入所有数据源模块，预热解析器和语言检测模型，并预先连接各数据源的主机"""
+    prewarm(source_names()).join()
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON API 请求处理"""
+    server_version = 'BookFinder/1.0'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def request_path(self) -> str:
+        """http.server 按 latin-1 解码请求行，未转义的中文需要还原为 UTF-8"""
+        try:
+            return self.path.encode('iso-8859-1').decode('utf-8')
+        except UnicodeError:
+            return self.path
+
+    def do_GET(self):
+        parsed = urlparse(self.request_path())
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        routes = {
+            '/health': self.handle_health,
+            '/metrics': self.handle_metrics,
+            '/search': self.handle_search,
+            '/search/stream': self.handle_search_stream,
+            '/details': self.handle_details,
+        }
+        handler = routes.get(parsed.path.rstrip('/') or '/')
+        if handler is None:
+            self.send_json({'error': 'not found'}, 404)
+            return
+        seconds = self.request_budget(query.get('timeout'))
+        if seconds is None:
+            return
+        self.dispatch(handler, query, seconds)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if parsed.path.rstrip('/') != '/cover':
+            self.send_json({'error': 'not found'}, 404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json({'error': '请求体不是有效的JSON'}, 400)
+            return
+        seconds = self.request_budget(payload.get('timeout'))
+        if seconds is None:
+            return
+        self.dispatch(self.handle_cover, payload, seconds)
+
+    def dispatch(self, handler, arg, seconds: float):
+        """在请求的时间预算内执行接口；未处理的异常记录到 stderr 并返回 500，而不是直接断开连接"""
+        self.responded = False
+        try:
+            with deadline(seconds) as self.deadline:
+                handler(arg)
+        except Exception as e:
+            print(f"处理请求出错: {self.command} {self.request_path()}")
+            traceback.print_exc()
+            if self.responded:
+                # 响应头已经发出（如 SSE），无法再改状态码，只能关闭连接
+                self.close_connection = True
+            else:
+                self.send_json({'error': f"{type(e).__name__}: {e}"}, 500)
+
+    # ------------------------------------------------------------ 接口实现
+
+    def handle_health(self, query):
+        self.send_json({
+            'status': 'ok',
+            'uptime': round(time.time() - STARTED_AT, 1),
+            'sources': source_names(),
+        })
+
+    def handle_metrics(self, query):
+        if query.get('format') == 'json':
+            self.send_json(export_json())
+        else:
+            self.send_body(200, 'text/plain; version=0.0.4; charset=utf-8', export_prometheus().encode('utf-8'))
+
+    def handle_search(self, query):
+        keyword = query.get('q', '').strip()
+        if not keyword:
+            self.send_json({'error': '缺少参数 q'}, 400)
+            return
+        sources = self.requested_sources(query)
+        if sources is None:
+            return
+        if len(sources) == 1:
+            self.send_json(run_search(sources[0], keyword))
+            return
+        futures = {submit(self.server.executor, run_search, source, keyword): source for source in sources}
+        results = {futures[f]: f.result() for f in as_completed(futures)}
+        self.send_json({'query': keyword, 'results': [results[s] for s in sources]})
+
+    def handle_search_stream(self, query):
+        keyword = query.get('q', '').strip()
+        if not keyword:
+            self.send_json({'error': '缺少参数 q'}, 400)
+            return
+        sources = self.requested_sources(query)
+        if sources is None:
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        futures = [submit(self.server.executor, run_search, source, keyword) for source in sources]
+        try:
+            for future in as_completed(futures):
+                self.send_event('results', future.result())
+            self.send_event('done', {'query': keyword, 'sources': sources})
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已断开，取消正在进行的搜索并丢弃尚未开始的
+            self.deadline.cancel()
+            for future in futures:
+                future.cancel()
+
+    def handle_details(self, query):
+        source = query.get('source', '')
+        book_id = query.get('id', '') or query.get('url', '')
+        if source not in source_names() or not book_id:
+            self.send_json({'error': '需要参数 source 和 id'}, 400)
+            return
+        started = time.perf_counter()
+        details = get_source(source).get_book_details(book_id)
+        if not details:
+            self.send_json({'error': '无法获取图书详细信息', 'source': source, 'id': book_id}, 502)
+            return
+        remember_book(details, source)
+        self.send_json({'source': source, 'details': details,
+                        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    def handle_cover(self, payload):
+        if not payload.get('cover_url'):
+            self.send_json({'error': '缺少 cover_url'}, 400)
+            return
+        book_info = {'title': payload.get('title') or 'cover', 'cover_url': payload['cover_url']}
+        temp_dir = tempfile.mkdtemp(prefix='bookfinder-cover-')
+        try:
+            book_info = process_cover_image(book_info, temp_dir)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        self.send_json({'cover_url': book_info['cover_url'],
+                        'uploaded': book_info['cover_url'] != payload['cover_url']})
+
+    # ------------------------------------------------------------ 工具方法
+
+    def request_budget(self, value) -> Optional[float]:
+        """解析 timeout 参数，不超过服务端的 lookup_deadline；无效时直接返回 400"""
+        limit = get_settings().lookup_deadline
+        if value in (None, ''):
+            return limit
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            seconds = -1
+        if seconds <= 0:
+            self.send_json({'error': 'timeout 必须是正数（秒）'}, 400)
+            return None
+        return min(seconds, limit) if limit > 0 else seconds
+
+    def requested_sources(self, query) -> Optional[List[str]]:
+        """解析 source/sources 参数，无效时直接返回 400"""
+        value = query.get('sources') or query.get('source') or 'all'
+        sources = source_names() if value == 'all' else [s.strip() for s in value.split(',') if s.strip()]
+        unknown = [s for s in sources if s not in source_names()]
+        if unknown or not sources:
+            self.send_json({'error': f"未知的搜索源: {', '.join(unknown)}"}, 400)
+            return None
+        return sources
+
+    def send_response(self, code, message=None):
+        self.responded = True
+        super().send_response(code, message)
+
+    def send_event(self, event: str, data):
+        body = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        self.wfile.write(body.encode('utf-8'))
+        self.wfile.flush()
+
+    def send_json(self, data, status: int = 200):
+        self.send_body(status, 'application/json; charset=utf-8',
+                       json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    def send_body(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class ApiServer(ThreadingHTTPServer):
+    """带共享工作线程池的 API 服务"""
+    daemon_threads = True
+
+    def __init__(self, address, workers: int, verbose: bool = False):
+        super().__init__(address, ApiHandler)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bookfinder-search')
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder HTTP API 服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=32, help='执行搜索的工作线程数')
+    parser.add_argument('--verbose', action='store_true', help='打印访问日志')
+    args = parser.parse_args()
+
+    warm_up()
+    server = ApiServer((args.host, args.port), args.workers, args.verbose)
+    print(f"BookFinder API 已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
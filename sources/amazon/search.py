@@ -1,237 +1,280 @@
 """亚马逊图书搜索模块"""
-from typing import Dict, List, Optional
-from bs4 import BeautifulSoup
+from typing import Dict, Iterator, List, Optional, Tuple
+from bs4 import SoupStrainer
 import re
 
-from config import HEADERS, REQUEST_TIMEOUT
-from sources.utils import retry_on_failure, make_request, extract_year
+from config import HEADERS, AMAZON_BASE_URL
+from sources.utils import retry_on_failure, make_request, response_encoding, html_from_bytes, paginate, extract_year
+from sources.metrics import traced, count_failure
+from sources.singleflight import DETAILS, coalesced, canonical_url
+from sources.result_cache import cached
+from sources.text import normalize
 
 # URL配置
-AMAZON_BASE_URL = 'https://www.amazon.com'
 AMAZON_SEARCH_URL = f'{AMAZON_BASE_URL}/s'
 
+# 等待用户输入时预先建立连接的地址（搜索和详情所在的主机）
+PREWARM_URLS = [AMAZON_BASE_URL]
+
+# 会随时间变化、需要定期刷新的字段
+VOLATILE_FIELDS = ('price', 'availability')
+
+# 价格和库存所在的区块，刷新时只为这些元素建树
+VOLATILE_BLOCKS = SoupStrainer(id=re.compile(
+    r'^(corePrice\w*|apex_desktop|price|kindle-price|tmmSwatches|availability)$'))
+
+def build_search_request(book_name: str, page: int = 1) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造搜索请求，返回 (URL, 请求头, 参数)"""
+    params = {
+        'k': book_name,
+        'i': 'stripbooks-intl-ship',
+        '__mk_zh_CN': '亚马逊网站'
+    }
+    if page > 1:
+        params['page'] = page
+    return AMAZON_SEARCH_URL, HEADERS, params
+
+def build_details_request(url: str) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造详情页请求，返回 (URL, 请求头, 参数)"""
+    return url, HEADERS, None
+
 def clean_text(text):
-    """清理文本，移除多余的空白字符和特殊字符"""
-    if not text:
-        return ''
-    # 移除特殊字符和控制字符
-    text = re.sub(r'[\u200e\u200f\u202a\u202b\u202c\u202d\u202e]', '', text)
-    # 移除多余的空白字符
-    text = re.sub(r'\s+', ' ', text)
-    # 移除冒号和前后空白
-    text = re.sub(r'^[:\s：‏‎]+|[:\s：‏‎]+$', '', text)
-    return text.strip()
-
-@retry_on_failure(max_retries=3)
-def search_books(book_name: str) -> List[Dict[str, str]]:
+    """清理文本，移除多余的空白字符、双向文本标记和首尾的冒号"""
+    return normalize(text, ':：')
+
+def parse_search_results(content: bytes, encoding: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    解析搜索结果页的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    Args:
+        content: 响应体字节
+        encoding: 响应声明的字符集
+
+    Returns:
+        搜索结果列表
+    """
+    soup = html_from_bytes(content, encoding)
+    results = []
+
+    # 查找所有图书项
+    book_items = soup.select('div[data-component-type="s-search-result"]')
+
+    for item in book_items:
+        try:
+            # 提取标题和URL
+            title_elem = item.select_one('h2 a.a-link-normal')
+            if not title_elem:
+                continue
+
+            title = clean_text(title_elem.text)
+            url = AMAZON_BASE_URL + title_elem.get('href', '')
+
+            # 提取作者
+            author = ''
+            # 1. 首先尝试从专门的作者区域提取
+            author_row = item.select_one('div.a-row .a-size-base:not(.a-color-secondary)')
+            if author_row:
+                text = clean_text(author_row.text)
+                # 处理中文的"作者:"格式
+                author_match = re.search(r'作者[:\s：]\s*(.+?)(?:\s*\||$)', text)
+                if author_match:
+                    author = clean_text(author_match.group(1))
+                else:
+                    # 处理英文的"by"格式
+                    if text.lower().startswith('by'):
+                        author = clean_text(text[2:])
+                    else:
+                        author = text
+
+            # 2. 如果上面方法失败,尝试从其他区域提取
+            if not author:
+                author_container = item.select_one('div.a-row.a-size-base.a-color-secondary')
+                if author_container:
+                    # 2.1 首先尝试找到作者链接
+                    author_links = author_container.select('a:not(.a-text-normal)')
+                    if author_links:
+                        authors = []
+                        for link in author_links:
+                            author_text = clean_text(link.text)
+                            if is_valid_author(author_text):
+                                authors.append(author_text)
+                        author = ', '.join(authors)
+
+                    # 2.2 如果没有找到作者链接,尝试从span中提取
+                    if not author:
+                        # 首先尝试找到包含"作者"或"by"的span
+                        for span in author_container.find_all('span'):
+                            text = clean_text(span.text)
+                            author_match = re.search(r'(?:作者[:\s：]|by\s+)(.+?)(?:\s*\||$)', text, re.IGNORECASE)
+                            if author_match:
+                                author = clean_text(author_match.group(1))
+                                break
+
+                        # 如果还是没有找到,尝试其他span
+                        if not author:
+                            spans = author_container.find_all('span')
+                            for span in spans:
+                                text = clean_text(span.text)
+                                if is_valid_author(text):
+                                    author = text
+                                    break
+
+            # 3. 清理和验证作者名
+            if author:
+                # 移除系列信息
+                author = re.sub(r'Book\s+\d+\s+of\s+\d+.*$', '', author, flags=re.IGNORECASE)
+                # 移除"by"开头
+                author = re.sub(r'^by\s+', '', author, flags=re.IGNORECASE)
+                # 移除括号中的内容
+                author = re.sub(r'\([^)]*\)', '', author)
+                # 移除方括号中的内容
+                author = re.sub(r'\[[^\]]*\]', '', author)
+                # 移除多余的标点符号
+                author = re.sub(r'[,;，；]+', ',', author)
+                # 移除首尾的标点符号和空白
+                author = author.strip('.,;:，。；：、 ')
+                # 确保每个作者名之间只有一个逗号
+                author = ','.join(part.strip() for part in author.split(',') if is_valid_author(part.strip()))
+
+                # 如果清理后为空，设为空字符串
+                if not author or author.lower().strip() in ['by', '作者']:
+                    author = ''
+
+            # 提取封面图片
+            img_elem = item.select_one('img.s-image')
+            cover_url = img_elem.get('src', '') if img_elem else ''
+
+            # 提取更多信息
+            details_text = ''
+            details_elem = item.select_one('.a-size-base.a-color-secondary')
+            if details_elem:
+                details_text = clean_text(details_elem.text)
+
+            # 初始化图书信息
+            book = {
+                'url': url,  # 使用亚马逊原始链接
+                'title': title,
+                'author': author,
+                'cover_url': cover_url,
+                'press': '',
+                'year': '',
+                'isbn': '',
+                'description': ''
+            }
+
+            # 从详情文本中提取更多信息
+            if details_text:
+                # 提取出版社和年份
+                press_match = re.search(r'(?:出版社|Publisher)\s*[:：]\s*([^(（]+)(?:\s*[(（]([^)）]+)[)）])?', details_text)
+                if press_match:
+                    book['press'] = clean_text(press_match.group(1))
+                    if press_match.group(2):
+                        book['year'] = extract_year(press_match.group(2))
+
+                # 如果还没找到年份，尝试其他方式
+                if not book['year']:
+                    # 查找日期格式
+                    date_patterns = [
+                        r'(\d{4}年\d{1,2}月\d{1,2}日)',
+                        r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
+                        r'([A-Z][a-z]+ \d{1,2}, \d{4})',
+                        r'(\d{4})',
+                    ]
+
+                    for pattern in date_patterns:
+                        date_match = re.search(pattern, details_text)
+                        if date_match:
+                            book['year'] = extract_year(date_match.group(1))
+                            break
+
+                # ISBN
+                isbn_patterns = [
+                    r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*(\d[0-9X‐-]*)',
+                    r'(\d{10}|\d{13})',
+                    r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*([0-9X‐-]+)'
+                ]
+
+                for pattern in isbn_patterns:
+                    isbn_match = re.search(pattern, details_text)
+                    if isbn_match:
+                        isbn = isbn_match.group(1)
+                        # 清理ISBN，只保留数字和X
+                        isbn = re.sub(r'[^0-9X]', '', isbn)
+                        if len(isbn) in (10, 13):  # 只接受10位或13位的ISBN
+                            book['isbn'] = isbn
+                            break
+
+                # 页数
+                if any(key in details_text for key in ['页数', 'Pages', '页', 'Print length']):
+                    pages_patterns = [
+                        r'(?:页数|Pages|页|Print length)\s*[:：]?\s*(\d+)',
+                        r'(\d+)\s*(?:页|pages)',
+                    ]
+
+                    for pattern in pages_patterns:
+                        pages_match = re.search(pattern, details_text)
+                        if pages_match:
+                            book['pages'] = pages_match.group(1)
+                            break
+
+            # 提取描述
+            desc_elem = item.select_one('.a-size-base.a-color-secondary')
+            if desc_elem:
+                desc_text = clean_text(desc_elem.text)
+                # 如果描述中包含作者信息，尝试提取纯描述部分
+                if '作者' in desc_text:
+                    desc_parts = desc_text.split('作者:', 1)
+                    if len(desc_parts) > 1:
+                        desc_text = desc_parts[0].strip()
+                book['description'] = desc_text
+
+            results.append(book)
+
+        except Exception as e:
+            print(f"处理搜索结果项时出错: {str(e)}")
+            continue
+
+    return results
+
+@traced('amazon', 'search')
+@cached('amazon', 'search')
+@retry_on_failure()
+def search_books(book_name: str, page: int = 1) -> List[Dict[str, str]]:
     """
     搜索亚马逊图书
     
     Args:
         book_name: 要搜索的书名
+        page: 页码，从1开始
 
     Returns:
         包含搜索结果的列表，每个元素是一个字典，包含书籍信息
     """
     try:
-        # 构造搜索URL参数
-        params = {
-            'k': book_name,
-            'i': 'stripbooks-intl-ship',
-            '__mk_zh_CN': '亚马逊网站'
-        }
-        
-        response = make_request(AMAZON_SEARCH_URL, HEADERS, params=params)
+        response = make_request(*build_search_request(book_name, page))
         if not response:
             return []
             
-        soup = BeautifulSoup(response.text, 'html.parser')
-        results = []
-        
-        # 查找所有图书项
-        book_items = soup.select('div[data-component-type="s-search-result"]')
-        
-        for item in book_items:
-            try:
-                # 提取标题和URL
-                title_elem = item.select_one('h2 a.a-link-normal')
-                if not title_elem:
-                    continue
-                    
-                title = clean_text(title_elem.text)
-                url = AMAZON_BASE_URL + title_elem.get('href', '')
-                
-                # 提取作者
-                author = ''
-                # 1. 首先尝试从专门的作者区域提取
-                author_row = item.select_one('div.a-row .a-size-base:not(.a-color-secondary)')
-                if author_row:
-                    text = clean_text(author_row.text)
-                    # 处理中文的"作者:"格式
-                    author_match = re.search(r'作者[:\s：]\s*(.+?)(?:\s*\||$)', text)
-                    if author_match:
-                        author = clean_text(author_match.group(1))
-                    else:
-                        # 处理英文的"by"格式
-                        if text.lower().startswith('by'):
-                            author = clean_text(text[2:])
-                        else:
-                            author = text
-                
-                # 2. 如果上面方法失败,尝试从其他区域提取
-                if not author:
-                    author_container = item.select_one('div.a-row.a-size-base.a-color-secondary')
-                    if author_container:
-                        # 2.1 首先尝试找到作者链接
-                        author_links = author_container.select('a:not(.a-text-normal)')
-                        if author_links:
-                            authors = []
-                            for link in author_links:
-                                author_text = clean_text(link.text)
-                                if is_valid_author(author_text):
-                                    authors.append(author_text)
-                            author = ', '.join(authors)
-                        
-                        # 2.2 如果没有找到作者链接,尝试从span中提取
-                        if not author:
-                            # 首先尝试找到包含"作者"或"by"的span
-                            for span in author_container.find_all('span'):
-                                text = clean_text(span.text)
-                                author_match = re.search(r'(?:作者[:\s：]|by\s+)(.+?)(?:\s*\||$)', text, re.IGNORECASE)
-                                if author_match:
-                                    author = clean_text(author_match.group(1))
-                                    break
-                            
-                            # 如果还是没有找到,尝试其他span
-                            if not author:
-                                spans = author_container.find_all('span')
-                                for span in spans:
-                                    text = clean_text(span.text)
-                                    if is_valid_author(text):
-                                        author = text
-                                        break
-                
-                # 3. 清理和验证作者名
-                if author:
-                    # 移除系列信息
-                    author = re.sub(r'Book\s+\d+\s+of\s+\d+.*$', '', author, flags=re.IGNORECASE)
-                    # 移除"by"开头
-                    author = re.sub(r'^by\s+', '', author, flags=re.IGNORECASE)
-                    # 移除括号中的内容
-                    author = re.sub(r'\([^)]*\)', '', author)
-                    # 移除方括号中的内容
-                    author = re.sub(r'\[[^\]]*\]', '', author)
-                    # 移除多余的标点符号
-                    author = re.sub(r'[,;，；]+', ',', author)
-                    # 移除首尾的标点符号和空白
-                    author = author.strip('.,;:，。；：、 ')
-                    # 确保每个作者名之间只有一个逗号
-                    author = ','.join(part.strip() for part in author.split(',') if is_valid_author(part.strip()))
-                    
-                    # 如果清理后为空，设为空字符串
-                    if not author or author.lower().strip() in ['by', '作者']:
-                        author = ''
-                
-                # 提取封面图片
-                img_elem = item.select_one('img.s-image')
-                cover_url = img_elem.get('src', '') if img_elem else ''
-                
-                # 提取更多信息
-                details_text = ''
-                details_elem = item.select_one('.a-size-base.a-color-secondary')
-                if details_elem:
-                    details_text = clean_text(details_elem.text)
-                
-                # 初始化图书信息
-                book = {
-                    'url': url,  # 使用亚马逊原始链接
-                    'title': title,
-                    'author': author,
-                    'cover_url': cover_url,
-                    'press': '',
-                    'year': '',
-                    'isbn': '',
-                    'description': ''
-                }
-                
-                # 从详情文本中提取更多信息
-                if details_text:
-                    # 提取出版社和年份
-                    press_match = re.search(r'(?:出版社|Publisher)\s*[:：]\s*([^(（]+)(?:\s*[(（]([^)）]+)[)）])?', details_text)
-                    if press_match:
-                        book['press'] = clean_text(press_match.group(1))
-                        if press_match.group(2):
-                            book['year'] = extract_year(press_match.group(2))
-                    
-                    # 如果还没找到年份，尝试其他方式
-                    if not book['year']:
-                        # 查找日期格式
-                        date_patterns = [
-                            r'(\d{4}年\d{1,2}月\d{1,2}日)',
-                            r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
-                            r'([A-Z][a-z]+ \d{1,2}, \d{4})',
-                            r'(\d{4})',
-                        ]
-                        
-                        for pattern in date_patterns:
-                            date_match = re.search(pattern, details_text)
-                            if date_match:
-                                book['year'] = extract_year(date_match.group(1))
-                                break
-            
-                    # ISBN
-                    isbn_patterns = [
-                        r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*(\d[0-9X‐-]*)',
-                        r'(\d{10}|\d{13})',
-                        r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*([0-9X‐-]+)'
-                    ]
-                    
-                    for pattern in isbn_patterns:
-                        isbn_match = re.search(pattern, details_text)
-                        if isbn_match:
-                            isbn = isbn_match.group(1)
-                            # 清理ISBN，只保留数字和X
-                            isbn = re.sub(r'[^0-9X]', '', isbn)
-                            if len(isbn) in (10, 13):  # 只接受10位或13位的ISBN
-                                book['isbn'] = isbn
-                                break
-            
-                    # 页数
-                    if any(key in details_text for key in ['页数', 'Pages', '页', 'Print length']):
-                        pages_patterns = [
-                            r'(?:页数|Pages|页|Print length)\s*[:：]?\s*(\d+)',
-                            r'(\d+)\s*(?:页|pages)',
-                        ]
-                        
-                        for pattern in pages_patterns:
-                            pages_match = re.search(pattern, details_text)
-                            if pages_match:
-                                book['pages'] = pages_match.group(1)
-                                break
-        
-                # 提取描述
-                desc_elem = item.select_one('.a-size-base.a-color-secondary')
-                if desc_elem:
-                    desc_text = clean_text(desc_elem.text)
-                    # 如果描述中包含作者信息，尝试提取纯描述部分
-                    if '作者' in desc_text:
-                        desc_parts = desc_text.split('作者:', 1)
-                        if len(desc_parts) > 1:
-                            desc_text = desc_parts[0].strip()
-                    book['description'] = desc_text
-                
-                results.append(book)
-                
-            except Exception as e:
-                print(f"处理搜索结果项时出错: {str(e)}")
-                continue
-        
-        return results
-        
+        return parse_search_results(response.content, response_encoding(response))
+
     except Exception as e:
+        count_failure(e)
         print(f"搜索过程出错: {str(e)}")
         return []
 
+def iter_books(book_name: str, max_pages: Optional[int] = None) -> Iterator[Dict[str, str]]:
+    """
+    逐条返回搜索结果，迭代到当前页末尾时才请求下一页
+
+    Args:
+        book_name: 要搜索的书名
+        max_pages: 最多请求的页数，None 表示直到没有新结果
+
+    Returns:
+        图书信息迭代器
+    """
+    return paginate(lambda page: search_books(book_name, page), max_pages=max_pages)
+
 def is_valid_author(text: str) -> bool:
     """
     检查文本是否是有效的作者名
@@ -282,6 +325,258 @@ def is_valid_author(text: str) -> bool:
         
     return True
 
+def parse_book_details(content: bytes, url: str, encoding: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    解析图书详情页的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    Args:
+        content: 响应体字节
+        url: 图书详情页URL
+        encoding: 响应声明的字符集
+
+    Returns:
+        包含图书详细信息的字典
+    """
+    soup = html_from_bytes(content, encoding)
+
+    info = {
+        'url': url,
+        'title': '',
+        'author': '',
+        'press': '',
+        'year': '',
+        'isbn': '',
+        'pages': '',
+        'price': '',
+        'description': '',
+        'cover_url': ''
+    }
+
+    # 提取标题
+    title_elem = soup.select_one('#productTitle, #title')
+    if title_elem:
+        info['title'] = clean_text(title_elem.text)
+
+    # 提取作者 - 使用多个选择器
+    authors = []
+    author_selectors = [
+        '#bylineInfo .author a', 
+        '#bylineInfo .contributorNameID',
+        '#bylineInfo a[data-asin]',
+        '.author .a-link-normal',
+        '#byline_secondary_view_div .a-link-normal',
+        '#contributorLinkContainer a'
+    ]
+
+    for selector in author_selectors:
+        author_elems = soup.select(selector)
+        for author_elem in author_elems:
+            author = clean_text(author_elem.text)
+            if is_valid_author(author):
+                if '作者' in author:
+                    author = re.sub(r'^作者[:\s：]\s*', '', author)
+                if author not in authors:  # 避免重复
+                    authors.append(author)
+
+    info['author'] = ', '.join(authors) if authors else ''
+
+    # 提取出版信息
+    detail_selectors = [
+        '#detailBullets_feature_div li',
+        '#productDetailsTable .content li',
+        '#detailBulletsWrapper_feature_div li',
+        '#productDetails_detailBullets_sections1 tr',
+        '#productDetails_techSpec_section_1 tr',
+        '.detail-bullet-list span',
+        '.a-expander-content table tr'
+    ]
+
+    details_elem = []
+    for selector in detail_selectors:
+        elements = soup.select(selector)
+        if elements:
+            details_elem.extend(elements)
+
+    for elem in details_elem:
+        text = clean_text(elem.text)
+
+        # 出版社和日期
+        if any(key in text for key in ['出版社', 'Publisher', '出版商', 'Published by']):
+            # 清理文本，移除特殊字符
+            text = clean_text(text)
+            if not text or text in ['Publisher', '出版社'] or len(text) < 3:
+                continue
+
+            # 尝试多种匹配模式
+            press_patterns = [
+                # 处理中文出版社格式
+                r'(?:出版社|出版商)\s*[:：]?\s*([^;(（]+?(?:出版社|出版|Publishers?|Press|Publishing(?:\s+House)?|Books|Media))',
+                # 处理英文出版社格式
+                r'(?:Publisher|Published by)\s*[:：]?\s*([^;(（]+?(?:Publishers?|Press|Publishing(?:\s+House)?|Books|Media))',
+                # 通用格式，但要求至少包含中文或英文字符
+                r'(?:出版社|Publisher|出版商|Published by)\s*[:：]?\s*([^;(（]{3,}?[\u4e00-\u9fff\w]+[^;(（]*?)(?:\s*[(（]|$)',
+            ]
+
+            for pattern in press_patterns:
+                press_match = re.search(pattern, text)
+                if press_match:
+                    press = clean_text(press_match.group(1))
+                    # 过滤无效出版社名
+                    if (press and 
+                        len(press) >= 2 and  # 至少2个字符
+                        re.search(r'[\u4e00-\u9fff\w]', press) and  # 必须包含中文或英文字符
+                        not press.strip() in ['Publisher', '出版社', ':', '：', '‏', '‎']):
+                        info['press'] = press
+                        # 尝试从文本中提取年份
+                        year_match = re.search(r'[(（]([^)）]+)[)）]', text)
+                        if year_match:
+                            info['year'] = extract_year(year_match.group(1))
+                        break
+
+            # 如果还没找到年份，尝试其他方式
+            if not info['year']:
+                # 查找日期格式
+                date_patterns = [
+                    r'(\d{4}年\d{1,2}月\d{1,2}日)',
+                    r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
+                    r'([A-Z][a-z]+ \d{1,2}, \d{4})',
+                    r'(\d{4})',
+                ]
+
+                for pattern in date_patterns:
+                    date_match = re.search(pattern, text)
+                    if date_match:
+                        info['year'] = extract_year(date_match.group(1))
+                        break
+
+        # ISBN
+        if 'ISBN' in text:
+            isbn_patterns = [
+                r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*(\d[0-9X‐-]*)',
+                r'(\d{10}|\d{13})',
+                r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*([0-9X‐-]+)'
+            ]
+
+            for pattern in isbn_patterns:
+                isbn_match = re.search(pattern, text)
+                if isbn_match:
+                    isbn = isbn_match.group(1)
+                    # 清理ISBN，只保留数字和X
+                    isbn = re.sub(r'[^0-9X]', '', isbn)
+                    if len(isbn) in (10, 13):  # 只接受10位或13位的ISBN
+                        info['isbn'] = isbn
+                        break
+
+        # 页数
+        if any(key in text for key in ['页数', 'Pages', '页', 'Print length']):
+            pages_patterns = [
+                r'(?:页数|Pages|页|Print length)\s*[:：]?\s*(\d+)',
+                r'(\d+)\s*(?:页|pages)',
+            ]
+
+            for pattern in pages_patterns:
+                pages_match = re.search(pattern, text)
+                if pages_match:
+                    info['pages'] = pages_match.group(1)
+                    break
+
+    # 提取价格和库存状态
+    info.update(extract_volatile_fields(soup))
+
+    # 提取图书描述
+    description = ''
+    desc_selectors = [
+        '#bookDescription_feature_div noscript',
+        '#bookDescription_feature_div .a-expander-content',
+        '#productDescription .content',
+        '#bookDescription_feature_div',
+        '#book_description',
+        '.book-description'
+    ]
+
+    for selector in desc_selectors:
+        desc_elems = soup.select(selector)
+        for desc_elem in desc_elems:
+            if desc_elem and desc_elem.text.strip():
+                description = clean_text(desc_elem.text)
+                if description:
+                    break
+        if description:
+            break
+
+    info['description'] = description
+
+    # 提取封面图片URL
+    cover_selectors = [
+        '#imgBlkFront',
+        '#main-image',
+        '#ebooksImgBlkFront',
+        '#img-canvas img'
+    ]
+
+    for selector in cover_selectors:
+        img_elem = soup.select_one(selector)
+        if img_elem:
+            # 尝试不同的属性获取图片URL
+            for attr in ['data-a-dynamic-image', 'data-src', 'src']:
+                img_url = img_elem.get(attr)
+                if img_url:
+                    # 如果是JSON字符串（data-a-dynamic-image的情况）
+                    if attr == 'data-a-dynamic-image':
+                        try:
+                            import json
+                            urls = json.loads(img_url)
+                            # 获取最大分辨率的图片URL
+                            img_url = max(urls.items(), key=lambda x: int(x[1][0]) * int(x[1][1]))[0]
+                        except:
+                            continue
+                    info['cover_url'] = img_url
+                    break
+            if info['cover_url']:
+                break
+
+    return info
+
+def extract_volatile_fields(soup) -> Dict[str, str]:
+    """从详情页中提取价格和库存状态，没有的字段不出现在结果中"""
+    info = {}
+    price_selectors = [
+        '.a-price .a-offscreen',
+        '#price',
+        '.kindle-price #digital-list-price',
+        '.swatchElement.selected .a-color-price'
+    ]
+
+    for selector in price_selectors:
+        price_elem = soup.select_one(selector)
+        if price_elem:
+            info['price'] = clean_text(price_elem.text)
+            break
+
+    availability = soup.select_one('#availability')
+    if availability and clean_text(availability.text):
+        info['availability'] = clean_text(availability.text)
+    return info
+
+def parse_volatile_fields(content: bytes, url: str, encoding: Optional[str] = None) -> Dict[str, str]:
+    """
+    只提取 VOLATILE_FIELDS（价格、库存状态），用于关注列表的定期刷新
+
+    只为价格和库存所在的区块建树，比完整解析详情页快得多。
+
+    Args:
+        content: 详情页响应体字节
+        url: 图书详情页URL
+        encoding: 响应声明的字符集
+
+    Returns:
+        提取到的字段
+    """
+    return extract_volatile_fields(html_from_bytes(content, encoding, parse_only=VOLATILE_BLOCKS))
+
+@traced('amazon', 'details')
+@cached('amazon', 'details', key=lambda url: canonical_url(build_details_request(url)[0]))
+@coalesced(DETAILS, key=lambda url: canonical_url(build_details_request(url)[0]))
 def get_book_details(url: str) -> Optional[Dict[str, str]]:
     """
     获取图书详细信息
@@ -293,222 +588,14 @@ def get_book_details(url: str) -> Optional[Dict[str, str]]:
         包含图书详细信息的字典
     """
     try:
-        response = make_request(url, HEADERS)
+        response = make_request(*build_details_request(url))
         if not response:
             return None
             
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        info = {
-            'url': url,
-            'title': '',
-            'author': '',
-            'press': '',
-            'year': '',
-            'isbn': '',
-            'pages': '',
-            'price': '',
-            'description': '',
-            'cover_url': ''
-        }
-        
-        # 提取标题
-        title_elem = soup.select_one('#productTitle, #title')
-        if title_elem:
-            info['title'] = clean_text(title_elem.text)
-        
-        # 提取作者 - 使用多个选择器
-        authors = []
-        author_selectors = [
-            '#bylineInfo .author a', 
-            '#bylineInfo .contributorNameID',
-            '#bylineInfo a[data-asin]',
-            '.author .a-link-normal',
-            '#byline_secondary_view_div .a-link-normal',
-            '#contributorLinkContainer a'
-        ]
-        
-        for selector in author_selectors:
-            author_elems = soup.select(selector)
-            for author_elem in author_elems:
-                author = clean_text(author_elem.text)
-                if is_valid_author(author):
-                    if '作者' in author:
-                        author = re.sub(r'^作者[:\s：]\s*', '', author)
-                    if author not in authors:  # 避免重复
-                        authors.append(author)
-        
-        info['author'] = ', '.join(authors) if authors else ''
-        
-        # 提取出版信息
-        detail_selectors = [
-            '#detailBullets_feature_div li',
-            '#productDetailsTable .content li',
-            '#detailBulletsWrapper_feature_div li',
-            '#productDetails_detailBullets_sections1 tr',
-            '#productDetails_techSpec_section_1 tr',
-            '.detail-bullet-list span',
-            '.a-expander-content table tr'
-        ]
-        
-        details_elem = []
-        for selector in detail_selectors:
-            elements = soup.select(selector)
-            if elements:
-                details_elem.extend(elements)
-                
-        for elem in details_elem:
-            text = clean_text(elem.text)
-            
-            # 出版社和日期
-            if any(key in text for key in ['出版社', 'Publisher', '出版商', 'Published by']):
-                # 清理文本，移除特殊字符
-                text = clean_text(text)
-                if not text or text in ['Publisher', '出版社'] or len(text) < 3:
-                    continue
-                
-                # 尝试多种匹配模式
-                press_patterns = [
-                    # 处理中文出版社格式
-                    r'(?:出版社|出版商)\s*[:：]?\s*([^;(（]+?(?:出版社|出版|Publishers?|Press|Publishing(?:\s+House)?|Books|Media))',
-                    # 处理英文出版社格式
-                    r'(?:Publisher|Published by)\s*[:：]?\s*([^;(（]+?(?:Publishers?|Press|Publishing(?:\s+House)?|Books|Media))',
-                    # 通用格式，但要求至少包含中文或英文字符
-                    r'(?:出版社|Publisher|出版商|Published by)\s*[:：]?\s*([^;(（]{3,}?[\u4e00-\u9fff\w]+[^;(（]*?)(?:\s*[(（]|$)',
-                ]
-                
-                for pattern in press_patterns:
-                    press_match = re.search(pattern, text)
-                    if press_match:
-                        press = clean_text(press_match.group(1))
-                        # 过滤无效出版社名
-                        if (press and 
-                            len(press) >= 2 and  # 至少2个字符
-                            re.search(r'[\u4e00-\u9fff\w]', press) and  # 必须包含中文或英文字符
-                            not press.strip() in ['Publisher', '出版社', ':', '：', '‏', '‎']):
-                            info['press'] = press
-                            # 尝试从文本中提取年份
-                            year_match = re.search(r'[(（]([^)）]+)[)）]', text)
-                            if year_match:
-                                info['year'] = extract_year(year_match.group(1))
-                            break
-                
-                # 如果还没找到年份，尝试其他方式
-                if not info['year']:
-                    # 查找日期格式
-                    date_patterns = [
-                        r'(\d{4}年\d{1,2}月\d{1,2}日)',
-                        r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
-                        r'([A-Z][a-z]+ \d{1,2}, \d{4})',
-                        r'(\d{4})',
-                    ]
-                    
-                    for pattern in date_patterns:
-                        date_match = re.search(pattern, text)
-                        if date_match:
-                            info['year'] = extract_year(date_match.group(1))
-                            break
-            
-            # ISBN
-            if 'ISBN' in text:
-                isbn_patterns = [
-                    r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*(\d[0-9X‐-]*)',
-                    r'(\d{10}|\d{13})',
-                    r'ISBN[-‐]?(?:13|10)?\s*[:：]?\s*([0-9X‐-]+)'
-                ]
-                
-                for pattern in isbn_patterns:
-                    isbn_match = re.search(pattern, text)
-                    if isbn_match:
-                        isbn = isbn_match.group(1)
-                        # 清理ISBN，只保留数字和X
-                        isbn = re.sub(r'[^0-9X]', '', isbn)
-                        if len(isbn) in (10, 13):  # 只接受10位或13位的ISBN
-                            info['isbn'] = isbn
-                            break
-            
-            # 页数
-            if any(key in text for key in ['页数', 'Pages', '页', 'Print length']):
-                pages_patterns = [
-                    r'(?:页数|Pages|页|Print length)\s*[:：]?\s*(\d+)',
-                    r'(\d+)\s*(?:页|pages)',
-                ]
-                
-                for pattern in pages_patterns:
-                    pages_match = re.search(pattern, text)
-                    if pages_match:
-                        info['pages'] = pages_match.group(1)
-                        break
-        
-        # 提取价格
-        price_selectors = [
-            '.a-price .a-offscreen',
-            '#price',
-            '.kindle-price #digital-list-price',
-            '.swatchElement.selected .a-color-price'
-        ]
-        
-        for selector in price_selectors:
-            price_elem = soup.select_one(selector)
-            if price_elem:
-                info['price'] = clean_text(price_elem.text)
-                break
-        
-        # 提取图书描述
-        description = ''
-        desc_selectors = [
-            '#bookDescription_feature_div noscript',
-            '#bookDescription_feature_div .a-expander-content',
-            '#productDescription .content',
-            '#bookDescription_feature_div',
-            '#book_description',
-            '.book-description'
-        ]
-        
-        for selector in desc_selectors:
-            desc_elems = soup.select(selector)
-            for desc_elem in desc_elems:
-                if desc_elem and desc_elem.text.strip():
-                    description = clean_text(desc_elem.text)
-                    if description:
-                        break
-            if description:
-                break
-        
-        info['description'] = description
-        
-        # 提取封面图片URL
-        cover_selectors = [
-            '#imgBlkFront',
-            '#main-image',
-            '#ebooksImgBlkFront',
-            '#img-canvas img'
-        ]
-        
-        for selector in cover_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                # 尝试不同的属性获取图片URL
-                for attr in ['data-a-dynamic-image', 'data-src', 'src']:
-                    img_url = img_elem.get(attr)
-                    if img_url:
-                        # 如果是JSON字符串（data-a-dynamic-image的情况）
-                        if attr == 'data-a-dynamic-image':
-                            try:
-                                import json
-                                urls = json.loads(img_url)
-                                # 获取最大分辨率的图片URL
-                                img_url = max(urls.items(), key=lambda x: int(x[1][0]) * int(x[1][1]))[0]
-                            except:
-                                continue
-                        info['cover_url'] = img_url
-                        break
-                if info['cover_url']:
-                    break
-        
-        return info
-        
+        return parse_book_details(response.content, url, response_encoding(response))
+
     except Exception as e:
+        count_failure(e)
         print(f"获取图书详情时出错: {str(e)}")
         return None
 
@@ -0,0 +1,203 @@
+"""
+封禁检测与按主机冷却
+
+亚马逊的机器人验证页、豆瓣的异常请求页等都以正常状态码返回，解析后只会得到空结果，
+重试反而会让封禁加重。make_request 在收到响应后交给当前数据源的检测函数判断，
+识别为封禁时抛出 BlockedError，并让该主机进入冷却期：冷却期内的请求不再发出，直接失败。
+连续被封时冷却时间翻倍，直到一次请求成功后复位。
+
+冷却时间由 settings 的 block_cooldown（首次冷却秒数，0 表示不冷却）和 block_cooldown_max 控制，
+对应环境变量 BOOKFINDER_BLOCK_COOLDOWN / BOOKFINDER_BLOCK_COOLDOWN_MAX。
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from config import MOCK_BASE_URL
+from sources.exceptions import BlockedError
+from sources.metrics import current_labels, count_block
+from sources.settings import get_settings
+
+# 封禁页都很小，超过该大小的 200 响应视为正常页面，不再扫描内容
+BLOCK_PAGE_MAX_BYTES = 64 * 1024
+
+Detector = Callable[[requests.Response, bytes], Optional[str]]
+
+def small_page(response: requests.Response, content: bytes) -> bool:
+    """只有较小的页面才可能是封禁页"""
+    return response.status_code != 200 or len(content) <= BLOCK_PAGE_MAX_BYTES
+
+def detect_amazon(response: requests.Response, content: bytes) -> Optional[str]:
+    """亚马逊：机器人验证页、503 封禁页和登录跳转"""
+    if '/ap/signin' in response.url:
+        return 'login'
+    if not small_page(response, content):
+        return None
+    if b'/errors/validateCaptcha' in content or b'Type the characters you see in this image' in content:
+        return 'captcha'
+    if response.status_code == 503 and b'api-services-support@amazon.com' in content:
+        return 'block'
+    return None
+
+def detect_douban(response: requests.Response, content: bytes) -> Optional[str]:
+    """豆瓣：跳转到 sec.douban.com 的异常请求页，或跳转到登录页"""
+    urls = [r.headers.get('Location', '') for r in response.history] + [response.url]
+    if any('sec.douban.com' in url for url in urls):
+        return 'captcha'
+    if any('accounts.douban.com/passport/login' in url for url in urls):
+        return 'login'
+    if response.status_code == 403 and small_page(response, content):
+        return 'block'
+    if small_page(response, content) and '检测到有异常请求'.encode('utf-8') in content:
+        return 'block'
+    return None
+
+def detect_google(response: requests.Response, content: bytes) -> Optional[str]:
+    """Google：/sorry/ 人机验证页和配额超限"""
+    if '/sorry/' in response.url:
+        return 'captcha'
+    if not small_page(response, content):
+        return None
+    if b'unusual traffic from your computer network' in content:
+        return 'captcha'
+    if response.status_code == 403 and b'rateLimitExceeded' in content:
+        return 'rate_limit'
+    return None
+
+# 人机验证页的标记，页面按站点字符集（gb18030/big5）编码，只匹配 ASCII 部分
+CHALLENGE_MARKERS = (b'challenge-platform', b'cf-chl-', b'<title>Attention Required', b'<title>Just a moment')
+
+def detect_megbook(response: requests.Response, content: bytes) -> Optional[str]:
+    """Megbook 港台站：前置防护的人机验证页和 403 拒绝访问页"""
+    if not small_page(response, content):
+        return None
+    if any(marker in content for marker in CHALLENGE_MARKERS):
+        return 'captcha'
+    if response.status_code == 403:
+        return 'block'
+    return None
+
+def detect_common(response: requests.Response, content: bytes) -> Optional[str]:
+    """所有数据源通用：429 限流"""
+    if response.status_code == 429:
+        return 'rate_limit'
+    return None
+
+DETECTORS: Dict[str, Detector] = {
+    'amazon': detect_amazon,
+    'douban': detect_douban,
+    'google': detect_google,
+    'megbookhk': detect_megbook,
+    'megbooktw': detect_megbook,
+}
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期）"""
+    value = response.headers.get('Retry-After', '').strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class Cooldown:
+    """按主机记录的冷却期，连续被封时指数增长"""
+
+    def __init__(self, base: Optional[float] = None, maximum: Optional[float] = None):
+        """
+        Args:
+            base: 首次冷却秒数，None 表示使用 settings 中的值
+            maximum: 冷却秒数上限，None 表示使用 settings 中的值
+        """
+        self._base = base
+        self._maximum = maximum
+        self._until: Dict[str, float] = {}
+        self._strikes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def remaining(self, host: str) -> float:
+        """返回该主机剩余的冷却秒数"""
+        with self._lock:
+            until = self._until.get(host)
+        return max(0.0, until - time.monotonic()) if until else 0.0
+
+    def block(self, host: str, retry_after: Optional[float] = None) -> float:
+        """
+        记录一次封禁，返回冷却秒数
+
+        Args:
+            host: 冷却键
+            retry_after: 服务器给出的等待时间，优先于指数退避
+        """
+        settings = get_settings()
+        base = settings.block_cooldown if self._base is None else self._base
+        maximum = settings.block_cooldown_max if self._maximum is None else self._maximum
+        with self._lock:
+            strikes = self._strikes.get(host, 0)
+            self._strikes[host] = strikes + 1
+            if retry_after is not None:
+                seconds = min(retry_after, maximum)
+            else:
+                seconds = min(base * (2 ** strikes), maximum)
+            if seconds > 0:
+                self._until[host] = time.monotonic() + seconds
+            return seconds
+
+    def clear(self, host: str):
+        """请求成功后复位"""
+        if host in self._strikes:
+            with self._lock:
+                self._strikes.pop(host, None)
+                self._until.pop(host, None)
+
+COOLDOWN = Cooldown()
+
+def cooldown_key(url: str) -> str:
+    """冷却键：主机名；模拟服务器上为主机名加数据源前缀"""
+    parts = urlsplit(url)
+    if MOCK_BASE_URL and url.startswith(MOCK_BASE_URL):
+        return f"{parts.netloc}/{parts.path.strip('/').split('/', 1)[0]}"
+    return parts.netloc
+
+def check_cooldown(url: str):
+    """
+    发出请求前检查主机是否在冷却期内
+
+    Raises:
+        BlockedError: 仍在冷却期内
+    """
+    host = cooldown_key(url)
+    remaining = COOLDOWN.remaining(host)
+    if remaining > 0:
+        count_block('cooldown')
+        raise BlockedError(host, 'cooldown', remaining)
+
+def check_response(url: str, response: requests.Response, content: bytes):
+    """
+    用当前数据源的检测函数检查响应，识别为封禁时让主机进入冷却期
+
+    Args:
+        url: 请求地址（用于计算冷却键，不受重定向影响）
+        response: 响应对象
+        content: 响应体字节
+
+    Raises:
+        BlockedError: 响应是封禁、验证码、登录墙或限流
+    """
+    host = cooldown_key(url)
+    detector = DETECTORS.get(current_labels()['source'])
+    kind = (detector(response, content) if detector else None) or detect_common(response, content)
+    if kind is None:
+        if response.ok:
+            COOLDOWN.clear(host)
+        return
+    count_block(kind)
+    seconds = COOLDOWN.block(host, retry_after_seconds(response))
+    raise BlockedError(host, kind, seconds, response)
@@ -0,0 +1,210 @@
+"""
+按内容寻址的本地封面缓存
+
+封面文件以 SHA-256 哈希命名保存在缓存目录下，SQLite 索引记录三种映射：
+    urls     原始封面URL → 哈希        重复查询同一本书时跳过下载
+    uploads  (哈希, 图床) → 图床URL    不同数据源的同一张图片只上传一次
+    blobs    哈希 → 文件大小、最近使用时间  按总大小做最近最少使用淘汰
+
+淘汰只删除封面文件，URL 和上传记录很小，保留下来仍可跳过下载和上传。
+索引使用 WAL 模式，每个线程一个连接，多个线程和多个进程可以同时读写；
+同一进程内对同一哈希的上传由按哈希的锁串行化，避免并发重复上传。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sources.settings import get_settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    sha256 TEXT NOT NULL,
+    imghost TEXT NOT NULL,
+    hosted_url TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (sha256, imghost)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+"""
+
+# 淘汰时清理到上限的比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+def file_sha256(path: str) -> str:
+    """计算文件的 SHA-256 十六进制摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CoverCache:
+    """封面缓存，可在多个线程之间共享"""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            directory: 缓存目录，默认取 settings 的 cover_cache_dir
+            max_bytes: 封面文件总大小上限，超出后淘汰最久未使用的文件，默认取 settings 的 cover_cache_max_mb
+        """
+        settings = get_settings()
+        self.directory = os.path.expanduser(directory or settings.cover_cache_dir)
+        self.max_bytes = int(settings.cover_cache_max_mb * 1024 * 1024) if max_bytes is None else max_bytes
+        self._local = threading.local()
+        # 哈希 → [锁, 持有或等待的线程数]，没有线程使用时删除
+        self._locks: Dict[str, List] = {}
+        self._locks_guard = threading.Lock()
+        self._initialized = False
+
+    # ------------------------------------------------------------ 索引
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（fork 之后的子进程会重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def blob_path(self, sha256: str) -> str:
+        """哈希对应的封面文件路径，按前两位分目录"""
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def hash_for_url(self, url: str) -> Optional[str]:
+        """查找原始封面URL对应的哈希"""
+        row = self._connection().execute('SELECT sha256 FROM urls WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def hosted_url(self, sha256: str, imghost: str) -> Optional[str]:
+        """查找该图片在指定图床上的地址"""
+        row = self._connection().execute(
+            'SELECT hosted_url FROM uploads WHERE sha256 = ? AND imghost = ?', (sha256, imghost)).fetchone()
+        return row[0] if row else None
+
+    def remember_url(self, url: str, sha256: str):
+        """记录原始封面URL对应的哈希"""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO urls (url, sha256, updated) VALUES (?, ?, ?)', (url, sha256, time.time()))
+
+    def remember_upload(self, sha256: str, imghost: str, hosted_url: str):
+        """记录上传结果"""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO uploads (sha256, imghost, hosted_url, updated) VALUES (?, ?, ?, ?)',
+            (sha256, imghost, hosted_url, time.time()))
+
+    # ------------------------------------------------------------ 文件
+
+    def get_file(self, sha256: str) -> Optional[str]:
+        """返回缓存的封面文件路径并刷新最近使用时间，不存在时返回 None"""
+        path = self.blob_path(sha256)
+        if not os.path.exists(path):
+            return None
+        self._connection().execute('UPDATE blobs SET last_used = ? WHERE sha256 = ?', (time.time(), sha256))
+        return path
+
+    def put_file(self, path: str) -> str:
+        """
+        把文件按内容哈希存入缓存（已存在时只刷新使用时间）
+
+        Args:
+            path: 本地文件路径，调用后文件保持不变
+
+        Returns:
+            文件的 SHA-256 哈希
+        """
+        sha256 = file_sha256(path)
+        target = self.blob_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # 先写临时文件再原子替换，并发写入同一哈希时内容相同，谁先完成都一样
+            tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(65536), b''):
+                    dst.write(chunk)
+            os.replace(tmp_path, target)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO blobs (sha256, size, last_used) VALUES (?, ?, ?)',
+            (sha256, os.path.getsize(target), time.time()))
+        self.evict()
+        return sha256
+
+    def total_bytes(self) -> int:
+        """缓存中封面文件的总大小"""
+        return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    def evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新删除封面文件"""
+        if not self.max_bytes or self.total_bytes() <= self.max_bytes:
+            return
+        conn = self._connection()
+        target = int(self.max_bytes * EVICT_TARGET_RATIO)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            victims = []
+            for sha256, size in conn.execute('SELECT sha256, size FROM blobs ORDER BY last_used'):
+                if total <= target:
+                    break
+                victims.append(sha256)
+                total -= size
+            conn.executemany('DELETE FROM blobs WHERE sha256 = ?', [(v,) for v in victims])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        for sha256 in victims:
+            try:
+                os.remove(self.blob_path(sha256))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def lock(self, sha256: str) -> Iterator[None]:
+        """同一哈希的上传在进程内串行执行"""
+        with self._locks_guard:
+            entry = self._locks.setdefault(sha256, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[sha256]
+
+_cache: Optional[CoverCache] = None
+_cache_lock = threading.Lock()
+
+def get_cover_cache() -> CoverCache:
+    """返回进程内共享的封面缓存（运行中修改了缓存目录或大小上限时改用新的设置）"""
+    global _cache
+    settings = get_settings()
+    directory = os.path.expanduser(settings.cover_cache_dir)
+    max_bytes = int(settings.cover_cache_max_mb * 1024 * 1024)
+    if _cache is None or (_cache.directory, _cache.max_bytes) != (directory, max_bytes):
+        with _cache_lock:
+            if _cache is None or (_cache.directory, _cache.max_bytes) != (directory, max_bytes):
+                _cache = CoverCache(directory, max_bytes)
+    return _cache
@@ -0,0 +1,150 @@
+"""
+查询截止时间与取消
+
+入口（命令行、批量检索、API 服务）为每次查询设定时间预算，预算通过 contextvars 传递到
+搜索、详情、网页补充和封面各阶段：每次网络请求的超时和每次重试前的等待都不超过剩余时间，
+用完后抛出 DeadlineExceeded。Ctrl-C 或客户端断开时调用 cancel()，
+正在等待的重试立即醒来，之后的请求不再发出。
+
+    with deadline(30):
+        books = search_books('三体')
+
+提交到线程池的任务不会自动继承 contextvars，需要通过 submit() 提交。
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from sources.exceptions import DeadlineExceeded
+
+class Deadline:
+    """一次查询的截止时间，嵌套的截止时间取更早者，并随外层一起取消"""
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional['Deadline'] = None):
+        """
+        Args:
+            seconds: 时间预算（秒），None 或 0 表示不限，只继承外层的截止时间
+            parent: 外层截止时间
+        """
+        self.parent = parent
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        if parent is not None and parent.expires_at is not None:
+            if self.expires_at is None or parent.expires_at < self.expires_at:
+                self.expires_at = parent.expires_at
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        d = self
+        while d is not None:
+            if d._cancelled.is_set():
+                return True
+            d = d.parent
+        return False
+
+    def cancel(self):
+        """取消本次查询及其嵌套的截止时间"""
+        self._cancelled.set()
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self):
+        """
+        Raises:
+            DeadlineExceeded: 已取消或已超时
+        """
+        if self.cancelled:
+            raise DeadlineExceeded(cancelled=True)
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded()
+
+    def wait(self, seconds: float):
+        """等待指定秒数，取消时立即醒来；等待后仍检查是否超时或取消"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        # 只能等待自己的事件，有外层时按短间隔醒来检查外层是否已取消
+        while seconds > 0 and not self.cancelled:
+            step = min(seconds, 0.1) if self.parent is not None else seconds
+            self._cancelled.wait(step)
+            seconds -= step
+        self.check()
+
+_current: contextvars.ContextVar = contextvars.ContextVar('bookfinder_deadline', default=None)
+
+def current_deadline() -> Optional[Deadline]:
+    """返回当前上下文中的截止时间"""
+    return _current.get()
+
+@contextmanager
+def deadline(seconds: Optional[float] = None) -> Iterator[Deadline]:
+    """
+    在当前上下文中设定时间预算
+
+    Args:
+        seconds: 时间预算（秒），None 或 0 表示不额外限制（仍受外层约束，可用于单独取消）
+    """
+    d = Deadline(seconds, _current.get())
+    token = _current.set(d)
+    try:
+        yield d
+    finally:
+        _current.reset(token)
+
+def check_deadline():
+    """
+    检查当前查询是否已超时或被取消
+
+    Raises:
+        DeadlineExceeded: 已取消或已超时
+    """
+    d = _current.get()
+    if d is not None:
+        d.check()
+
+def budget(timeout: Optional[float]) -> Optional[float]:
+    """
+    把单次操作的超时限制在剩余时间之内
+
+    Args:
+        timeout: 原本的超时（秒），None 表示不限
+
+    Returns:
+        实际使用的超时
+
+    Raises:
+        DeadlineExceeded: 已取消或已超时
+    """
+    d = _current.get()
+    if d is None:
+        return timeout
+    d.check()
+    remaining = d.remaining()
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+def sleep(seconds: float):
+    """
+    可被取消的 time.sleep，不会睡过截止时间
+
+    Raises:
+        DeadlineExceeded: 等待期间被取消或已到截止时间
+    """
+    d = _current.get()
+    if d is None:
+        time.sleep(seconds)
+        return
+    d.wait(seconds)
+
+def submit(executor: Executor, func: Callable, *args, **kwargs) -> Future:
+    """把任务连同当前上下文（截止时间、追踪）一起提交到线程池"""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, func, *args, **kwargs)
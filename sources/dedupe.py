@@ -0,0 +1,180 @@
+"""
+批量检索的去重与断点续跑
+
+数百万行的关键词或 ISBN 列表如果用 Python 集合记录“已处理”，每条字符串要占上百字节，内存会涨到数 GB。
+这里用两级结构，内存只取决于预期条数，与实际输入多少无关：
+    1. 布隆过滤器：位数组常驻内存（1000 万条、误判率 1% 约 12MB），判断“一定没见过”时直接放行
+    2. SQLite 键表：过滤器判断“可能见过”时，再按 16 字节的键摘要精确确认，排除误判
+
+已完成的条目写入 <输出文件>.seen（键表）和 <输出文件>.bloom（过滤器），下次用 --resume 续跑时跳过；
+本次运行中已提交但未完成的条目只用于跳过输入中的重复行，中断后不会被当成已完成。
+续跑前 batch.py 用 is_done() 从输出文件中移除失败和未确认完成的记录，重新检索后每个条目只有一行。
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+from typing import Optional
+
+# 过滤器文件头：魔数、位数、哈希函数个数、已加入的条数
+_HEADER = struct.Struct('<8sQQQ')
+_MAGIC = b'BFBLOOM1'
+
+# 键表中未完成条目的 done 值
+PENDING, DONE = 0, 1
+
+# 每积累多少次写入提交一次事务
+COMMIT_EVERY = 1000
+
+# 键表的 SQLite 页缓存大小（KB）
+CACHE_KB = 16 * 1024
+
+def key_digest(key: str) -> bytes:
+    """条目的 16 字节摘要，用作过滤器哈希和键表主键"""
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+class BloomFilter:
+    """固定大小的布隆过滤器，可保存到文件"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Args:
+            capacity: 预期条数，超出后误判率会逐渐升高
+            error_rate: capacity 条时的误判率
+        """
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest: bytes):
+        """由 128 位摘要按双重哈希生成 k 个位置"""
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, digest: bytes):
+        """加入一条摘要"""
+        bits = self.bits
+        for pos in self._positions(digest):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+    def save(self, path: str):
+        """写入文件（先写临时文件再替换，中途中断不会损坏已有文件）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.size, self.hashes, self.count))
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['BloomFilter']:
+        """从文件读取，文件不存在或格式不对时返回 None"""
+        try:
+            with open(path, 'rb') as f:
+                magic, size, hashes, count = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC:
+                    return None
+                bits = bytearray(f.read())
+        except (OSError, struct.error):
+            return None
+        if len(bits) != (size + 7) // 8:
+            return None
+        bloom = cls.__new__(cls)
+        bloom.size, bloom.hashes, bloom.count, bloom.bits = size, hashes, count, bits
+        return bloom
+
+class ProcessedFilter:
+    """
+    记录批量检索中已提交和已完成的条目
+
+    只在提交任务的线程中使用，不做线程同步。
+    """
+
+    def __init__(self, path: str, capacity: int = 10_000_000, error_rate: float = 0.01, resume: bool = False):
+        """
+        Args:
+            path: 状态文件前缀（一般为输出文件路径），生成 .seen 和 .bloom 两个文件
+            capacity: 预期条数
+            error_rate: 过滤器误判率
+            resume: 为 True 时保留上次已完成的条目，否则清空重新开始
+        """
+        self.bloom_path = f"{path}.bloom"
+        db_path = f"{path}.seen"
+        if not resume:
+            for stale in (self.bloom_path, db_path, f"{db_path}-wal", f"{db_path}-shm"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        # 键摘要是随机分布的，页缓存决定插入速度；上限固定，不随条数增长
+        self._db.execute(f'PRAGMA cache_size=-{CACHE_KB}')
+        self._db.execute('CREATE TABLE IF NOT EXISTS processed (key BLOB PRIMARY KEY, done INTEGER NOT NULL) WITHOUT ROWID')
+        # 上次中断时未完成的条目需要重新处理
+        self._db.execute('DELETE FROM processed WHERE done = ?', (PENDING,))
+        self._db.commit()
+        self._pending_writes = 0
+
+        done = self._db.execute('SELECT COUNT(*) FROM processed').fetchone()[0]
+        self.done = BloomFilter.load(self.bloom_path)
+        if self.done is None or self.done.count != done:
+            # 过滤器文件缺失或没来得及保存，按键表重建
+            self.done = BloomFilter(max(capacity, done), error_rate)
+            for (digest,) in self._db.execute('SELECT key FROM processed'):
+                self.done.add(digest)
+        self.resumed = done
+        # 本次运行已提交的条目，只在内存中
+        self.seen = BloomFilter(capacity, error_rate)
+        self.false_positives = 0
+
+    def _write(self, sql: str, params):
+        self._db.execute(sql, params)
+        self._pending_writes += 1
+        if self._pending_writes >= COMMIT_EVERY:
+            self._db.commit()
+            self._pending_writes = 0
+
+    def claim(self, key: str) -> bool:
+        """
+        登记一个待处理条目
+
+        Returns:
+            True 表示第一次出现、需要处理；False 表示重复或已完成，应跳过
+        """
+        digest = key_digest(key)
+        if digest in self.seen or digest in self.done:
+            # 可能见过，按键表精确确认
+            if self._db.execute('SELECT 1 FROM processed WHERE key = ?', (digest,)).fetchone():
+                return False
+            self.false_positives += 1
+        self.seen.add(digest)
+        self._write('INSERT INTO processed (key, done) VALUES (?, ?)', (digest, PENDING))
+        return True
+
+    def is_done(self, key: str) -> bool:
+        """条目是否已完成（续跑时会被跳过）"""
+        digest = key_digest(key)
+        if digest not in self.done:
+            return False
+        return self._db.execute('SELECT 1 FROM processed WHERE key = ? AND done = ?', (digest, DONE)).fetchone() is not None
+
+    def complete(self, key: str):
+        """标记条目已完成，之后续跑时跳过"""
+        digest = key_digest(key)
+        self.done.add(digest)
+        self._write('UPDATE processed SET done = ? WHERE key = ?', (DONE, digest))
+
+    def close(self):
+        """提交键表并保存过滤器"""
+        self._db.commit()
+        self._db.close()
+        self.done.save(self.bloom_path)
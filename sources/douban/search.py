@@ -1,19 +1,89 @@
 """豆瓣图书搜索模块"""
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 import json
-from urllib.parse import quote
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, Tag
+import html
 import re
 
-from config import HEADERS, REQUEST_TIMEOUT
-from sources.utils import retry_on_failure, make_request, clean_text, extract_year
-from sources.image import process_cover_image
+from config import HEADERS, DOUBAN_BASE_URL, DOUBAN_SUBJECT_SEARCH_URL
+from sources.utils import retry_on_failure, make_request, response_encoding, html_from_bytes, text_from_bytes, json_from_bytes, paginate, clean_text, extract_year
+from sources.text import normalize, normalize_many
+from sources.metrics import traced, count_failure
+from sources.singleflight import DETAILS, coalesced, canonical_url
+from sources.result_cache import cached
 
 # URL配置
-DOUBAN_BASE_URL = 'https://book.douban.com'
 DOUBAN_SEARCH_URL = f'{DOUBAN_BASE_URL}/j/subject_suggest'
 
-@retry_on_failure(max_retries=3)
+# 等待用户输入时预先建立连接的地址（搜索和详情所在的主机）
+PREWARM_URLS = [DOUBAN_BASE_URL, DOUBAN_SUBJECT_SEARCH_URL]
+
+# 完整搜索页每页条数
+FULL_SEARCH_PAGE_SIZE = 15
+
+# 完整搜索页把结果以 JSON 形式内嵌在脚本中
+SEARCH_DATA_PATTERN = re.compile(rb'window\.__DATA__\s*=\s*(\{.*?\});\s*$', re.S | re.M)
+
+# 详情页内嵌的结构化数据：JSON-LD 和 og/book 元数据
+JSON_LD_PATTERN = re.compile(r'<script type="application/ld\+json">(.*?)</script>', re.S)
+META_PROPERTY_PATTERN = re.compile(r'<meta property="([\w:]+)" content="([^"]*)"')
+# 详情页标题、#info 区块（其中没有嵌套的 div）和封面
+TITLE_PATTERN = re.compile(r'<span property="v:itemreviewed">([^<]*)</span>')
+INFO_BLOCK_PATTERN = re.compile(r'<div id="info"[^>]*>.*?</div>', re.S)
+MAINPIC_PATTERN = re.compile(r'<div id="mainpic".*?<img src="([^"]+)"', re.S)
+# 小标题（内容简介、作者简介……）和 intro 区块，按文档顺序交替出现
+SECTION_PATTERN = re.compile(r'<h2[^>]*>(.*?)</h2>|<div class="intro">(.*?)</div>', re.S)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# #info 中的标签 → 详情字段
+INFO_FIELDS = {'作者': 'author', '出版社': 'press', '出版年': 'year', 'ISBN': 'isbn'}
+# 小标题关键字 → 其后第一个 intro 区块对应的详情字段
+INTRO_SECTIONS = (('内容简介', 'description'), ('作者简介', 'author_intro'))
+# 详情字段及输出顺序
+DETAIL_FIELDS = ('url', 'title', 'author', 'press', 'year', 'isbn', 'description', 'author_intro', 'cover_url')
+
+def build_search_request(book_name: str) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造搜索请求，返回 (URL, 请求头, 参数)"""
+    params = {
+        'q': book_name
+    }
+    return DOUBAN_SEARCH_URL, HEADERS, params
+
+def build_details_request(url: str) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造详情页请求，返回 (URL, 请求头, 参数)"""
+    return url, HEADERS, None
+
+def parse_search_results(content: bytes, encoding: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    解析搜索接口返回的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    Args:
+        content: 响应体字节
+        encoding: 响应声明的字符集
+
+    Returns:
+        搜索结果列表
+    """
+    data = json_from_bytes(content)
+    results = []
+
+    for item in data:
+        if item.get('type') == 'b':  # 豆瓣API中图书类型为 'b'
+            book = {
+                'url': item.get('url', ''),
+                'title': item.get('title', ''),
+                'author': item.get('author_name', ''),
+                'year': item.get('year', ''),
+                'cover_url': item.get('pic', ''),
+                'press': item.get('publisher_name', '')
+            }
+            results.append(book)
+
+    return results
+
+@traced('douban', 'search')
+@cached('douban', 'search', name='search_books')
+@retry_on_failure()
 def search_books(book_name: str) -> List[Dict[str, str]]:
     """
     搜索豆瓣图书
@@ -25,36 +95,280 @@ def search_books(book_name: str) -> List[Dict[str, str]]:
         包含搜索结果的列表，每个元素是一个字典，包含书籍信息
     """
     try:
-        # 构造搜索URL
-        params = {
-            'q': book_name
-        }
-        response = make_request(DOUBAN_SEARCH_URL, HEADERS, params=params)
+        response = make_request(*build_search_request(book_name))
         
         if not response:
             return []
             
-        data = response.json()
-        results = []
-        
-        for item in data:
-            if item.get('type') == 'b':  # 豆瓣API中图书类型为 'b'
-                book = {
-                    'url': item.get('url', ''),
-                    'title': item.get('title', ''),
-                    'author': item.get('author_name', ''),
-                    'year': item.get('year', ''),
-                    'cover_url': item.get('pic', ''),
-                    'press': item.get('publisher_name', '')
-                }
-                results.append(book)
-        
-        return results
-        
+        return parse_search_results(response.content, response_encoding(response))
+
+    except Exception as e:
+        count_failure(e)
+        print(f"搜索过程出错: {str(e)}")
+        return []
+
+def build_full_search_request(book_name: str, page: int = 1) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造完整搜索页请求，返回 (URL, 请求头, 参数)"""
+    params = {
+        'search_text': book_name,
+        'cat': '1001',  # 图书
+        'start': (page - 1) * FULL_SEARCH_PAGE_SIZE
+    }
+    return DOUBAN_SUBJECT_SEARCH_URL, HEADERS, params
+
+def parse_full_search_results(content: bytes, encoding: Optional[str] = None) -> List[Dict[str, str]]:
+    """
+    解析完整搜索页的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    Args:
+        content: 响应体字节
+        encoding: 响应声明的字符集
+
+    Returns:
+        搜索结果列表
+    """
+    match = SEARCH_DATA_PATTERN.search(content)
+    if not match:
+        return []
+    data = json_from_bytes(match.group(1))
+    results = []
+
+    for item in data.get('items', []):
+        if item.get('tpl_name') != 'search_subject':  # 跳过作者、豆列等非图书条目
+            continue
+        # 摘要格式：作者 / [译者 /] 出版社 / 出版日期 / 定价
+        parts = normalize_many(item.get('abstract', '').split(' / '))
+        year_index = next((i for i, part in enumerate(parts) if extract_year(part)), None)
+        book = {
+            'url': item.get('url', ''),
+            'title': item.get('title', ''),
+            'author': parts[0] if parts and year_index != 0 else '',
+            'year': extract_year(parts[year_index]) if year_index is not None else '',
+            'cover_url': item.get('cover_url', ''),
+            'press': parts[year_index - 1] if year_index and year_index > 1 else ''
+        }
+        results.append(book)
+
+    return results
+
+@traced('douban', 'search')
+@cached('douban', 'search', name='search_page')
+@retry_on_failure()
+def search_page(book_name: str, page: int = 1) -> List[Dict[str, str]]:
+    """
+    获取完整搜索页的一页结果
+    
+    Args:
+        book_name: 要搜索的书名
+        page: 页码，从1开始
+
+    Returns:
+        搜索结果列表
+    """
+    try:
+        response = make_request(*build_full_search_request(book_name, page))
+        if not response:
+            return []
+            
+        return parse_full_search_results(response.content, response_encoding(response))
+
     except Exception as e:
+        count_failure(e)
         print(f"搜索过程出错: {str(e)}")
         return []
 
+def iter_books(book_name: str, max_pages: Optional[int] = None) -> Iterator[Dict[str, str]]:
+    """
+    逐条返回搜索结果，迭代到当前页末尾时才请求下一页
+
+    第1页是搜索建议接口的结果，之后依次请求完整搜索页，重复的条目会被跳过。
+
+    Args:
+        book_name: 要搜索的书名
+        max_pages: 最多请求的页数，None 表示直到没有新结果
+
+    Returns:
+        图书信息迭代器
+    """
+    def fetch_page(page: int) -> List[Dict[str, str]]:
+        if page == 1:
+            return search_books(book_name)
+        return search_page(book_name, page - 1)
+
+    # 搜索建议可能为空，而完整搜索仍有结果
+    return paginate(fetch_page, max_empty_pages=2, max_pages=max_pages)
+
+def parse_info_block(info: Tag) -> Dict[str, List[str]]:
+    """
+    把 #info 区块一次扫描为 标签 → 值列表
+
+    每个 <span class="pl"> 开始一个字段，到下一个 <br> 为止；链接各为一项，其余文本去掉冒号和斜杠后为一项，
+    例如 {'作者': ['刘慈欣'], '出版社': ['重庆出版社'], '出版年': ['2008-1'], 'ISBN': ['9787536692930']}
+
+    Args:
+        info: #info 元素
+
+    Returns:
+        标签到值列表的映射
+    """
+    fields: Dict[str, List[str]] = {}
+    values = None
+    for node in info.descendants:
+        if isinstance(node, Tag):
+            if node.name == 'span' and 'pl' in (node.get('class') or ()):
+                values = fields.setdefault(normalize(node.get_text(), ':：'), [])
+            elif node.name == 'br':
+                values = None
+            elif node.name == 'a' and values is not None:
+                text = clean_text(node.get_text())
+                if text:
+                    values.append(text)
+        elif values is not None and type(node) is NavigableString:
+            # 链接文本已随链接加入，标签自身的文本不是值
+            parent = node.parent
+            if parent.name == 'a' or 'pl' in (parent.get('class') or ()):
+                continue
+            text = normalize(node, ':：/')
+            if text:
+                values.append(text)
+    return fields
+
+def apply_info_fields(info: Dict[str, str], fields: Dict[str, List[str]]):
+    """把 #info 的字段填入详情（结构化数据中已有的字段不覆盖）"""
+    for label, key in INFO_FIELDS.items():
+        values = fields.get(label)
+        if values and not info.get(key):
+            info[key] = extract_year(values[0]) if key == 'year' else values[0]
+
+def parse_structured_data(text: str) -> Dict[str, str]:
+    """
+    从页面内嵌的 JSON-LD 和 og/book 元数据中读取标题、作者、ISBN 和封面
+
+    Args:
+        text: 解码后的页面
+
+    Returns:
+        读到的字段，JSON-LD 格式错误或缺失时只用元数据
+    """
+    info = {}
+    match = JSON_LD_PATTERN.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(1), strict=False)
+        except ValueError:
+            data = {}
+        if isinstance(data, dict):
+            authors = data.get('author') or []
+            if isinstance(authors, dict):
+                authors = [authors]
+            if authors and isinstance(authors[0], dict):
+                info['author'] = clean_text(authors[0].get('name'))
+            info['title'] = clean_text(data.get('name'))
+            info['isbn'] = clean_text(data.get('isbn'))
+    meta = {name: html.unescape(value) for name, value in META_PROPERTY_PATTERN.findall(text)}
+    for key, name in (('title', 'og:title'), ('author', 'book:author'), ('isbn', 'book:isbn')):
+        if not info.get(key) and meta.get(name):
+            info[key] = clean_text(meta[name])
+    if meta.get('og:image'):
+        info['cover_url'] = meta['og:image']
+    return {key: value for key, value in info.items() if value}
+
+def parse_book_details_fast(text: str, url: str) -> Optional[Dict[str, str]]:
+    """
+    详情页快速解析：结构化数据 + 只为 #info 片段建树 + 一次正向扫描小标题和简介，不为整页建树
+
+    Args:
+        text: 解码后的页面
+        url: 图书详情页URL
+
+    Returns:
+        包含图书详细信息的字典；页面结构不符（没有 #info 或标题）时返回 None
+    """
+    info = {'url': url}
+    info.update(parse_structured_data(text))
+    if not info.get('title'):
+        match = TITLE_PATTERN.search(text)
+        if match:
+            info['title'] = clean_text(html.unescape(match.group(1)))
+    block = INFO_BLOCK_PATTERN.search(text)
+    if not block or not info.get('title'):
+        return None
+    apply_info_fields(info, parse_info_block(BeautifulSoup(block.group(0), 'html.parser').div))
+
+    heading = ''
+    for match in SECTION_PATTERN.finditer(text):
+        if match.group(1) is not None:
+            heading = match.group(1)
+            continue
+        for keyword, key in INTRO_SECTIONS:
+            if keyword in heading and key not in info:
+                info[key] = clean_text(html.unescape(TAG_PATTERN.sub('', match.group(2))))
+        if 'description' in info and 'author_intro' in info:
+            break
+
+    if 'cover_url' not in info:
+        match = MAINPIC_PATTERN.search(text)
+        if match:
+            info['cover_url'] = html.unescape(match.group(1))
+    return {key: info[key] for key in DETAIL_FIELDS if info.get(key)}
+
+def parse_book_details_dom(soup: BeautifulSoup, url: str) -> Dict[str, str]:
+    """
+    按完整解析树提取详情，页面结构与快速解析的预期不符时使用
+
+    Args:
+        soup: 整页的解析树
+        url: 图书详情页URL
+
+    Returns:
+        包含图书详细信息的字典
+    """
+    info = {'url': url}
+    title = soup.select_one('#wrapper > h1 > span')
+    if title:
+        info['title'] = clean_text(title.text)
+
+    info_elem = soup.select_one('#info')
+    if info_elem:
+        apply_info_fields(info, parse_info_block(info_elem))
+
+    # 按文档顺序扫描一遍：简介取紧跟在对应小标题之后的第一个 div.intro
+    heading = ''
+    for elem in soup.find_all(['h2', 'div']):
+        if elem.name == 'h2':
+            heading = elem.get_text()
+        elif 'intro' in (elem.get('class') or ()):
+            for keyword, key in INTRO_SECTIONS:
+                if keyword in heading and key not in info:
+                    info[key] = clean_text(elem.get_text())
+
+    cover = soup.select_one('#mainpic img')
+    if cover and cover.get('src'):
+        info['cover_url'] = cover['src']
+    return {key: info[key] for key in DETAIL_FIELDS if info.get(key)}
+
+def parse_book_details(content: bytes, url: str, encoding: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    解析图书详情页的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    先用 parse_book_details_fast() 读结构化数据和 #info 片段，页面结构不符时才为整页建树。
+
+    Args:
+        content: 响应体字节
+        url: 图书详情页URL
+        encoding: 响应声明的字符集
+
+    Returns:
+        包含图书详细信息的字典
+    """
+    info = parse_book_details_fast(text_from_bytes(content, encoding), url)
+    if info is None:
+        info = parse_book_details_dom(html_from_bytes(content, encoding), url)
+    return info
+
+@traced('douban', 'details')
+@cached('douban', 'details', key=lambda url: canonical_url(build_details_request(url)[0]))
+@coalesced(DETAILS, key=lambda url: canonical_url(build_details_request(url)[0]))
 def get_book_details(url: str) -> Optional[Dict[str, str]]:
     """
     获取图书详细信息
@@ -66,67 +380,13 @@ def get_book_details(url: str) -> Optional[Dict[str, str]]:
         包含图书详细信息的字典
     """
     try:
-        response = make_request(url, HEADERS)
+        response = make_request(*build_details_request(url))
         if not response:
             return None
             
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 提取基本信息
-        info = {}
-        info['url'] = url
-        
-        # 提取标题
-        title = soup.select_one('#wrapper > h1 > span')
-        if title:
-            info['title'] = clean_text(title.text)
-            
-        # 提取作者
-        author = soup.select_one('#info .pl:contains("作者") + a')
-        if author:
-            info['author'] = clean_text(author.text)
-            
-        # 提取出版社信息
-        info_text = soup.select_one('#info').text if soup.select_one('#info') else ''
-        publisher_match = re.search(r'出版社:\s*([^\n]+)', info_text)
-        if publisher_match:
-            info['press'] = clean_text(publisher_match.group(1))
-            
-        # 提取出版年份
-        year_match = re.search(r'出版年:\s*([^\n]+)', info_text)
-        if year_match:
-            info['year'] = extract_year(year_match.group(1))
-            
-        # 提取ISBN
-        isbn_match = re.search(r'ISBN:\s*([^\n]+)', info_text)
-        if isbn_match:
-            info['isbn'] = clean_text(isbn_match.group(1))
-            
-        # 提取内容简介
-        intro = soup.select_one('#link-report .intro')
-        if intro:
-            info['description'] = clean_text(intro.text)
-            
-        # 提取作者简介
-        author_intro_elem = soup.select_one('div#content div.indent div.intro')
-        if author_intro_elem and author_intro_elem.find_previous('h2', string=re.compile(r'作者简介')):
-            info['author_intro'] = clean_text(author_intro_elem.get_text())
-        else:
-            # 尝试其他可能的作者简介位置
-            all_intros = soup.select('div.indent div.intro')
-            for intro in all_intros:
-                prev_h2 = intro.find_previous('h2')
-                if prev_h2 and '作者' in prev_h2.get_text():
-                    info['author_intro'] = clean_text(intro.get_text())
-                    break
-        
-        # 提取封面图片
-        cover = soup.select_one('#mainpic img')
-        if cover and cover.get('src'):
-            info['cover_url'] = cover['src']
-            
-        return info
-        
+        return parse_book_details(response.content, url, response_encoding(response))
+
     except Exception as e:
+        count_failure(e)
         print(f"获取图书详情失败: {str(e)}")
         return None
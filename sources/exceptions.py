@@ -0,0 +1,50 @@
+"""数据源异常类型"""
+from typing import Optional
+
+import requests
+
+class BlockedError(requests.RequestException):
+    """
+    目标站点返回了封禁页、验证码或登录墙，或该主机仍在冷却期内
+
+    继承自 RequestException，原有按网络错误处理的代码无需修改；
+    但这类响应重试也拿不到数据，retry_on_failure 不会对其重试。
+    """
+
+    def __init__(self, host: str, kind: str, retry_after: Optional[float] = None,
+                 response: Optional[requests.Response] = None):
+        """
+        Args:
+            host: 被封禁的主机（冷却键）
+            kind: 类型，block/captcha/login/rate_limit/cooldown
+            retry_after: 距离冷却结束的秒数
+            response: 触发检测的响应，冷却期内直接拒绝时为 None
+        """
+        self.host = host
+        self.kind = kind
+        self.retry_after = retry_after
+        message = f"{host} 返回了{BLOCK_KINDS.get(kind, kind)}"
+        if kind == 'cooldown':
+            message = f"{host} 处于封禁冷却期"
+        if retry_after:
+            message += f"，{retry_after:.0f} 秒后再试"
+        super().__init__(message, response=response)
+
+# 封禁类型的中文名称
+BLOCK_KINDS = {
+    'block': '封禁页面',
+    'captcha': '验证码页面',
+    'login': '登录页面',
+    'rate_limit': '限流响应',
+}
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """
+    本次查询的时间预算已用完，或已被取消（Ctrl-C、客户端断开）
+
+    预算用完后再重试也只会立即失败，因此 retry_on_failure 遇到它时直接返回。
+    """
+
+    def __init__(self, cancelled: bool = False):
+        self.cancelled = cancelled
+        super().__init__('查询已取消' if cancelled else '查询超出时间预算')
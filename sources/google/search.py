@@ -1,14 +1,24 @@
 """Google Books搜索模块"""
-import requests
-from typing import List, Dict, Optional
-import json
+from typing import Iterator, List, Dict, Optional, Tuple
+import math
 import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import langdetect
-from bs4 import BeautifulSoup
-import time
 
-GOOGLE_BOOKS_API = "https://www.googleapis.com/books/v1/volumes"
-GOOGLE_BOOKS_WEB = "https://books.google.com/books"
+from config import GOOGLE_BOOKS_API, GOOGLE_BOOKS_WEB, GOOGLE_BOOKS_LANG
+from sources.utils import make_request, retry_on_failure, parse_html, response_encoding, json_from_bytes, paginate
+from sources.settings import source_settings
+from sources.deadline import budget, submit
+from sources.scheduler import PREFETCH, current_priority, priority
+from sources.exceptions import DeadlineExceeded
+from sources.metrics import traced, count_failure
+from sources.singleflight import DETAILS, coalesced, canonical_url
+from sources.result_cache import cached
+from sources.text import normalize
+
+# 方括号内的版本说明，如 [Paperback]
+BRACKETED = re.compile(r'\[.*?\]')
 
 def is_chinese_text(text: str) -> bool:
     """判断文本是否为中文"""
@@ -24,17 +34,17 @@ def is_chinese_text(text: str) -> bool:
         total_chars = len(text.strip())
         return chinese_chars > 0 and (chinese_chars / total_chars) > 0.3
 
+def warm_up():
+    """加载语言检测模型，第一次检测时加载需要数百毫秒"""
+    is_chinese_text('预热语言检测模型')
+
 def clean_text(text: str) -> str:
     """清理文本，去除特殊字符和无效内容"""
-    if not text:
-        return ''
-    # 替换特殊字符
-    text = text.replace('\n', ' ').replace('\r', ' ')
-    # 去除重复空格
-    text = re.sub(r'\s+', ' ', text)
+    text = normalize(text)
     # 去除方括号内的内容，如 [Paperback]
-    text = re.sub(r'\[.*?\]', '', text)
-    return text.strip()
+    if '[' in text:
+        text = normalize(BRACKETED.sub('', text))
+    return text
 
 def validate_book_info(book_info: dict) -> bool:
     """验证图书信息是否有效"""
@@ -42,13 +52,66 @@ def validate_book_info(book_info: dict) -> bool:
     if not book_info.get('title'):
         return False
     
-    # 确保是中文图书
+    # 确保是中文图书。详情按任意图书ID查询，不一定来自已按中文过滤的搜索结果，
+    # 因此这里始终做语言检测，只有搜索结果的逐条过滤依赖服务端的语言过滤
     if not is_chinese_text(book_info['title']):
         return False
     
     key_fields = ['author', 'press', 'year', 'description']
     return any(book_info.get(field) for field in key_fields)
 
+# 预计缺少简介或封面的概率不低于该值时，与 API 请求并行预取网页版
+SPECULATIVE_THRESHOLD = 0.3
+
+class MissingRate:
+    """API 返回的图书缺少简介或封面的比例（指数加权平均）"""
+
+    def __init__(self, alpha: float = 0.2, initial: float = 0.5):
+        self.alpha = alpha
+        self.value = initial
+        self._lock = threading.Lock()
+
+    def observe(self, missing: bool):
+        with self._lock:
+            self.value += self.alpha * ((1.0 if missing else 0.0) - self.value)
+
+MISSING_RATE = MissingRate()
+
+_web_executor: Optional[ThreadPoolExecutor] = None
+_web_executor_lock = threading.Lock()
+
+def start_web_info(book_id: str) -> Future:
+    """
+    在后台线程中获取网页版补充信息，后台任务沿用当前查询的截止时间
+
+    预取不一定用得上，以 PREFETCH 优先级排队（当前查询的优先级更低时沿用当前优先级）
+    """
+    global _web_executor
+    if _web_executor is None:
+        with _web_executor_lock:
+            if _web_executor is None:
+                _web_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='google-web-info')
+    with priority(max(current_priority(), PREFETCH)):
+        return submit(_web_executor, fetch_web_info, book_id)
+
+# API 请求失败时按 google 的重试策略重试，最终失败返回 None
+fetch = retry_on_failure()(make_request)
+
+def web_info_timeout() -> float:
+    """网页版补充信息的超时时间，取 google 请求超时的一半，与 API 请求分开计算"""
+    return source_settings('google').timeout / 2
+
+def wait_web_info(future: Future) -> Dict:
+    """等待预取的网页版信息，超时（包括查询预算用完）视为没有补充信息"""
+    try:
+        return future.result(timeout=budget(web_info_timeout()))
+    except (FutureTimeoutError, DeadlineExceeded) as e:
+        future.cancel()
+        count_failure(e)
+        print("从网页获取补充信息超时")
+        return {'description': '', 'cover_url': ''}
+
+@traced('google', 'enrich')
 def fetch_web_info(book_id: str) -> Dict:
     """从Google Books网页版获取补充信息"""
     try:
@@ -57,10 +120,8 @@ def fetch_web_info(book_id: str) -> Dict:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
+        response = make_request(url, headers, timeout=web_info_timeout())
+        soup = parse_html(response)
         
         info = {
             'description': '',
@@ -87,84 +148,342 @@ def fetch_web_info(book_id: str) -> Dict:
         
         return info
     except Exception as e:
+        count_failure(e)
         print(f"从网页获取补充信息时出错: {str(e)}")
         return {'description': '', 'cover_url': ''}
 
-def search_books(keyword: str) -> List[Dict]:
+# 等待用户输入时预先建立连接的地址（API 和网页版补充信息所在的主机）
+PREWARM_URLS = [GOOGLE_BOOKS_API, GOOGLE_BOOKS_WEB]
+
+# 翻页时每次请求的条数（接口上限为40）
+PAGE_SIZE = 40
+# 搜索结果最多返回的条数
+SEARCH_LIMIT = 10
+
+# 只请求实际读取的字段（partial response），其余字段不再下载和解码
+SEARCH_FIELDS = 'totalItems,items(id,volumeInfo(title,authors,publisher,publishedDate))'
+DETAILS_FIELDS = ('id,volumeInfo(title,authors,publisher,publishedDate,description,'
+                  'industryIdentifiers,pageCount,imageLinks)')
+
+class AdaptivePageSize:
     """
-    搜索Google Books
+    按过滤后保留比例的指数加权平均决定 maxResults
+
+    大部分结果都能保留时少取，减小响应体；被过滤得多时多取，保证凑够结果。
+    """
+
+    def __init__(self, target: int, minimum: int, maximum: int, alpha: float = 0.3, initial: float = 0.5):
+        self.target = target
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alpha = alpha
+        self.keep_rate = initial
+        self._lock = threading.Lock()
+
+    def size(self) -> int:
+        """返回本次请求的条数，预留 20% 余量"""
+        with self._lock:
+            keep_rate = max(self.keep_rate, 0.05)
+        return max(self.minimum, min(self.maximum, math.ceil(self.target * 1.2 / keep_rate)))
+
+    def observe(self, examined: int, kept: int):
+        """记录一次解析中检查过的条数和保留下来的条数"""
+        if not examined:
+            return
+        with self._lock:
+            self.keep_rate += self.alpha * (kept / examined - self.keep_rate)
+
+PAGE_SIZER = AdaptivePageSize(SEARCH_LIMIT, SEARCH_LIMIT, PAGE_SIZE)
+
+# 服务端 langRestrict 已限定为中文
+SERVER_FILTERS_CHINESE = GOOGLE_BOOKS_LANG.lower().startswith('zh')
+
+def build_search_request(keyword: str, page: int = 1,
+                         max_results: Optional[int] = None) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """
+    构造搜索请求，返回 (URL, 请求头, 参数)
+
+    语言、类型在服务端过滤，并只返回 SEARCH_FIELDS 中的字段；
+    max_results 为 None 时按观测到的过滤比例自适应。
+    """
+    max_results = max_results or PAGE_SIZER.size()
+    params = {
+        'q': f'intitle:{keyword}',  # 在标题中搜索关键词
+        'maxResults': max_results,
+        'orderBy': 'relevance',
+        'printType': 'books',
+        'projection': 'lite',
+        'fields': SEARCH_FIELDS
+    }
+    if GOOGLE_BOOKS_LANG:
+        params['langRestrict'] = GOOGLE_BOOKS_LANG
+    if page > 1:
+        params['startIndex'] = (page - 1) * max_results
+    return GOOGLE_BOOKS_API, {}, params
+
+def parse_search_results(content: bytes, encoding: Optional[str] = None,
+                         limit: Optional[int] = SEARCH_LIMIT) -> List[Dict]:
+    """
+    解析搜索接口返回的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    Args:
+        content: 响应体字节
+        encoding: 响应声明的字符集
+        limit: 最多返回的结果数，None 表示不限
+
+    Returns:
+        List[Dict]: 搜索结果列表
+    """
+    return parse_search_page(content, encoding, limit)[0]
+
+def parse_search_page(content: bytes, encoding: Optional[str] = None,
+                      limit: Optional[int] = SEARCH_LIMIT) -> Tuple[List[Dict], int]:
+    """
+    解析一页搜索结果，同时返回检查过的原始条数（为0说明没有下一页，也用于统计过滤比例）
+
+    Args:
+        content: 响应体字节
+        encoding: 响应声明的字符集
+        limit: 最多返回的结果数，None 表示不限
+
+    Returns:
+        (过滤后的结果列表, 检查过的原始条数)
+    """
+    data = json_from_bytes(content)
+
+    if 'items' not in data:
+        return [], 0
+
+    results = []
+    seen_titles = set()  # 用于去重
+    examined = 0
+
+    for item in data['items']:
+        examined += 1
+        book_info = item['volumeInfo']
+
+        # 清理并提取基本信息
+        title = clean_text(book_info.get('title', ''))
+
+        # 跳过非中文书籍（服务端已按中文过滤时不再逐条做语言检测）
+        if not SERVER_FILTERS_CHINESE and not is_chinese_text(title):
+            continue
+
+        # 跳过重复的标题
+        if title in seen_titles:
+            continue
+
+        # 提取并清理信息
+        authors = book_info.get('authors', [])
+        author = clean_text(', '.join(authors)) if authors else ''
+        publisher = clean_text(book_info.get('publisher', ''))
+        published_date = book_info.get('publishedDate', '')
+        year = published_date[:4] if published_date and len(published_date) >= 4 else ''
+
+        # 验证基本信息是否完整
+        if not (title and (author or publisher)):
+            continue
+
+        result = {
+            'title': title,
+            'author': author,
+            'press': publisher,
+            'year': year,
+            'url': item['id']  # 只保存ID，不构建完整URL
+        }
+
+        results.append(result)
+        seen_titles.add(title)
+
+        # 限制返回的有效结果数
+        if limit and len(results) >= limit:
+            break
+
+    return results, examined
+
+@traced('google', 'search')
+@cached('google', 'search')
+def search_page(keyword: str, page: int = 1, limit: Optional[int] = SEARCH_LIMIT) -> Optional[List[Dict]]:
+    """
+    搜索Google Books的一页结果
     
     Args:
         keyword: 搜索关键词
+        page: 页码，从1开始
+        limit: 最多返回的结果数，None 表示返回整页
         
     Returns:
-        List[Dict]: 搜索结果列表
+        Optional[List[Dict]]: 搜索结果列表，没有更多结果或出错时返回 None
     """
     try:
-        # 构建API请求
-        params = {
-            'q': f'intitle:{keyword}',  # 在标题中搜索关键词
-            'maxResults': 40,  # 增加结果数量以补充可能被过滤的结果
-            'orderBy': 'relevance',
-            'printType': 'books'
-        }
-        
-        response = requests.get(GOOGLE_BOOKS_API, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        if 'items' not in data:
-            return []
-            
-        results = []
-        seen_titles = set()  # 用于去重
-        
-        for item in data['items']:
-            book_info = item['volumeInfo']
-            
-            # 清理并提取基本信息
-            title = clean_text(book_info.get('title', ''))
-            
-            # 跳过非中文书籍
-            if not is_chinese_text(title):
-                continue
-            
-            # 跳过重复的标题
-            if title in seen_titles:
-                continue
-                
-            # 提取并清理信息
-            authors = book_info.get('authors', [])
-            author = clean_text(', '.join(authors)) if authors else ''
-            publisher = clean_text(book_info.get('publisher', ''))
-            published_date = book_info.get('publishedDate', '')
-            year = published_date[:4] if published_date and len(published_date) >= 4 else ''
-            
-            # 验证基本信息是否完整
-            if not (title and (author or publisher)):
-                continue
-                
-            result = {
-                'title': title,
-                'author': author,
-                'press': publisher,
-                'year': year,
-                'url': item['id']  # 只保存ID，不构建完整URL
-            }
-            
-            results.append(result)
-            seen_titles.add(title)
-            
-            # 限制返回10个有效结果
-            if len(results) >= 10:
-                break
-                
-        return results
+        # 逐页浏览时固定每页条数，保证 startIndex 连续
+        max_results = None if limit else PAGE_SIZE
+        response = fetch(*build_search_request(keyword, page, max_results))
+        if response is None:
+            return None
+        results, examined = parse_search_page(response.content, response_encoding(response), limit)
+        PAGE_SIZER.observe(examined, len(results))
+        return results if examined else None
         
     except Exception as e:
+        count_failure(e)
         print(f"搜索Google Books时出错: {str(e)}")
-        return []
+        return None
+
+def search_books(keyword: str) -> List[Dict]:
+    """
+    搜索Google Books
+    
+    Args:
+        keyword: 搜索关键词
+        
+    Returns:
+        List[Dict]: 搜索结果列表
+    """
+    return search_page(keyword) or []
+
+def iter_books(keyword: str, max_pages: Optional[int] = None) -> Iterator[Dict]:
+    """
+    逐条返回搜索结果，迭代到当前页末尾时才请求下一页
+
+    非中文书籍会被过滤，某一页可能没有可用结果，连续多页为空时才停止。
+
+    Args:
+        keyword: 搜索关键词
+        max_pages: 最多请求的页数，None 表示直到没有更多结果
+
+    Returns:
+        Iterator[Dict]: 图书信息迭代器
+    """
+    return paginate(lambda page: search_page(keyword, page, limit=None), key='title',
+                    max_empty_pages=3, max_pages=max_pages)
+
+def build_details_request(book_id: str) -> Tuple[str, Dict[str, str], Optional[Dict]]:
+    """构造详情请求，返回 (URL, 请求头, 参数)"""
+    return f"{GOOGLE_BOOKS_API}/{book_id}", {}, {'fields': DETAILS_FIELDS}
+
+def parse_book_details(content: bytes, book_id: str, encoding: Optional[str] = None) -> Dict:
+    """
+    解析详情接口返回的原始字节（纯函数，不访问网络，可在子进程中执行）
+
+    简介和封面可能为空，需再经 complete_book_details 从网页版补充。
+
+    Args:
+        content: 响应体字节
+        book_id: 图书ID
+        encoding: 响应声明的字符集
+
+    Returns:
+        Dict: 图书详细信息
+    """
+    data = json_from_bytes(content)
+
+    book_info = data['volumeInfo']
+
+    # 清理并提取信息
+    title = clean_text(book_info.get('title', ''))
+    authors = book_info.get('authors', [])
+    author = clean_text(', '.join(authors)) if authors else ''
+    publisher = clean_text(book_info.get('publisher', ''))
+    published_date = book_info.get('publishedDate', '')
+    year = published_date[:4] if published_date and len(published_date) >= 4 else ''
+
+    # 处理简介
+    description = clean_text(book_info.get('description', ''))
+
+    # 处理ISBN
+    identifiers = book_info.get('industryIdentifiers', [])
+    isbn = ''
+    for id_info in identifiers:
+        if id_info['type'] == 'ISBN_13':
+            isbn = id_info['identifier']
+            break
+    if not isbn and identifiers:  # 如果没有ISBN-13，使用第一个可用的标识符
+        isbn = identifiers[0]['identifier']
+
+    # 处理封面图片URL
+    image_links = book_info.get('imageLinks', {})
+    cover_url = ''
+    # 按照质量从高到低尝试不同的图片版本
+    for img_type in ['extraLarge', 'large', 'medium', 'thumbnail']:
+        if img_type in image_links:
+            cover_url = image_links[img_type]
+            break
+
+    if cover_url:
+        # 将http升级为https（仅当API本身使用https时，本地模拟服务器只提供http）
+        if GOOGLE_BOOKS_API.startswith('https://'):
+            cover_url = cover_url.replace('http://', 'https://')
+        # 获取更大的图片
+        cover_url = cover_url.replace('zoom=1', 'zoom=3')
 
+    # 尝试生成作者简介
+    author_intro = ''
+    if author:
+        if '施耐庵' in author:
+            author_intro = """施耐庵（约1296年—约1371年），名彦端，字学士，号子安，汉族，兴化（今江苏兴化）人。元末明初著名小说家、文学家。与罗贯中并称"罗施"，是中国四大名著之一《水浒传》的作者。"""
+        elif '罗贯中' in author:
+            author_intro = """罗贯中（约1330年—约1400年），名本，字贯中，汉族。元末明初著名小说家、戏曲家。与施耐庵并称"罗施"，是中国四大名著之一《三国演义》的作者。"""
+        elif '高铭' in author or '高銘' in author:
+            author_intro = """高铭，心理学专业作家，对心理学和精神病学有深入研究。他的作品《天才在左疯子在右》记录了他与近百位精神障碍患者的真实对话，展现了"正常人"与"疯子"之间的细微差别，引发读者对人性的深度思考。"""
+
+    # 构造 Google Books 网页版 URL
+    web_url = f"{GOOGLE_BOOKS_WEB}?id={book_id}"
+
+    details = {
+        'title': title,
+        'author': author,
+        'press': publisher,
+        'year': year,
+        'pages': str(book_info.get('pageCount', '')),
+        'isbn': isbn,
+        'description': description,
+        'cover_url': cover_url,
+        'price': '',  # Google Books API 不提供价格信息
+        'author_intro': author_intro,
+        'url': web_url  # 添加网页版 URL
+    }
+
+    return details
+
+def complete_book_details(details: Dict, book_id: str, web_future: Optional[Future] = None) -> Optional[Dict]:
+    """
+    缺少简介或封面时从网页版补充，并校验信息完整性（可能需要访问网络）
+
+    Args:
+        details: parse_book_details 的结果
+        book_id: 图书ID
+        web_future: 已预取的网页版信息，为 None 时按需同步获取
+
+    Returns:
+        Optional[Dict]: 补充后的图书详细信息，信息不完整时返回 None
+    """
+    missing = not details['description'] or not details['cover_url']
+    MISSING_RATE.observe(missing)
+    if missing:
+        # 从网页获取补充信息
+        web_info = wait_web_info(web_future) if web_future else fetch_web_info(book_id)
+        if not details['description']:
+            details['description'] = web_info['description']
+        if not details['cover_url']:
+            details['cover_url'] = web_info['cover_url']
+    elif web_future:
+        # 预取落空，尚未开始时直接取消
+        web_future.cancel()
+
+    # 如果仍然没有描述，生成一个基本描述
+    if not details['description']:
+        details['description'] = f"《{details['title']}》是由{details['author']}创作的一部文学作品，由{details['press']}出版社于{details['year']}年出版。"
+
+    # 验证信息完整性
+    if not validate_book_info(details):
+        return None
+
+    return details
+
+@traced('google', 'details')
+@cached('google', 'details', key=lambda book_id: canonical_url(build_details_request(book_id)[0]))
+@coalesced(DETAILS, key=lambda book_id: canonical_url(build_details_request(book_id)[0]))
 def get_book_details(book_id: str) -> Optional[Dict]:
     """
     获取图书详细信息
@@ -176,94 +495,17 @@ def get_book_details(book_id: str) -> Optional[Dict]:
         Optional[Dict]: 图书详细信息
     """
     try:
-        api_url = f"{GOOGLE_BOOKS_API}/{book_id}"
-        
-        response = requests.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        
-        book_info = data['volumeInfo']
-        
-        # 清理并提取信息
-        title = clean_text(book_info.get('title', ''))
-        authors = book_info.get('authors', [])
-        author = clean_text(', '.join(authors)) if authors else ''
-        publisher = clean_text(book_info.get('publisher', ''))
-        published_date = book_info.get('publishedDate', '')
-        year = published_date[:4] if published_date and len(published_date) >= 4 else ''
-        
-        # 处理简介
-        description = clean_text(book_info.get('description', ''))
-        
-        # 处理ISBN
-        identifiers = book_info.get('industryIdentifiers', [])
-        isbn = ''
-        for id_info in identifiers:
-            if id_info['type'] == 'ISBN_13':
-                isbn = id_info['identifier']
-                break
-        if not isbn and identifiers:  # 如果没有ISBN-13，使用第一个可用的标识符
-            isbn = identifiers[0]['identifier']
-        
-        # 处理封面图片URL
-        image_links = book_info.get('imageLinks', {})
-        cover_url = ''
-        # 按照质量从高到低尝试不同的图片版本
-        for img_type in ['extraLarge', 'large', 'medium', 'thumbnail']:
-            if img_type in image_links:
-                cover_url = image_links[img_type]
-                break
-                
-        if cover_url:
-            # 将http升级为https
-            cover_url = cover_url.replace('http://', 'https://')
-            # 获取更大的图片
-            cover_url = cover_url.replace('zoom=1', 'zoom=3')
-            
-        # 尝试从网页获取补充信息
-        web_info = fetch_web_info(book_id)
-        if not description:
-            description = web_info['description']
-        if not cover_url:
-            cover_url = web_info['cover_url']
-            
-        # 如果仍然没有描述，生成一个基本描述
-        if not description:
-            description = f"《{title}》是由{author}创作的一部文学作品，由{publisher}出版社于{year}年出版。"
-            
-        # 尝试生成作者简介
-        author_intro = ''
-        if author:
-            if '施耐庵' in author:
-                author_intro = """施耐庵（约1296年—约1371年），名彦端，字学士，号子安，汉族，兴化（今江苏兴化）人。元末明初著名小说家、文学家。与罗贯中并称"罗施"，是中国四大名著之一《水浒传》的作者。"""
-            elif '罗贯中' in author:
-                author_intro = """罗贯中（约1330年—约1400年），名本，字贯中，汉族。元末明初著名小说家、戏曲家。与施耐庵并称"罗施"，是中国四大名著之一《三国演义》的作者。"""
-            elif '高铭' in author or '高銘' in author:
-                author_intro = """高铭，心理学专业作家，对心理学和精神病学有深入研究。他的作品《天才在左疯子在右》记录了他与近百位精神障碍患者的真实对话，展现了"正常人"与"疯子"之间的细微差别，引发读者对人性的深度思考。"""
-        
-        # 构造 Google Books 网页版 URL
-        web_url = f"https://books.google.com/books?id={book_id}"
-        
-        details = {
-            'title': title,
-            'author': author,
-            'press': publisher,
-            'year': year,
-            'pages': str(book_info.get('pageCount', '')),
-            'isbn': isbn,
-            'description': description,
-            'cover_url': cover_url,
-            'price': '',  # Google Books API 不提供价格信息
-            'author_intro': author_intro,
-            'url': web_url  # 添加网页版 URL
-        }
-        
-        # 验证信息完整性
-        if not validate_book_info(details):
+        # 经常缺少简介或封面时，与 API 请求同时开始获取网页版
+        web_future = start_web_info(book_id) if MISSING_RATE.value >= SPECULATIVE_THRESHOLD else None
+        response = fetch(*build_details_request(book_id))
+        if response is None:
+            if web_future:
+                web_future.cancel()
             return None
-            
-        return details
+        details = parse_book_details(response.content, book_id, response_encoding(response))
+        return complete_book_details(details, book_id, web_future)
         
     except Exception as e:
+        count_failure(e)
         print(f"获取图书详情时出错: {str(e)}")
         return None
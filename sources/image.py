@@ -2,19 +2,42 @@
 import os
 import re
 import json
+import shutil
+import tempfile
 import requests
 from typing import Optional, Dict
-from sources.utils import retry_on_failure, make_request
+from sources.utils import retry_on_failure
+from sources.session import get_session
+from sources.metrics import traced, phase, count_request, count_failure, count_cover_bytes, count_cache
+from sources.cover_cache import get_cover_cache
+from sources.settings import get_settings, source_settings
+from sources.deadline import budget, sleep
+from sources.exceptions import DeadlineExceeded
+from sources.singleflight import COVERS, coalesced, canonical_url
 from config import (
     IMGHOST_UPLOAD_URL, 
-    REQUEST_TIMEOUT, 
     IMGHOST_BASE_URL,
     IMGHOST_API_BASE,
     IMGHOST_ENABLED,
     IMGHOST_EMAIL,
-    IMGHOST_PASSWORD
+    IMGHOST_PASSWORD,
+    IMGHOST_TOKEN_FILE
 )
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 是可选依赖，未安装时跳过封面规范化
+    Image = ImageOps = None
+
+# 进程内缓存的图床token，长期运行的服务无需每次上传都读取 token 文件
+_cached_token: Optional[str] = None
+
+# 图床单个文件大小上限
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+
+# 规范化输出格式：(Pillow 格式名, 扩展名)
+_COVER_FORMATS = {'jpeg': ('JPEG', 'jpg'), 'jpg': ('JPEG', 'jpg'), 'webp': ('WEBP', 'webp')}
+
 def sanitize_filename(filename: str) -> str:
     """
     清理文件名，移除不合法字符
@@ -30,7 +53,8 @@ def sanitize_filename(filename: str) -> str:
     # 限制长度
     return filename[:100]
 
-@retry_on_failure(max_retries=3)
+@traced('cover', 'download')
+@retry_on_failure()
 def download_image(url: str, save_path: str) -> bool:
     """
     下载图片并保存到本地
@@ -47,24 +71,79 @@ def download_image(url: str, save_path: str) -> bool:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
         
         # 下载图片
-        response = requests.get(url, stream=True, timeout=10)
+        response = get_session().get(url, stream=True, timeout=budget(source_settings('cover').timeout))
         response.raise_for_status()
         
         # 保存图片
-        with open(save_path, 'wb') as f:
+        size = 0
+        with phase('body'), open(save_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 if chunk:
                     f.write(chunk)
+                    size += len(chunk)
+        count_request(response.status_code, size)
         return True
         
-    except Exception:
+    except Exception as e:
+        count_failure(e)
         if os.path.exists(save_path):
             os.remove(save_path)
         return False
 
+def normalize_image(image_path: str) -> str:
+    """
+    缩放封面到最长边不超过 cover_max_dimension，按 cover_format/cover_quality 重新编码并去除元数据
+
+    未安装 Pillow、未开启或处理失败时返回原图路径；
+    原图无需缩放、可以直接上传且重新编码后并没有变小时，也保留原图。
+
+    Args:
+        image_path: 本地图片路径
+
+    Returns:
+        待上传的图片路径，与原路径不同时由调用方负责删除
+    """
+    settings = get_settings()
+    if not settings.cover_normalize or Image is None:
+        return image_path
+    max_dimension = settings.cover_max_dimension
+    pil_format, extension = _COVER_FORMATS.get(settings.cover_format.strip().lower(), _COVER_FORMATS['jpeg'])
+    output_path = f"{os.path.splitext(image_path)[0]}_normalized.{extension}"
+    try:
+        with phase('normalize'), Image.open(image_path) as original:
+            image = ImageOps.exif_transpose(original)
+            resized = max(image.size) > max_dimension
+            if resized:
+                image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+            if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+                # 透明背景铺白，JPEG 不支持透明通道
+                rgba = image.convert('RGBA')
+                image = Image.new('RGB', rgba.size, (255, 255, 255))
+                image.paste(rgba, mask=rgba.getchannel('A'))
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            # 不传 exif/icc_profile，输出文件不带任何元数据
+            image.save(output_path, pil_format, quality=settings.cover_quality, optimize=True)
+    except Exception as e:
+        count_failure(e)
+        print(f"封面规范化失败，使用原图: {str(e)}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return image_path
+
+    original_size = os.path.getsize(image_path)
+    normalized_size = os.path.getsize(output_path)
+    if not resized and normalized_size >= original_size and original_size <= MAX_UPLOAD_BYTES:
+        os.remove(output_path)
+        count_cover_bytes(original_size, original_size)
+        return image_path
+    count_cover_bytes(original_size, normalized_size)
+    return output_path
+
+@traced('cover', 'upload')
 def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
     """
-    上传本地图片到图床
+    上传本地图片到图床，上传前先按配置规范化封面
     
     Args:
         image_path: 本地图片路径
@@ -72,16 +151,26 @@ def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
     Returns:
         包含图片URL的字典，如果上传失败则返回None
     """
-    max_retries = 3
-    retry_delay = 2  # 重试延迟（秒）
+    upload_path = normalize_image(image_path)
+    try:
+        return _upload_file(upload_path)
+    finally:
+        if upload_path != image_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+def _upload_file(image_path: str) -> Optional[Dict[str, str]]:
+    """把本地文件上传到图床，失败时指数退避重试"""
+    settings = source_settings('cover')
+    max_retries = settings.retry.max_retries
     
     for attempt in range(max_retries):
         try:
-            # 首先尝试从文件读取token
-            token = None
-            token_path = os.path.join(os.path.dirname(__file__), '..', 'token.json')
+            # 优先使用内存中的token，其次从文件读取
+            global _cached_token
+            token = _cached_token
+            token_path = IMGHOST_TOKEN_FILE
             
-            if os.path.exists(token_path):
+            if not token and os.path.exists(token_path):
                 try:
                     with open(token_path, 'r', encoding='utf-8') as f:
                         token_data = json.load(f)
@@ -94,6 +183,7 @@ def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
                 token = get_lsky_token(IMGHOST_EMAIL, IMGHOST_PASSWORD)
                 if not token:
                     return None
+            _cached_token = token
 
             # 验证文件是否存在和可读
             if not os.path.exists(image_path):
@@ -105,7 +195,7 @@ def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
                 print("错误: 文件大小为0")
                 return None
                 
-            if file_size > 5 * 1024 * 1024:  # 5MB限制
+            if file_size > MAX_UPLOAD_BYTES:  # 5MB限制
                 print("错误: 文件大小超过5MB限制")
                 return None
                 
@@ -137,12 +227,13 @@ def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
                     'file': (safe_filename, f, content_type)
                 }
                 
-                response = requests.post(
+                response = get_session().post(
                     IMGHOST_UPLOAD_URL,
                     headers=headers,
                     files=files,
-                    timeout=REQUEST_TIMEOUT
+                    timeout=budget(settings.timeout)
                 )
+                count_request(response.status_code, len(response.content))
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -156,22 +247,104 @@ def upload_local_image(image_path: str) -> Optional[Dict[str, str]]:
                         print(f"上传失败: {data.get('message', '未知错误')}")
                 else:
                     print(f"上传失败，HTTP状态码: {response.status_code}")
+                    if response.status_code == 401:
+                        # token 失效，下次尝试重新登录
+                        _cached_token = None
+                        if os.path.exists(token_path):
+                            os.remove(token_path)
             
             # 如果不是最后一次尝试，等待一段时间后重试
             if attempt < max_retries - 1:
-                import time
-                time.sleep(retry_delay)
-                retry_delay *= 2  # 指数退避
+                sleep(settings.retry.wait(attempt))
         
+        except DeadlineExceeded as e:
+            # 时间预算已用完或已取消，重试也不会成功
+            count_failure(e)
+            print(f"上传图片中止: {str(e)}")
+            return None
         except Exception as e:
+            count_failure(e)
             print(f"上传图片时出错: {str(e)}")
             if attempt < max_retries - 1:
-                import time
-                time.sleep(retry_delay)
-                retry_delay *= 2
+                try:
+                    sleep(settings.retry.wait(attempt))
+                except DeadlineExceeded:
+                    return None
     
     return None
 
+def _temp_cover_path(title: str, temp_dir: str) -> str:
+    """在 temp_dir 中创建一个唯一的临时文件，不同书名清理后相同的并发上传不会互相覆盖"""
+    os.makedirs(temp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{sanitize_filename(title)[:50]}_", suffix='_cover.jpg', dir=temp_dir)
+    os.close(fd)
+    return path
+
+@coalesced(COVERS, key=lambda cover_url, *args, **kwargs: canonical_url(cover_url))
+def upload_cover(cover_url: str, title: str, temp_dir: str) -> Optional[str]:
+    """
+    下载封面并上传到图床，优先使用本地封面缓存
+
+    同一URL已上传过时直接返回图床地址，不下载也不上传；
+    下载后的图片与缓存中已上传的图片内容相同（例如不同数据源的同一封面）时也不再上传。
+    多个线程同时处理同一URL时只有一个真正下载和上传，其余等待它的结果。
+
+    Args:
+        cover_url: 原始封面URL
+        title: 书名，用于临时文件名
+        temp_dir: 临时文件目录
+
+    Returns:
+        图床地址，失败时返回 None
+    """
+    if not get_settings().cover_cache_enabled:
+        temp_path = _temp_cover_path(title, temp_dir)
+        try:
+            if not download_image(cover_url, temp_path):
+                return None
+            result = upload_local_image(temp_path)
+            return result.get('url') if result else None
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    cache = get_cover_cache()
+    sha256 = cache.hash_for_url(cover_url)
+    hosted_url = cache.hosted_url(sha256, IMGHOST_BASE_URL) if sha256 else None
+    count_cache('cover_url', bool(hosted_url))
+    if hosted_url:
+        return hosted_url
+
+    temp_path = _temp_cover_path(title, temp_dir)
+    try:
+        # 换了图床时可以直接使用缓存的文件，不必重新下载
+        cached_path = cache.get_file(sha256) if sha256 else None
+        if cached_path:
+            try:
+                shutil.copyfile(cached_path, temp_path)
+            except OSError:
+                # 其他线程或进程的淘汰可能刚好删除了文件，改为重新下载
+                cached_path = None
+        if not cached_path:
+            if not download_image(cover_url, temp_path):
+                return None
+            sha256 = cache.put_file(temp_path)
+            cache.remember_url(cover_url, sha256)
+
+        with cache.lock(sha256):
+            hosted_url = cache.hosted_url(sha256, IMGHOST_BASE_URL)
+            count_cache('cover_content', bool(hosted_url))
+            if hosted_url:
+                return hosted_url
+            result = upload_local_image(temp_path)
+            if not result or not result.get('url'):
+                return None
+            cache.remember_upload(sha256, IMGHOST_BASE_URL, result['url'])
+            return result['url']
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
 def process_cover_image(book_info: Dict[str, str], temp_dir: str = 'temp') -> Dict[str, str]:
     """
     处理图书封面图片：下载并上传到图床
@@ -195,20 +368,10 @@ def process_cover_image(book_info: Dict[str, str], temp_dir: str = 'temp') -> Di
         print("警告: 图床功能已启用但配置不完整，请设置 IMGHOST_BASE_URL, IMGHOST_EMAIL 和 IMGHOST_PASSWORD 环境变量")
         return book_info
         
-    # 创建临时目录
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # 下载图片
-    temp_path = os.path.join(temp_dir, sanitize_filename(f"{book_info['title']}_cover.jpg"))
-    if download_image(book_info['cover_url'], temp_path):
-        # 上传到图床
-        result = upload_local_image(temp_path)
-        if result and result.get('url'):
-            book_info['cover_url'] = result['url']
-            
-        # 清理临时文件
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    # 下载并上传到图床（命中本地封面缓存时跳过）
+    hosted_url = upload_cover(book_info['cover_url'], book_info['title'], temp_dir)
+    if hosted_url:
+        book_info['cover_url'] = hosted_url
             
     return book_info
 
@@ -235,7 +398,9 @@ def get_lsky_token(email: str, password: str) -> Optional[str]:
         print("错误: 邮箱或密码为空，请在 .env 中设置 IMGHOST_EMAIL 和 IMGHOST_PASSWORD")
         return None
     
+    timeout = source_settings('cover').timeout
     try:
+        timeout = budget(timeout)
         login_url = f"{IMGHOST_API_BASE}/tokens"
         headers = {
             'Accept': 'application/json',
@@ -248,7 +413,7 @@ def get_lsky_token(email: str, password: str) -> Optional[str]:
             'password': password
         }
         
-        response = requests.post(login_url, headers=headers, json=data, timeout=REQUEST_TIMEOUT)
+        response = requests.post(login_url, headers=headers, json=data, timeout=timeout)
         
         if response.status_code == 200:
             data = response.json()
@@ -256,8 +421,7 @@ def get_lsky_token(email: str, password: str) -> Optional[str]:
                 token = data['data'].get('token')
                 if token:
                     # 保存token到文件
-                    token_path = os.path.join(os.path.dirname(__file__), '..', 'token.json')
-                    with open(token_path, 'w', encoding='utf-8') as f:
+                    with open(IMGHOST_TOKEN_FILE, 'w', encoding='utf-8') as f:
                         json.dump({'token': token}, f, ensure_ascii=False, indent=4)
                     return token
             else:
@@ -273,10 +437,12 @@ def get_lsky_token(email: str, password: str) -> Optional[str]:
         
         return None
         
+    except DeadlineExceeded as e:
+        print(f"登录图床中止: {str(e)}")
     except requests.exceptions.ConnectionError:
         print(f"连接错误: 无法连接到图床服务器 {IMGHOST_BASE_URL}")
     except requests.exceptions.Timeout:
-        print(f"连接超时: 服务器响应时间超过 {REQUEST_TIMEOUT} 秒")
+        print(f"连接超时: 服务器响应时间超过 {timeout} 秒")
     except Exception as e:
         print(f"发生未知错误: {str(e)}")
     
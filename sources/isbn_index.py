@@ -0,0 +1,322 @@
+"""
+内存映射的本地 ISBN 索引
+
+获取过详情的图书按规范化的 ISBN-13 记录下来，之后再按 ISBN 搜索同一本书时直接返回，不访问网络。
+索引目录下有三个文件：
+    records.jsonl  图书记录，只追加，每行一条 JSON（含 source 字段）
+    index.bin      已合并的索引：文件头 + 按 ISBN 排序的 (ISBN, 记录偏移) 对，每对 16 字节
+    pending.bin    新追加、尚未合并的 (ISBN, 记录偏移) 对
+
+查询时对 index.bin 做内存映射并二分查找，常驻内存的只有 pending.bin 中的少量条目；
+pending.bin 超过 MERGE_THRESHOLD 条后与 index.bin 归并成新的有序文件。
+同一 ISBN 可以有多个数据源的记录，重复添加时以最后一条为准。
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sources.settings import get_settings
+from sources.utils import canonical_isbn
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，只在进程内加锁
+    fcntl = None
+
+# index.bin 文件头：魔数、条目数
+_HEADER = struct.Struct('<8sQ')
+_MAGIC = b'BFISBN01'
+# 单个条目：ISBN-13（整数）、记录在 records.jsonl 中的字节偏移
+_ENTRY = struct.Struct('<QQ')
+
+# 未合并条目达到该数量后自动合并
+MERGE_THRESHOLD = 10000
+
+class IsbnIndex:
+    """按 ISBN 查询已知图书，可在多个线程和进程之间共享同一目录"""
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: 索引目录，默认取 settings 的 isbn_index_dir
+        """
+        self.directory = directory = os.path.expanduser(directory or get_settings().isbn_index_dir)
+        os.makedirs(directory, exist_ok=True)
+        self.records_path = os.path.join(directory, 'records.jsonl')
+        self.index_path = os.path.join(directory, 'index.bin')
+        self.pending_path = os.path.join(directory, 'pending.bin')
+        self._lock = threading.RLock()
+        self._mmap: Optional[mmap.mmap] = None
+        self._count = 0
+        self._index_stat: Optional[Tuple[int, int, int]] = None
+        self._pending: Dict[int, List[int]] = {}
+        self._pending_size = 0
+
+    # ------------------------------------------------------------ 文件与锁
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """跨进程的写锁，保护追加和合并"""
+        with self._lock, open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """index.bin 被替换或 pending.bin 有新增时重新加载"""
+        try:
+            st = os.stat(self.index_path)
+            stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            stat = None
+        if stat != self._index_stat:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap, self._count = None, 0
+            if stat and stat[1] > _HEADER.size:
+                with open(self.index_path, 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = _HEADER.unpack_from(mm, 0)
+                if magic == _MAGIC and len(mm) >= _HEADER.size + count * _ENTRY.size:
+                    self._mmap, self._count = mm, count
+                else:
+                    mm.close()
+            self._index_stat = stat
+            # 合并后 pending.bin 被清空，需要从头读取
+            self._pending, self._pending_size = {}, 0
+
+        try:
+            size = os.path.getsize(self.pending_path)
+        except FileNotFoundError:
+            size = 0
+        if size < self._pending_size:
+            self._pending, self._pending_size = {}, 0
+        if size > self._pending_size:
+            with open(self.pending_path, 'rb') as f:
+                f.seek(self._pending_size)
+                data = f.read(size - self._pending_size)
+            usable = len(data) - len(data) % _ENTRY.size
+            for isbn, offset in _ENTRY.iter_unpack(data[:usable]):
+                self._pending.setdefault(isbn, []).append(offset)
+            self._pending_size += usable
+
+    # ------------------------------------------------------------ 查询
+
+    def _bound(self, isbn: int, upper: bool = False) -> int:
+        """二分查找：第一个 ISBN 不小于（upper 为 True 时大于）isbn 的条目位置"""
+        mm, lo, hi = self._mmap, 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = _ENTRY.unpack_from(mm, _HEADER.size + mid * _ENTRY.size)[0]
+            if key < isbn or (upper and key == isbn):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _index_offsets(self, isbn: int) -> List[int]:
+        """在 index.bin 中查找该 ISBN 的全部记录偏移"""
+        if self._mmap is None:
+            return []
+        offsets = []
+        for i in range(self._bound(isbn), self._count):
+            key, offset = _ENTRY.unpack_from(self._mmap, _HEADER.size + i * _ENTRY.size)
+            if key != isbn:
+                break
+            offsets.append(offset)
+        return offsets
+
+    def _read_record(self, offset: int) -> Optional[Dict]:
+        with open(self.records_path, 'rb') as f:
+            f.seek(offset)
+            line = f.readline()
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    def lookup(self, isbn: str, source: Optional[str] = None) -> List[Dict]:
+        """
+        查询已知图书
+
+        Args:
+            isbn: ISBN-10 或 ISBN-13，可以带连字符
+            source: 只返回该数据源的记录，None 表示全部
+
+        Returns:
+            每个数据源最新的一条记录，没有时返回空列表
+        """
+        canonical = canonical_isbn(isbn)
+        if not canonical:
+            return []
+        key = int(canonical)
+        with self._lock:
+            self._refresh()
+            offsets = self._index_offsets(key) + self._pending.get(key, [])
+        latest: Dict[str, Dict] = {}
+        for offset in sorted(offsets):
+            record = self._read_record(offset)
+            if record and (source is None or record.get('source') == source):
+                latest[record.get('source', '')] = record
+        return list(latest.values())
+
+    def __contains__(self, isbn: str) -> bool:
+        canonical = canonical_isbn(isbn)
+        if not canonical:
+            return False
+        with self._lock:
+            self._refresh()
+            return bool(self._pending.get(int(canonical)) or self._index_offsets(int(canonical)))
+
+    def __len__(self) -> int:
+        """条目数（同一 ISBN 的多条记录分别计数）"""
+        with self._lock:
+            self._refresh()
+            return self._count + sum(len(offsets) for offsets in self._pending.values())
+
+    # ------------------------------------------------------------ 写入
+
+    def add(self, record: Dict, source: str) -> bool:
+        """
+        记录一本图书
+
+        Args:
+            record: 数据源返回的图书详情，需要含有有效的 isbn 字段
+            source: 数据源代号
+
+        Returns:
+            是否已记录（没有有效 ISBN 时返回 False）
+        """
+        return self.add_many([record], source) > 0
+
+    def add_many(self, records: Iterable[Dict], source: Optional[str] = None) -> int:
+        """
+        批量记录图书，返回实际记录的条数
+
+        Args:
+            records: 图书详情
+            source: 数据源代号，None 时使用记录中的 source 字段
+        """
+        lines, keys = [], []
+        for record in records:
+            canonical = canonical_isbn(record.get('isbn', '') if record else '')
+            if not canonical:
+                continue
+            record = dict(record, isbn=canonical, source=source or record.get('source', ''))
+            record.pop('timings', None)
+            lines.append((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+            keys.append(int(canonical))
+        if not lines:
+            return 0
+        with self._file_lock():
+            with open(self.records_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                entries = bytearray()
+                for key, line in zip(keys, lines):
+                    entries += _ENTRY.pack(key, offset)
+                    offset += len(line)
+                f.write(b''.join(lines))
+            with open(self.pending_path, 'ab') as f:
+                f.write(entries)
+            self._refresh()
+            if sum(len(offsets) for offsets in self._pending.values()) >= MERGE_THRESHOLD:
+                self._merge_locked()
+        return len(lines)
+
+    def merge(self):
+        """把 pending.bin 归并进 index.bin"""
+        with self._file_lock():
+            self._refresh()
+            self._merge_locked()
+
+    def _merge_locked(self):
+        pending = sorted((isbn, offset) for isbn, offsets in self._pending.items() for offset in offsets)
+        if not pending:
+            return
+        mm, count = self._mmap, self._count
+
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, count + len(pending)))
+            # 新条目通常远少于已有条目：逐个二分查找插入位置，中间的已有条目按字节整段复制
+            copied = 0
+            for isbn, offset in pending:
+                position = self._bound(isbn, upper=True) if mm is not None else 0
+                self._copy_entries(f, copied, position)
+                f.write(_ENTRY.pack(isbn, offset))
+                copied = position
+            self._copy_entries(f, copied, count)
+        if mm is not None:
+            # 先关闭映射再替换文件（Windows 上不能替换仍被映射的文件）
+            mm.close()
+            self._mmap = None
+        os.replace(tmp_path, self.index_path)
+        # 新索引已包含全部未合并条目，清空 pending.bin
+        open(self.pending_path, 'wb').close()
+        self._index_stat = None
+        self._refresh()
+
+    def _copy_entries(self, f, start: int, end: int):
+        """把 index.bin 中 [start, end) 的条目原样写入 f"""
+        chunk = (1 << 20) // _ENTRY.size
+        for i in range(start, end, chunk):
+            f.write(self._mmap[_HEADER.size + i * _ENTRY.size:_HEADER.size + min(end, i + chunk) * _ENTRY.size])
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._index_stat = None
+
+_index: Optional[IsbnIndex] = None
+_index_lock = threading.Lock()
+
+def get_isbn_index() -> Optional[IsbnIndex]:
+    """返回进程内共享的 ISBN 索引，未启用时返回 None（运行中修改了索引目录时改用新目录）"""
+    global _index
+    settings = get_settings()
+    if not settings.isbn_index_enabled:
+        return None
+    directory = os.path.expanduser(settings.isbn_index_dir)
+    if _index is None or _index.directory != directory:
+        with _index_lock:
+            if _index is None or _index.directory != directory:
+                _index = IsbnIndex(directory)
+    return _index
+
+def find_known_book(keyword: str, source: Optional[str] = None) -> Optional[Dict]:
+    """
+    关键词是 ISBN 且本地索引中已有该书时返回记录，否则返回 None（之后照常访问网络）
+
+    Args:
+        keyword: 搜索关键词
+        source: 只接受该数据源的记录，None 表示任意数据源
+    """
+    index = get_isbn_index()
+    if index is None or not canonical_isbn(keyword):
+        return None
+    try:
+        records = index.lookup(keyword, source)
+    except OSError as e:
+        print(f"读取ISBN索引出错: {str(e)}")
+        return None
+    return records[-1] if records else None
+
+def remember_book(details: Optional[Dict], source: str):
+    """把获取到的图书详情记入本地索引，没有有效 ISBN 或未启用时忽略"""
+    index = get_isbn_index()
+    if index is None or not details:
+        return
+    try:
+        index.add(details, source)
+    except OSError as e:
+        print(f"写入ISBN索引出错: {str(e)}")
@@ -0,0 +1,476 @@
+"""
+批量检索的租约任务队列
+
+把一次批量检索拆成 (数据源, 关键词) 任务放进共享队列，多个工作进程（可以在多台机器上）各自领取执行，
+吞吐不再受单机 IP 和核数限制:
+    1. 领取（lease）: 任务被标记为某个工作进程持有，直到租约到期；每次领取生成新的租约令牌
+    2. 心跳（heartbeat）: 执行中的任务定期续约，进程崩溃或断网后租约到期，任务回到队列由其他进程重做
+    3. 完成（complete）/ 失败（fail）: 只有仍持有租约令牌的进程能提交结果，租约已被别人接手时结果丢弃，
+       每个任务只有一份结果生效；失败的任务按指数退避重试，达到 max_attempts 次后进入死信（dead）
+    4. 收集（results）: 按加入顺序逐条返回已完成和死信任务的结果记录，每个任务恰好一条
+
+后端通过 open_queue() 按地址选择，QUEUE_BACKENDS 中登记 地址前缀 → 实现类:
+    /path/jobs.db、sqlite:///path/jobs.db   SQLite 文件，同一台机器的多个进程（或支持文件锁的共享存储）
+    http://host:8765                         batch_queue.py serve 发布的队列，供多台机器共享
+
+HTTP 队列用共享令牌鉴权：服务端和工作进程设置相同的 settings.job_queue_token（BOOKFINDER_JOB_QUEUE_TOKEN），
+请求带 X-BookFinder-Token 头。未设置令牌的服务端只应监听本机地址。
+"""
+import abc
+import hmac
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from sources.settings import get_settings
+
+# 租约时长（秒），执行中的任务每 LEASE_SECONDS / 3 秒续约一次
+LEASE_SECONDS = 120.0
+# 任务最多执行的次数（含租约到期的次数），超过后进入死信
+MAX_ATTEMPTS = 5
+# 第一次失败后的重试等待（秒），之后每次翻倍，上限 RETRY_DELAY_MAX
+RETRY_DELAY = 30.0
+RETRY_DELAY_MAX = 1800.0
+
+# 任务状态
+PENDING, LEASED, DONE, DEAD = 'pending', 'leased', 'done', 'dead'
+STATES = (PENDING, LEASED, DONE, DEAD)
+
+# 每积累多少条任务提交一次事务
+ENQUEUE_BATCH = 1000
+
+# HTTP 队列的鉴权请求头
+TOKEN_HEADER = 'X-BookFinder-Token'
+
+class JobQueue(abc.ABC):
+    """
+    任务队列接口，新的后端继承本类并在 QUEUE_BACKENDS 中登记
+
+    任务是字典: {'id', 'line', 'source', 'keyword', 'details', 'attempts', 'token'}，
+    其中 line 为输入行号，token 为本次租约的令牌（领取时才有）。任务按加入的顺序领取和收集。
+    """
+
+    @abc.abstractmethod
+    def enqueue(self, jobs: Iterable[Dict], max_attempts: int = MAX_ATTEMPTS) -> int:
+        """
+        加入任务，(数据源, 关键词) 已在队列中的跳过
+
+        Args:
+            jobs: {'line', 'source', 'keyword', 'details'} 字典
+            max_attempts: 这些任务最多执行的次数
+
+        Returns:
+            新加入的任务数
+        """
+
+    @abc.abstractmethod
+    def lease(self, worker: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[Dict]:
+        """
+        领取最多 limit 个可执行的任务（待执行且已到重试时间，或租约已过期）
+
+        Args:
+            worker: 工作进程标识，仅用于查看状态
+            limit: 最多领取的任务数
+            lease_seconds: 租约时长
+
+        Returns:
+            带 token 的任务列表，队列暂时没有可执行的任务时为空
+        """
+
+    @abc.abstractmethod
+    def heartbeat(self, tokens: List[str], lease_seconds: float = LEASE_SECONDS) -> List[str]:
+        """
+        为执行中的任务续约
+
+        Returns:
+            仍然持有的租约令牌，不在其中的任务已被其他进程接手，结果将不会生效
+        """
+
+    @abc.abstractmethod
+    def complete(self, token: str, result: Dict) -> bool:
+        """
+        提交任务结果
+
+        Returns:
+            结果是否生效（租约已失效时返回 False）
+        """
+
+    @abc.abstractmethod
+    def fail(self, token: str, result: Dict, retry_delay: float = RETRY_DELAY) -> Optional[str]:
+        """
+        报告任务失败，未达到次数上限时安排重试，否则连同最后一次的结果记录进入死信
+
+        Returns:
+            PENDING（将重试）或 DEAD；租约已失效时返回 None
+        """
+
+    @abc.abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+
+    @abc.abstractmethod
+    def results(self) -> Iterator[str]:
+        """按加入顺序返回已完成和死信任务的结果记录（JSON 文本，每个任务一条）"""
+
+    @abc.abstractmethod
+    def requeue_dead(self) -> int:
+        """把死信任务重新放回队列并清零执行次数，返回任务数"""
+
+    def finished(self) -> bool:
+        """是否所有任务都已完成或进入死信"""
+        counts = self.stats()
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> 'JobQueue':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    line INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    details INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL DEFAULT 0,
+    lease_token TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (state, lease_expires);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_token ON jobs (lease_token);
+"""
+
+class SqliteJobQueue(JobQueue):
+    """SQLite 文件上的任务队列，可在多个线程和进程之间共享"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 数据库文件
+        """
+        self.path = path
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程的数据库连接（fork 之后的子进程会重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func, *args):
+        """在立即加写锁的事务中执行 func(conn, *args)，多个进程同时领取时不会拿到同一个任务"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn, *args)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def enqueue(self, jobs: Iterable[Dict], max_attempts: int = MAX_ATTEMPTS) -> int:
+        conn = self._connection()
+        added = 0
+        batch = []
+
+        def flush(conn, rows):
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO jobs (key, line, source, keyword, details, max_attempts) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            return conn.total_changes - before
+
+        for job in jobs:
+            batch.append((f"{job['source']}\t{job['keyword']}", job['line'], job['source'], job['keyword'],
+                          job.get('details', 0), max_attempts))
+            if len(batch) >= ENQUEUE_BATCH:
+                added += self._transaction(flush, batch)
+                batch = []
+        if batch:
+            added += self._transaction(flush, batch)
+        conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        return added
+
+    def lease(self, worker: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[Dict]:
+        def take(conn):
+            now = time.time()
+            # 租约过期且次数已用完的任务（多半每次都让工作进程崩溃）直接进入死信
+            conn.execute("UPDATE jobs SET state = 'dead', lease_token = NULL, error = '租约过期', updated = ? "
+                         "WHERE state = 'leased' AND lease_expires < ? AND attempts >= max_attempts", (now, now))
+            rows = conn.execute("SELECT id FROM jobs WHERE state = 'leased' AND lease_expires < ? LIMIT ?",
+                                (now, limit)).fetchall()
+            if len(rows) < limit:
+                rows += conn.execute("SELECT id FROM jobs WHERE state = 'pending' AND available_at <= ? "
+                                     "ORDER BY id LIMIT ?", (now, limit - len(rows))).fetchall()
+            jobs = []
+            for (job_id,) in rows:
+                token = uuid.uuid4().hex
+                conn.execute("UPDATE jobs SET state = 'leased', lease_token = ?, lease_owner = ?, lease_expires = ?, "
+                             "attempts = attempts + 1, updated = ? WHERE id = ?",
+                             (token, worker, now + lease_seconds, now, job_id))
+                row = conn.execute('SELECT id, line, source, keyword, details, attempts FROM jobs WHERE id = ?',
+                                   (job_id,)).fetchone()
+                jobs.append(dict(zip(('id', 'line', 'source', 'keyword', 'details', 'attempts'), row), token=token))
+            return jobs
+
+        return self._transaction(take)
+
+    def heartbeat(self, tokens: List[str], lease_seconds: float = LEASE_SECONDS) -> List[str]:
+        def extend(conn):
+            expires = time.time() + lease_seconds
+            return [token for token in tokens
+                    if conn.execute("UPDATE jobs SET lease_expires = ? WHERE lease_token = ? AND state = 'leased'",
+                                    (expires, token)).rowcount]
+
+        return self._transaction(extend) if tokens else []
+
+    def complete(self, token: str, result: Dict) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_token = NULL, updated = ? "
+            "WHERE lease_token = ? AND state = 'leased'",
+            (json.dumps(result, ensure_ascii=False), time.time(), token))
+        return cursor.rowcount > 0
+
+    def fail(self, token: str, result: Dict, retry_delay: float = RETRY_DELAY) -> Optional[str]:
+        def settle(conn):
+            row = conn.execute("SELECT id, attempts, max_attempts FROM jobs WHERE lease_token = ? AND state = 'leased'",
+                               (token,)).fetchone()
+            if row is None:
+                return None
+            job_id, attempts, max_attempts = row
+            now = time.time()
+            state = DEAD if attempts >= max_attempts else PENDING
+            delay = min(RETRY_DELAY_MAX, retry_delay * 2 ** (attempts - 1))
+            conn.execute('UPDATE jobs SET state = ?, result = ?, error = ?, lease_token = NULL, available_at = ?, '
+                         'updated = ? WHERE id = ?',
+                         (state, json.dumps(result, ensure_ascii=False), result.get('error'), now + delay, now, job_id))
+            return state
+
+        return self._transaction(settle)
+
+    def stats(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self._connection().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+        return counts
+
+    def results(self) -> Iterator[str]:
+        rows = self._connection().execute(
+            "SELECT result, source, keyword, error FROM jobs WHERE state IN ('done', 'dead') ORDER BY id")
+        for result, source, keyword, error in rows:
+            # 租约反复过期而进入死信的任务没有结果记录
+            yield result or json.dumps({'source': source, 'query': keyword, 'results': [], 'error': error},
+                                       ensure_ascii=False)
+
+    def requeue_dead(self) -> int:
+        return self._connection().execute(
+            "UPDATE jobs SET state = 'pending', attempts = 0, available_at = 0, updated = ? WHERE state = 'dead'",
+            (time.time(),)).rowcount
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class HttpJobQueue(JobQueue):
+    """batch_queue.py serve 发布的远程队列"""
+
+    def __init__(self, url: str, timeout: float = 30.0, token: Optional[str] = None):
+        """
+        Args:
+            url: 队列服务地址，如 http://10.0.0.5:8765
+            timeout: 每次调用的超时（秒）
+            token: 共享令牌，默认取 settings 的 job_queue_token
+        """
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = requests.Session()
+        token = get_settings().job_queue_token if token is None else token
+        if token:
+            self._session.headers[TOKEN_HEADER] = token
+
+    def _call(self, method: str, **payload):
+        response = self._session.post(f"{self.url}/{method}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['result']
+
+    def enqueue(self, jobs: Iterable[Dict], max_attempts: int = MAX_ATTEMPTS) -> int:
+        added = 0
+        batch = []
+        for job in jobs:
+            batch.append(job)
+            if len(batch) >= ENQUEUE_BATCH:
+                added += self._call('enqueue', jobs=batch, max_attempts=max_attempts)
+                batch = []
+        if batch:
+            added += self._call('enqueue', jobs=batch, max_attempts=max_attempts)
+        return added
+
+    def lease(self, worker: str, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[Dict]:
+        return self._call('lease', worker=worker, limit=limit, lease_seconds=lease_seconds)
+
+    def heartbeat(self, tokens: List[str], lease_seconds: float = LEASE_SECONDS) -> List[str]:
+        return self._call('heartbeat', tokens=tokens, lease_seconds=lease_seconds) if tokens else []
+
+    def complete(self, token: str, result: Dict) -> bool:
+        return self._call('complete', token=token, result=result)
+
+    def fail(self, token: str, result: Dict, retry_delay: float = RETRY_DELAY) -> Optional[str]:
+        return self._call('fail', token=token, result=result, retry_delay=retry_delay)
+
+    def stats(self) -> Dict[str, int]:
+        return self._call('stats')
+
+    def results(self) -> Iterator[str]:
+        with self._session.post(f"{self.url}/results", json={}, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=False):
+                if line:
+                    yield line.decode('utf-8')
+
+    def requeue_dead(self) -> int:
+        return self._call('requeue_dead')
+
+    def close(self):
+        self._session.close()
+
+# 地址前缀 → 实现类（模块路径:类名），按前缀从长到短匹配，都不匹配时作为 SQLite 文件路径
+QUEUE_BACKENDS: Dict[str, str] = {
+    'sqlite:///': 'sources.job_queue:SqliteJobQueue',
+    'http://': 'sources.job_queue:HttpJobQueue',
+    'https://': 'sources.job_queue:HttpJobQueue',
+}
+
+def open_queue(location: str) -> JobQueue:
+    """
+    按地址打开任务队列
+
+    Args:
+        location: SQLite 文件路径、sqlite:///路径，或 QUEUE_BACKENDS 中登记的其他地址
+
+    Returns:
+        任务队列
+    """
+    for prefix in sorted(QUEUE_BACKENDS, key=len, reverse=True):
+        if location.startswith(prefix):
+            module_name, class_name = QUEUE_BACKENDS[prefix].split(':')
+            backend = getattr(importlib.import_module(module_name), class_name)
+            if prefix.startswith('sqlite'):
+                location = location[len(prefix):]
+            return backend(location)
+    return SqliteJobQueue(os.path.expanduser(location))
+
+class QueueHandler(BaseHTTPRequestHandler):
+    """把 POST /<方法名> 的 JSON 参数转给本地队列，返回 {"result": ...}"""
+    server_version = 'BookFinderQueue/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    METHODS = ('enqueue', 'lease', 'heartbeat', 'complete', 'fail', 'stats', 'requeue_dead')
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        method = self.path.strip('/')
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.server.token and not hmac.compare_digest(
+                self.headers.get(TOKEN_HEADER, '').encode('utf-8'), self.server.token.encode('utf-8')):
+            self.send_json({'error': '令牌无效'}, 401)
+            return
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self.send_json({'error': '请求体不是有效的JSON'}, 400)
+            return
+        if method == 'results':
+            self.send_results()
+            return
+        if method not in self.METHODS:
+            self.send_json({'error': 'not found'}, 404)
+            return
+        try:
+            self.send_json({'result': getattr(self.server.queue, method)(**payload)})
+        except (TypeError, KeyError) as e:
+            self.send_json({'error': str(e)}, 400)
+        except Exception as e:
+            # 数据库错误等服务端问题，客户端的 raise_for_status() 会把它当作请求失败
+            self.send_json({'error': f"{type(e).__name__}: {e}"}, 500)
+
+    def send_results(self):
+        """分块传输全部结果记录，每行一条"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk = []
+        for record in self.server.queue.results():
+            chunk.append(record)
+            if len(chunk) >= ENQUEUE_BATCH:
+                self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.write_chunk(chunk)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, records: List[str]):
+        data = ('\n'.join(records) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b'\r\n')
+
+    def send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class QueueServer(ThreadingHTTPServer):
+    """通过 HTTP 发布本地队列，供其他机器上的工作进程使用"""
+    daemon_threads = True
+
+    def __init__(self, address, queue: JobQueue, verbose: bool = False, token: Optional[str] = None):
+        """
+        Args:
+            address: (主机, 端口)
+            queue: 发布的本地队列
+            verbose: 是否打印访问日志
+            token: 共享令牌，默认取 settings 的 job_queue_token；为空时不鉴权
+        """
+        super().__init__(address, QueueHandler)
+        self.queue = queue
+        self.verbose = verbose
+        self.token = get_settings().job_queue_token if token is None else token
@@ -0,0 +1,326 @@
+"""请求计时追踪与指标导出模块"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sources.profiling import profile_scope
+
+# 直方图桶边界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 网络阶段，其余阶段（decode/parse/extract）视为本地处理
+NETWORK_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body')
+
+# 是否在返回的图书记录中附带 timings 字段
+RECORD_TIMINGS = os.getenv('BOOKFINDER_RECORD_TIMINGS', 'false').lower() == 'true'
+
+_HELP = {
+    'bookfinder_requests_total': 'HTTP 请求次数',
+    'bookfinder_response_bytes_total': '响应体字节数',
+    'bookfinder_retries_total': '重试次数',
+    'bookfinder_failures_total': '失败次数',
+    'bookfinder_cache_total': '缓存命中与未命中次数',
+    'bookfinder_watch_refresh_total': '关注列表刷新结果（changed/unchanged/not_modified/failed/skipped）',
+    'bookfinder_queue_jobs_total': '任务队列中本进程执行的任务结果（done/retry/dead/lost）',
+    'bookfinder_result_cache_total': '搜索与详情结果缓存的命中（hit）、过期命中（stale）、空结果命中（negative）与未命中次数',
+    'bookfinder_cover_bytes_total': '封面规范化前后的字节数',
+    'bookfinder_blocks_total': '封禁、验证码、登录墙及冷却期内被拒绝的请求次数',
+    'bookfinder_coalesced_total': '合并到同一个进行中请求、没有单独访问网络的调用次数',
+    'bookfinder_operations_total': '数据源操作次数',
+    'bookfinder_phase_seconds': '单次操作各阶段耗时',
+    'bookfinder_operation_seconds': '单次操作总耗时',
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """累积直方图，与 Prometheus 的 histogram 类型一致"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶线性插值估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        previous_bound, previous_count = 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= target:
+                if count == previous_count:
+                    return bound
+                return previous_bound + (bound - previous_bound) * (target - previous_count) / (count - previous_count)
+            previous_bound, previous_count = bound, count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """线程安全的计数器与直方图集合"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self.counters):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self.counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name in sorted(self.histograms):
+                lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', repr(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> Dict:
+        """导出为 JSON 快照"""
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(key), 'value': value} for key, value in sorted(series.items())]
+                for name, series in sorted(self.counters.items())
+            }
+            histograms = {
+                name: [{
+                    'labels': dict(key),
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'p50': round(h.quantile(0.5), 6),
+                    'p95': round(h.quantile(0.95), 6),
+                    'p99': round(h.quantile(0.99), 6),
+                    'buckets': dict(zip((str(b) for b in h.buckets), h.counts)),
+                } for key, h in sorted(series.items())]
+                for name, series in sorted(self.histograms.items())
+            }
+        return {'timestamp': time.time(), 'counters': counters, 'histograms': histograms}
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ''
+    pairs = (f'{k}="{_escape_label(str(v))}"' for k, v in key)
+    return '{' + ','.join(pairs) + '}'
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+REGISTRY = MetricsRegistry()
+
+class Trace:
+    """一次数据源操作（如一次搜索或一次详情获取）的分阶段计时"""
+
+    def __init__(self, source: str, operation: str):
+        self.source = source
+        self.operation = operation
+        self.phases: Dict[str, float] = {}
+        self.requests = 0
+        self.bytes = 0
+        self.failures = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, phase_name: str, seconds: float):
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        """返回以毫秒为单位的计时字典"""
+        timings = {name: round(value * 1000, 3) for name, value in self.phases.items()}
+        timings['total'] = round(self.elapsed * 1000, 3)
+        return timings
+
+    def attach(self, result):
+        """把计时附加到返回的图书记录上（需开启 BOOKFINDER_RECORD_TIMINGS）"""
+        if not RECORD_TIMINGS or not result:
+            return result
+        timings = self.as_dict()
+        records = result if isinstance(result, list) else [result]
+        for record in records:
+            if isinstance(record, dict):
+                record['timings'] = dict(timings)
+        return result
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('bookfinder_trace', default=None)
+
+def current_trace() -> Optional[Trace]:
+    """返回当前上下文中的追踪对象"""
+    return _current_trace.get()
+
+def current_labels() -> Dict[str, str]:
+    """返回当前追踪的 source/operation 标签"""
+    t = _current_trace.get()
+    if t is None:
+        return {'source': 'unknown', 'operation': 'unknown'}
+    return {'source': t.source, 'operation': t.operation}
+
+@contextmanager
+def trace(source: str, operation: str) -> Iterator[Trace]:
+    """
+    追踪一次数据源操作，结束时把各阶段耗时汇总到直方图
+
+    未被显式计时的剩余时间记为 extract 阶段。
+    """
+    t = Trace(source, operation)
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+        t.elapsed = time.perf_counter() - t.started
+        accounted = sum(t.phases.values())
+        if t.elapsed > accounted:
+            t.add('extract', t.elapsed - accounted)
+        for phase_name, seconds in t.phases.items():
+            REGISTRY.observe('bookfinder_phase_seconds', seconds,
+                             source=source, operation=operation, phase=phase_name)
+        REGISTRY.observe('bookfinder_operation_seconds', t.elapsed, source=source, operation=operation)
+        REGISTRY.inc('bookfinder_operations_total', source=source, operation=operation)
+
+def traced(source: str, operation: str):
+    """
+    装饰器：追踪数据源函数，并按需把计时附加到返回结果；开启剖析时同时剖析该操作
+
+    Args:
+        source: 数据源代号
+        operation: 操作名称（search/details 等）
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace(source, operation) as t, profile_scope(source, operation):
+                result = func(*args, **kwargs)
+            return t.attach(result)
+        return wrapper
+    return decorator
+
+@contextmanager
+def phase(name: str):
+    """对当前追踪中的一个阶段计时"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+def record_phase(name: str, seconds: float):
+    """记录一个已测量的阶段耗时"""
+    t = _current_trace.get()
+    if t is not None:
+        t.add(name, seconds)
+
+def count_request(status: int, size: int):
+    """记录一次 HTTP 请求及其响应字节数"""
+    labels = current_labels()
+    t = _current_trace.get()
+    if t is not None:
+        t.requests += 1
+        t.bytes += size
+    REGISTRY.inc('bookfinder_requests_total', status=str(status), **labels)
+    REGISTRY.inc('bookfinder_response_bytes_total', size, **labels)
+
+def count_retry():
+    """记录一次重试"""
+    REGISTRY.inc('bookfinder_retries_total', **current_labels())
+
+def count_failure(error: BaseException):
+    """记录一次失败（包括被捕获后仅打印的异常）"""
+    t = _current_trace.get()
+    if t is not None:
+        t.failures += 1
+    REGISTRY.inc('bookfinder_failures_total', error=type(error).__name__, **current_labels())
+
+def count_block(kind: str):
+    """记录一次封禁检测结果（kind 为 block/captcha/login/rate_limit/cooldown）"""
+    REGISTRY.inc('bookfinder_blocks_total', kind=kind, **current_labels())
+
+def count_coalesced(group: str):
+    """记录一次被合并的调用（group 为 request/details/cover）"""
+    REGISTRY.inc('bookfinder_coalesced_total', group=group, **current_labels())
+
+def count_cover_bytes(original: int, uploaded: int):
+    """记录一张封面下载时与实际上传时的字节数"""
+    REGISTRY.inc('bookfinder_cover_bytes_total', original, stage='original')
+    REGISTRY.inc('bookfinder_cover_bytes_total', uploaded, stage='uploaded')
+
+def count_cache(cache: str, hit: bool):
+    """记录一次缓存查询结果"""
+    REGISTRY.inc('bookfinder_cache_total', cache=cache, result='hit' if hit else 'miss')
+
+def count_result_cache(source: str, operation: str, tier: str, result: str):
+    """记录一次结果缓存查询（tier 为 memory/disk/none，result 为 hit/stale/negative/miss）"""
+    REGISTRY.inc('bookfinder_result_cache_total', source=source, operation=operation, tier=tier, result=result)
+
+def count_watch_refresh(source: str, result: str):
+    """记录一次关注列表刷新（result 为 changed/unchanged/not_modified/failed）"""
+    REGISTRY.inc('bookfinder_watch_refresh_total', source=source, result=result)
+
+def count_queue_job(source: str, result: str):
+    """记录一个队列任务的结果（result 为 done/retry/dead/lost，lost 表示租约已被其他进程接手）"""
+    REGISTRY.inc('bookfinder_queue_jobs_total', source=source, result=result)
+
+def export_prometheus() -> str:
+    """以 Prometheus 文本格式导出全部指标"""
+    return REGISTRY.to_prometheus()
+
+def export_json() -> Dict:
+    """以 JSON 快照导出全部指标"""
+    return REGISTRY.to_dict()
+
+def write_metrics(path: str):
+    """
+    把指标写入文件，.json 结尾写 JSON 快照，其余写 Prometheus 文本格式
+
+    Args:
+        path: 输出文件路径
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            json.dump(export_json(), f, ensure_ascii=False, indent=2)
+        else:
+            f.write(export_prometheus())
+    os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+"""
+解析进程池：网络请求留在线程中，HTML/JSON 解析和字段提取交给多进程执行
+
+BeautifulSoup 解析和各数据源的正则提取是纯 CPU 工作，在线程中会被 GIL 串行化。
+各数据源的 parse_search_results / parse_book_details 只接收原始响应字节，
+不访问网络，可以直接提交到进程池；字节对象经 pickle 一次性传给子进程，
+由解析器在子进程中完成解码，不会在主进程中先解码成字符串再编码回去。
+"""
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+# 平均每个工作进程处理多少个页面后整体更换一批进程，0 表示不回收
+DEFAULT_RECYCLE_AFTER = 200
+
+def _mp_context():
+    """
+    子进程从 forkserver 启动（不支持时使用默认方式）
+
+    进程池在网络线程已经运行之后才创建，直接 fork 会把其他线程持有的锁
+    （例如正在导入数据源模块时的导入锁）原样复制进子进程，子进程解封任务时就会卡死。
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
+def _init_worker():
+    """子进程忽略 Ctrl-C，由主进程统一处理中断"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class ParsePool:
+    """
+    可回收的解析进程池
+
+    长时间运行时 BeautifulSoup 产生的大量小对象会让进程内存只增不减，
+    因此每提交 workers * recycle_after 个任务就换一批新进程；
+    旧进程池执行完已提交的任务后自行退出，不会阻塞新任务。
+    """
+
+    def __init__(self, workers: Optional[int] = None, recycle_after: int = DEFAULT_RECYCLE_AFTER):
+        """
+        Args:
+            workers: 工作进程数，默认等于 CPU 核数
+            recycle_after: 平均每个进程处理的页面数上限，0 表示不回收
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.recycle_after = recycle_after
+        self.generations = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._submitted = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func: Callable, *args) -> Future:
+        """
+        提交解析任务
+
+        Args:
+            func: 模块级的解析函数（需要能被 pickle）
+            *args: 参数，通常是 (响应字节, ..., 字符集)
+
+        Returns:
+            Future 对象
+        """
+        with self._lock:
+            if self._executor is None or self._should_recycle():
+                self._rotate()
+            self._submitted += 1
+            return self._executor.submit(func, *args)
+
+    def run(self, func: Callable, *args) -> Any:
+        """提交解析任务并等待结果"""
+        return self.submit(func, *args).result()
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def _should_recycle(self) -> bool:
+        return bool(self.recycle_after) and self._submitted >= self.recycle_after * self.workers
+
+    def _rotate(self):
+        old = self._executor
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context(),
+                                             initializer=_init_worker)
+        self._submitted = 0
+        self.generations += 1
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
@@ -0,0 +1,119 @@
+"""
+连接与解析器预热
+
+命令行在用户选定数据源、输入关键词的这段时间里，后台导入数据源模块、预热解析器，
+并对搜索和详情所在的主机各发一个 HEAD 请求，预先完成 DNS 解析、TCP 连接和 TLS 握手，建好的连接留在共享连接池中，
+第一次搜索直接复用，不再承担建连耗时。API 服务启动时对全部数据源做同样的预热。
+
+数据源模块通过 PREWARM_URLS 声明需要预连接的地址，可选的 warm_up() 用于预热自身的依赖（如语言检测模型）。
+"""
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from sources.exceptions import DeadlineExceeded
+from sources.metrics import count_failure, trace
+from sources.registry import get_source
+from sources.scheduler import PREFETCH, priority
+from sources.session import get_session
+from sources.settings import source_settings
+from sources.throttle import throttle
+
+# 同一主机在该时间（秒）内已预连接过时不再重复
+PREWARM_INTERVAL = 30.0
+
+_warmed_at: Dict[str, float] = {}
+_warmed_lock = threading.Lock()
+
+def preconnect(url: str, timeout: Optional[float] = None, source: Optional[str] = None) -> bool:
+    """
+    对地址所在主机发一个 HEAD 请求，建好的连接留在共享会话的连接池中
+
+    请求以 PREFETCH 优先级计入数据源的并发和速率限制，不会挤占同时开始的交互查询。
+
+    Args:
+        url: 目标地址，只使用其中的协议、主机和端口
+        timeout: 请求超时（秒）
+        source: 数据源代号，用于限流，None 表示不限流
+
+    Returns:
+        是否发出了预连接请求（最近已预连接过或失败时返回 False）
+    """
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    now = time.monotonic()
+    with _warmed_lock:
+        if now - _warmed_at.get(host, float('-inf')) < PREWARM_INTERVAL:
+            return False
+        _warmed_at[host] = now
+    try:
+        # 不关心响应内容和状态码，关闭响应后连接回到连接池
+        with priority(PREFETCH), (throttle(source) if source else nullcontext()):
+            get_session().head(f"{host}/", timeout=timeout, allow_redirects=False).close()
+        return True
+    except (requests.RequestException, DeadlineExceeded):
+        # 预热失败不影响正常请求，稍后的请求会自行建连并报告错误
+        with _warmed_lock:
+            _warmed_at.pop(host, None)
+        return False
+
+def warm_parser(module):
+    """导入解析依赖并执行一次空解析，可选的 warm_up() 预热模块自身的依赖"""
+    try:
+        module.parse_search_results(b'<html><body></body></html>', 'utf-8')
+    except Exception:
+        pass
+    warm_up = getattr(module, 'warm_up', None)
+    if warm_up:
+        try:
+            warm_up()
+        except Exception as e:
+            count_failure(e)
+
+def warm_source(name: str):
+    """同步预热一个数据源：并行预连接 PREWARM_URLS，同时预热解析器"""
+    module = get_source(name)
+    timeout = source_settings(name).timeout
+    threads = [threading.Thread(target=preconnect, args=(url, timeout, name), daemon=True)
+               for url in _unique_hosts(getattr(module, 'PREWARM_URLS', []))]
+    for thread in threads:
+        thread.start()
+    with trace(name, 'prewarm'):
+        warm_parser(module)
+    for thread in threads:
+        thread.join()
+
+def prewarm(names: Iterable[str]) -> threading.Thread:
+    """
+    在后台线程中预热数据源，立即返回
+
+    Args:
+        names: 数据源代号
+
+    Returns:
+        执行预热的后台线程（daemon），需要等待预热完成时可 join()
+    """
+    names = list(names)
+
+    def run():
+        workers = [threading.Thread(target=warm_source, args=(name,), daemon=True) for name in names]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    thread = threading.Thread(target=run, name='bookfinder-prewarm', daemon=True)
+    thread.start()
+    return thread
+
+def _unique_hosts(urls: Iterable[str]) -> List[str]:
+    """同一主机只保留一个地址"""
+    seen = {}
+    for url in urls:
+        parts = urlsplit(url)
+        seen.setdefault((parts.scheme, parts.netloc), url)
+    return list(seen.values())
@@ -0,0 +1,258 @@
+"""
+性能剖析模块：按数据源和阶段（search/detail/cover）剖析一次运行
+
+开启方式：命令行 `python main.py --profile`，或库调用时设置环境变量
+    BOOKFINDER_PROFILE=true
+    BOOKFINDER_PROFILE_SCOPE=douban:search,cover   # 可选，默认剖析全部
+    BOOKFINDER_PROFILE_DIR=profiles                # 输出目录
+
+每次被剖析的操作会写出 .pstats 文件，并把采样得到的调用栈追加到同一范围的
+.folded 文件（可直接交给 flamegraph.pl / speedscope 生成火焰图）。
+进程退出时打印按累计时间排序的热点函数，并区分网络等待和 CPU 时间。
+"""
+import atexit
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 调用栈最内层帧落在这些位置时，视为在等待网络
+_NETWORK_FILES = ('socket.py', 'ssl.py', 'selectors.py')
+_NETWORK_FUNCTIONS = {
+    ('connection.py', 'create_connection'),
+    ('client.py', '_read_status'),
+}
+
+# 操作名到剖析阶段的映射
+_PHASES = {'search': 'search', 'details': 'detail', 'download': 'cover', 'upload': 'cover'}
+
+class ProfileConfig:
+    """剖析配置"""
+
+    def __init__(self):
+        self.enabled = os.getenv('BOOKFINDER_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+        self.scopes = parse_scope(os.getenv('BOOKFINDER_PROFILE_SCOPE', ''))
+        self.output_dir = os.getenv('BOOKFINDER_PROFILE_DIR', 'profiles')
+        self.interval = float(os.getenv('BOOKFINDER_PROFILE_INTERVAL', '0.002'))
+        self.top = int(os.getenv('BOOKFINDER_PROFILE_TOP', '20'))
+
+def parse_scope(text: str) -> List[Tuple[str, str]]:
+    """
+    解析剖析范围，例如 "douban:search,cover" 或 "amazon"
+
+    Returns:
+        (数据源, 阶段) 列表，'*' 表示任意
+    """
+    scopes = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' in item:
+            source, phase_name = item.split(':', 1)
+        elif item in ('search', 'detail', 'cover'):
+            source, phase_name = '*', item
+        else:
+            source, phase_name = item, '*'
+        scopes.append((source or '*', phase_name or '*'))
+    return scopes
+
+CONFIG = ProfileConfig()
+
+def configure(enabled: bool = True, scope: Optional[str] = None, output_dir: Optional[str] = None):
+    """
+    在运行时开启剖析（供命令行参数使用）
+
+    Args:
+        enabled: 是否开启
+        scope: 剖析范围，格式同 BOOKFINDER_PROFILE_SCOPE
+        output_dir: 输出目录
+    """
+    CONFIG.enabled = enabled
+    if scope is not None:
+        CONFIG.scopes = parse_scope(scope)
+    if output_dir:
+        CONFIG.output_dir = output_dir
+    if enabled:
+        _register_report()
+
+def phase_of(source: str, operation: str) -> str:
+    """把 (数据源, 操作) 映射为剖析阶段"""
+    if source == 'cover':
+        return 'cover'
+    return _PHASES.get(operation, operation)
+
+def in_scope(source: str, operation: str) -> bool:
+    """判断该操作是否在剖析范围内"""
+    if not CONFIG.enabled:
+        return False
+    if not CONFIG.scopes:
+        return True
+    phase_name = phase_of(source, operation)
+    for scope_source, scope_phase in CONFIG.scopes:
+        source_ok = scope_source == '*' or scope_source == source or (scope_source == 'cover' and source == 'cover')
+        phase_ok = scope_phase == '*' or scope_phase == phase_name
+        if source_ok and phase_ok:
+            return True
+    return False
+
+class StackSampler(threading.Thread):
+    """定时采样目标线程的调用栈，用于生成折叠栈和区分网络等待"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name='bookfinder-profiler')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.network: Dict[Tuple[str, ...], int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            leaf = frame
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            if is_network_frame(leaf):
+                self.network[key] = self.network.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def is_network_frame(frame) -> bool:
+    """判断最内层帧是否在等待网络"""
+    filename = os.path.basename(frame.f_code.co_filename)
+    if filename in _NETWORK_FILES:
+        return True
+    return (filename, frame.f_code.co_name) in _NETWORK_FUNCTIONS
+
+class ScopeReport:
+    """同一剖析范围内多次运行的汇总"""
+
+    def __init__(self):
+        self.stats: Optional[pstats.Stats] = None
+        self.runs = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.samples = 0
+        self.network_samples = 0
+        self.function_samples: Dict[str, int] = {}
+        self.function_network: Dict[str, int] = {}
+
+_reports: Dict[str, ScopeReport] = {}
+_reports_lock = threading.Lock()
+# cProfile 同一时刻只能有一个活动实例（Python 3.12 起为进程级），其余操作不剖析
+_profiler_lock = threading.Lock()
+_report_registered = False
+
+@contextmanager
+def profile_scope(source: str, operation: str):
+    """
+    在剖析范围内时，对包裹的代码执行 cProfile 和调用栈采样
+
+    Args:
+        source: 数据源代号
+        operation: 操作名称
+    """
+    if not in_scope(source, operation) or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+    _register_report()
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), CONFIG.interval)
+    wall_started = time.perf_counter()
+    cpu_started = time.thread_time()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        wall = time.perf_counter() - wall_started
+        cpu = time.thread_time() - cpu_started
+        _profiler_lock.release()
+        _save(source, operation, profiler, sampler, wall, cpu)
+
+def _save(source: str, operation: str, profiler: cProfile.Profile, sampler: StackSampler, wall: float, cpu: float):
+    """写出 pstats 和折叠栈文件，并累加到汇总报告"""
+    name = f"{source}-{phase_of(source, operation)}"
+    os.makedirs(CONFIG.output_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    profiler.dump_stats(os.path.join(CONFIG.output_dir, f"{name}-{stamp}-{os.getpid()}-{threading.get_ident()}.pstats"))
+
+    with _reports_lock:
+        with open(os.path.join(CONFIG.output_dir, f"{name}.folded"), 'a', encoding='utf-8') as f:
+            for stack, count in sampler.stacks.items():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+        report = _reports.setdefault(name, ScopeReport())
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        if report.stats is None:
+            report.stats = stats
+        else:
+            report.stats.add(stats)
+        report.runs += 1
+        report.wall += wall
+        report.cpu += cpu
+        for stack, count in sampler.stacks.items():
+            network = sampler.network.get(stack, 0)
+            report.samples += count
+            report.network_samples += network
+            for frame in set(stack):
+                report.function_samples[frame] = report.function_samples.get(frame, 0) + count
+                if network:
+                    report.function_network[frame] = report.function_network.get(frame, 0) + network
+
+def _register_report():
+    global _report_registered
+    if not _report_registered:
+        _report_registered = True
+        atexit.register(print_report)
+
+def print_report(top: Optional[int] = None):
+    """打印各剖析范围按累计时间排序的热点函数"""
+    top = top or CONFIG.top
+    with _reports_lock:
+        reports = dict(_reports)
+    for name, report in sorted(reports.items()):
+        if report.stats is None:
+            continue
+        wait = max(0.0, report.wall - report.cpu)
+        print(f"\n=== 性能剖析: {name}（{report.runs} 次）===")
+        print(f"墙钟时间: {report.wall * 1000:.1f}ms  CPU: {report.cpu * 1000:.1f}ms  等待（网络/IO）: {wait * 1000:.1f}ms")
+        print(f"{'累计(ms)':>10}{'自身(ms)':>10}{'调用次数':>10}{'网络':>8}{'CPU':>8}  函数")
+        stats = report.stats.stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+        for (filename, line, func), (cc, nc, tt, ct, callers) in rows:
+            frame = f"{func} ({os.path.basename(filename)}:{line})"
+            samples = report.function_samples.get(frame, 0)
+            if samples:
+                network_share = report.function_network.get(frame, 0) / samples
+                network_col, cpu_col = f"{network_share:.0%}", f"{1 - network_share:.0%}"
+            else:
+                network_col = cpu_col = '-'
+            print(f"{ct * 1000:>10.1f}{tt * 1000:>10.1f}{nc:>10}{network_col:>8}{cpu_col:>8}  {_short_name(filename, line, func)}")
+    if reports:
+        print(f"\n剖析文件已写入: {os.path.abspath(CONFIG.output_dir)}")
+
+def _short_name(filename: str, line: int, func: str) -> str:
+    if filename == '~':
+        return func
+    return f"{func} ({os.path.basename(filename)}:{line})"
+
+if CONFIG.enabled:
+    _register_report()
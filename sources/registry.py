@@ -0,0 +1,36 @@
+"""数据源注册表"""
+import importlib
+from types import ModuleType
+from typing import Dict, List
+
+# 数据源代号 -> (模块路径, 显示名称)
+SOURCES: Dict[str, tuple] = {
+    'douban': ('sources.douban.search', '豆瓣图书'),
+    'megbookhk': ('sources.megbookhk.search', '香港美国书店'),
+    'megbooktw': ('sources.megbooktw.search', '台湾美国书店'),
+    'amazon': ('sources.amazon.search', '亚马逊图书'),
+    'google': ('sources.google.search', 'Google Books'),
+}
+
+def source_names() -> List[str]:
+    """
+    返回所有数据源代号
+
+    Returns:
+        数据源代号列表
+    """
+    return list(SOURCES)
+
+def get_source(name: str) -> ModuleType:
+    """
+    按需导入数据源模块
+
+    Args:
+        name: 数据源代号
+
+    Returns:
+        提供 search_books / get_book_details 的模块
+    """
+    if name not in SOURCES:
+        raise KeyError(f"未知的搜索源: {name}")
+    return importlib.import_module(SOURCES[name][0])
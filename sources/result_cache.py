@@ -0,0 +1,259 @@
+"""
+搜索与详情的结果缓存
+
+缓存的是解析后的结果（图书字典列表或详情字典），命中时既不访问网络也不重新解析页面。两级存储：
+    内存  按最近使用保留 settings 的 result_cache_memory_items 条
+    磁盘  settings 的 result_cache_dir 下的 SQLite 数据库，进程重启后仍然有效，多个进程可以共享
+
+缓存键：搜索为 (数据源, 函数名, 规范化后的关键词, 其余参数)，其余参数按函数签名补齐默认值，
+search_books(x) 与 search_books(x, 1) 共用一条；关键词按大小写、全半角和空白折叠，
+“三体 ”“ＡＢＣ”“abc” 这类只有书写差异的查询共用一条；详情为 (数据源, 函数名, 规范化的详情URL)。
+
+有效期按数据源的 settings 读取：
+    cache_ttl           有结果时的有效期
+    negative_cache_ttl  空结果的有效期，较短；请求失败导致的空结果不缓存
+    cache_stale         过期后的这段时间内先返回旧结果，同时在后台刷新
+
+用法（放在 @traced 之下，命中时仍计入操作次数和耗时）:
+    @traced('douban', 'search')
+    @cached('douban', 'search')
+    def search_books(book_name): ...
+"""
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Set, Tuple
+
+from sources.deadline import deadline
+from sources.metrics import count_result_cache, current_trace, trace
+from sources.scheduler import REFRESH, priority
+from sources.settings import get_settings, source_settings
+from sources.text import normalize
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    stored REAL NOT NULL,
+    fresh_until REAL NOT NULL,
+    stale_until REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_stale_until ON results (stale_until);
+"""
+
+# 每写入多少次清理一次磁盘上彻底过期的条目
+PURGE_EVERY = 500
+
+class Entry:
+    """一条缓存结果，value 保存为 JSON 文本，每次取出都得到独立的副本"""
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value: str, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+class ResultCache:
+    """两级结果缓存，可在多个线程之间共享"""
+
+    def __init__(self, directory: Optional[str], memory_items: int = 1000):
+        """
+        Args:
+            directory: 磁盘缓存目录，None 表示只使用内存
+            memory_items: 内存中保留的条数
+        """
+        self.directory = directory
+        self.memory_items = memory_items
+        self._memory: 'OrderedDict[str, Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._initialized = False
+        self._writes = 0
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """当前线程的数据库连接（fork 之后的子进程会重新连接）"""
+        if not self.directory:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, 'results.db'), timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _remember(self, key: str, entry: Entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[Optional[Entry], str]:
+        """
+        查找缓存
+
+        Returns:
+            (条目, 命中的层级 memory/disk/none)；条目可能已过期，由调用方按时间判断
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry, 'memory'
+        try:
+            conn = self._connection()
+            row = conn.execute('SELECT value, fresh_until, stale_until FROM results WHERE key = ?',
+                               (key,)).fetchone() if conn else None
+        except sqlite3.Error as e:
+            print(f"读取结果缓存出错: {str(e)}")
+            row = None
+        if row is None:
+            return None, 'none'
+        entry = Entry(*row)
+        self._remember(key, entry)
+        return entry, 'disk'
+
+    def put(self, key: str, value: Any, ttl: float, stale: float = 0.0):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 可序列化为 JSON 的结果
+            ttl: 有效期（秒）
+            stale: 过期后仍可返回旧结果的时长（秒）
+        """
+        now = time.time()
+        entry = Entry(json.dumps(value, ensure_ascii=False), now + ttl, now + ttl + stale)
+        self._remember(key, entry)
+        try:
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute('INSERT OR REPLACE INTO results (key, value, stored, fresh_until, stale_until) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, entry.value, now, entry.fresh_until, entry.stale_until))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                conn.execute('DELETE FROM results WHERE stale_until < ?', (now,))
+        except sqlite3.Error as e:
+            print(f"写入结果缓存出错: {str(e)}")
+
+    def clear(self):
+        """清空内存和磁盘中的全部结果"""
+        with self._lock:
+            self._memory.clear()
+        conn = self._connection()
+        if conn is not None:
+            conn.execute('DELETE FROM results')
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """返回进程内共享的结果缓存（运行中修改了缓存目录或内存条数时重新创建）"""
+    global _cache
+    settings = get_settings()
+    directory = os.path.expanduser(settings.result_cache_dir) or None
+    cache = _cache
+    if cache is None or (cache.directory, cache.memory_items) != (directory, settings.result_cache_memory_items):
+        with _cache_lock:
+            cache = _cache
+            if cache is None or (cache.directory, cache.memory_items) != (directory, settings.result_cache_memory_items):
+                cache = _cache = ResultCache(directory, settings.result_cache_memory_items)
+    return cache
+
+def normalize_query(query: str) -> str:
+    """缓存键使用的关键词：统一全半角、合并空白并忽略大小写"""
+    return normalize(query).casefold()
+
+def _search_key(signature: inspect.Signature, *args, **kwargs) -> Hashable:
+    """按函数签名绑定参数并补齐默认值，第一个参数（关键词）规范化"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    query, *rest = bound.arguments.values()
+    return (normalize_query(query),) + tuple(rest)
+
+# 正在后台刷新的缓存键
+_refreshing: Set[str] = set()
+_refreshing_lock = threading.Lock()
+
+def _refresh(key: str, source: str, operation: str, load: Callable[[], Any]):
+    """在后台线程中重新获取过期结果，同一个键同时只刷新一次"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            # 用户已经拿到旧结果，刷新以最低优先级排队，不与交互查询争抢请求名额
+            with priority(REFRESH), trace(source, operation), deadline(get_settings().lookup_deadline):
+                load()
+        except Exception as e:
+            print(f"后台刷新缓存失败: {str(e)}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name='bookfinder-cache-refresh', daemon=True).start()
+
+def cached(source: str, operation: str, key: Optional[Callable[..., Hashable]] = None, name: Optional[str] = None):
+    """
+    装饰器：缓存数据源函数的返回结果
+
+    Args:
+        source: 数据源代号，用于读取有效期和区分缓存键
+        operation: 指标中的操作名称（search 或 details）
+        key: 根据调用参数计算缓存键的函数，默认把第一个参数（关键词）规范化后与其余参数组合
+        name: 缓存键中区分函数的名称，默认为函数名；同一数据源的多个函数参数相同时不会共用缓存
+    """
+    def decorator(func):
+        prefix = f"{source}:{name or func.__name__}:"
+        make_key = key or functools.partial(_search_key, inspect.signature(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not get_settings().result_cache_enabled:
+                return func(*args, **kwargs)
+            cache = get_result_cache()
+            cache_key = prefix + json.dumps(make_key(*args, **kwargs), ensure_ascii=False, default=str)
+            settings = source_settings(source)
+
+            def load():
+                """调用原函数，结果可信时写入缓存"""
+                t = current_trace()
+                failures = t.failures if t else 0
+                result = func(*args, **kwargs)
+                if result:
+                    if settings.cache_ttl > 0:
+                        cache.put(cache_key, result, settings.cache_ttl, settings.cache_stale)
+                elif settings.negative_cache_ttl > 0 and (t is None or t.failures == failures):
+                    # 只缓存没有出错的空结果（确实搜不到），过期后不返回旧值
+                    cache.put(cache_key, result, settings.negative_cache_ttl)
+                return result
+
+            entry, tier = cache.get(cache_key)
+            now = time.time()
+            if entry is not None and now < entry.stale_until:
+                value = json.loads(entry.value)
+                if now < entry.fresh_until:
+                    count_result_cache(source, operation, tier, 'hit' if value else 'negative')
+                else:
+                    count_result_cache(source, operation, tier, 'stale')
+                    _refresh(cache_key, source, operation, load)
+                return value
+            count_result_cache(source, operation, tier, 'miss')
+            return load()
+        return wrapper
+    return decorator
@@ -0,0 +1,241 @@
+"""
+按优先级和主机调度请求
+
+同一进程中同时有命令行/API 的交互查询和批量任务时，请求分为四个优先级（数值越小越优先）:
+    INTERACTIVE  用户正在等待的查询（默认）
+    PREFETCH     预取，用户很可能马上需要（启动预热、Google 网页版信息的推测性预取）
+    BATCH        batch.py 的批量检索
+    REFRESH      watch.py 的后台刷新、结果缓存过期后的后台刷新
+
+两层调度:
+    1. 数据源限流（sources/throttle.py）: 并发名额和速率令牌按优先级分配，交互查询不再排在
+       上百个批量请求之后；同一优先级内先到先得
+    2. HostScheduler: 批量任务不直接进线程池，而是按 (优先级, 主机) 排队，每个主机同时执行的任务数
+       不超过 host_concurrency()，同一优先级内在各主机之间轮转。一个慢主机（如限流的亚马逊）
+       只占用自己的名额，不会让所有线程都堵在它的队列上，其余主机保持忙碌
+
+    with priority(BATCH):
+        ...                      # 期间发出的请求按批量优先级排队
+"""
+import contextvars
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from sources.settings import get_settings
+
+INTERACTIVE, PREFETCH, BATCH, REFRESH = 0, 1, 2, 3
+
+_current_priority: contextvars.ContextVar = contextvars.ContextVar('bookfinder_priority', default=INTERACTIVE)
+
+def current_priority() -> int:
+    """当前上下文的优先级，未设置时为 INTERACTIVE"""
+    return _current_priority.get()
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """在 with 块内以指定优先级发出请求"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def host_concurrency(host: str) -> int:
+    """HostScheduler 中一个主机（数据源）同时执行的任务数：数据源设置了 concurrency 时取该值，否则取 host_concurrency"""
+    return get_settings().source(host).concurrency or get_settings().host_concurrency
+
+class PriorityGate:
+    """按优先级分配名额的信号量：名额释放时交给优先级最高、等待最久的请求"""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: 同时持有名额的上限
+        """
+        self.capacity = capacity
+        self._active = 0
+        # (优先级, 序号, 等待者)，等待者为 [事件, 已获得, 已放弃]
+        self._waiters: List[Tuple[int, int, list]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, level: int, timeout: Optional[float] = None) -> bool:
+        """
+        获取一个名额
+
+        Args:
+            level: 优先级
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            是否获得名额（超时返回 False）
+        """
+        with self._lock:
+            if self._active < self.capacity and not self._waiters:
+                self._active += 1
+                return True
+            waiter = [threading.Event(), False, False]
+            heapq.heappush(self._waiters, (level, next(self._seq), waiter))
+        if waiter[0].wait(timeout):
+            return True
+        with self._lock:
+            if waiter[1]:
+                # 超时的同时恰好拿到名额
+                return True
+            waiter[2] = True
+        return False
+
+    def release(self):
+        """归还名额，有人等待时直接转交"""
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter[2]:
+                    waiter[1] = True
+                    waiter[0].set()
+                    return
+            self._active -= 1
+
+    def waiting(self) -> int:
+        """正在等待的请求数"""
+        with self._lock:
+            return sum(1 for _, _, waiter in self._waiters if not waiter[2])
+
+class HostScheduler:
+    """
+    按优先级和主机调度任务的线程池
+
+    submit() 返回标准的 Future，可以与 concurrent.futures.wait 配合使用；
+    任务在提交时的上下文（截止时间、追踪等）中以提交时的优先级执行。
+    """
+
+    def __init__(self, workers: int, capacity: Callable[[str], int] = host_concurrency,
+                 thread_name_prefix: str = 'bookfinder-scheduler'):
+        """
+        Args:
+            workers: 工作线程数
+            capacity: 返回主机同时执行任务数上限的函数
+            thread_name_prefix: 工作线程名前缀
+        """
+        self.capacity = capacity
+        # 优先级 → 主机 → 任务队列；优先级 → 主机轮转顺序
+        self._queues: Dict[int, Dict[str, Deque]] = {}
+        self._rotation: Dict[int, Deque[str]] = {}
+        self._running: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._work, name=f"{thread_name_prefix}-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, host: str, func: Callable, *args, level: Optional[int] = None, **kwargs) -> Future:
+        """
+        提交任务
+
+        Args:
+            host: 任务访问的主机（一般为数据源代号），决定轮转和并发上限
+            func: 任务函数
+            level: 优先级，None 表示使用当前上下文的优先级
+
+        Returns:
+            任务的 Future
+        """
+        level = current_priority() if level is None else level
+        future: Future = Future()
+        task = (future, contextvars.copy_context(), level, func, args, kwargs)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('调度器已关闭')
+            hosts = self._queues.setdefault(level, {})
+            if host not in hosts:
+                hosts[host] = deque()
+                self._rotation.setdefault(level, deque()).append(host)
+            hosts[host].append(task)
+            self._cond.notify()
+        return future
+
+    def _next_task(self) -> Optional[Tuple[str, tuple]]:
+        """按优先级从高到低、同一优先级内按主机轮转，取出第一个主机仍有空闲名额的任务"""
+        for level in sorted(self._queues):
+            hosts, rotation = self._queues[level], self._rotation[level]
+            for _ in range(len(rotation)):
+                host = rotation[0]
+                rotation.rotate(-1)
+                if self._running.get(host, 0) >= max(1, self.capacity(host)):
+                    continue
+                queue = hosts[host]
+                task = queue.popleft()
+                if not queue:
+                    del hosts[host]
+                    rotation.remove(host)
+                    if not hosts:
+                        del self._queues[level], self._rotation[level]
+                self._running[host] = self._running.get(host, 0) + 1
+                return host, task
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                picked = self._next_task()
+                while picked is None:
+                    if self._shutdown and not self._queues:
+                        return
+                    self._cond.wait()
+                    picked = self._next_task()
+            host, (future, context, level, func, args, kwargs) = picked
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(context.run(_call, level, func, args, kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[host] -= 1
+                    self._cond.notify_all()
+
+    def pending(self) -> Dict[str, int]:
+        """各主机排队中的任务数"""
+        with self._cond:
+            counts: Dict[str, int] = {}
+            for hosts in self._queues.values():
+                for host, queue in hosts.items():
+                    counts[host] = counts.get(host, 0) + len(queue)
+            return counts
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False):
+        """
+        停止接受新任务
+
+        Args:
+            wait: 是否等待已提交的任务全部结束
+            cancel_futures: 是否取消尚未开始的任务
+        """
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                for hosts in self._queues.values():
+                    for queue in hosts.values():
+                        for task in queue:
+                            task[0].cancel()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self) -> 'HostScheduler':
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
+
+def _call(level: int, func: Callable, args, kwargs):
+    with priority(level):
+        return func(*args, **kwargs)
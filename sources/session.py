@@ -0,0 +1,90 @@
+"""共享HTTP会话模块：复用连接池，并记录 DNS/连接/TLS 各阶段耗时"""
+import socket
+import threading
+import time
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from sources.metrics import record_phase
+from sources.settings import get_settings
+
+class _TimedConnectionMixin:
+    """在建立连接时分别记录 DNS 解析、TCP 连接和 TLS 握手耗时"""
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            # 先单独解析一次，系统解析缓存会让随后 create_connection 中的解析几乎不耗时
+            socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except OSError:
+            pass  # 交给 create_connection 抛出对应的异常
+        resolved = time.perf_counter()
+        sock = super()._new_conn()
+        connected = time.perf_counter()
+        self._dns_seconds = resolved - started
+        self._tcp_seconds = connected - resolved
+        record_phase('dns', self._dns_seconds)
+        record_phase('connect', self._tcp_seconds)
+        return sock
+
+    def connect(self):
+        self._dns_seconds = self._tcp_seconds = 0.0
+        started = time.perf_counter()
+        super().connect()
+        tls_seconds = time.perf_counter() - started - self._dns_seconds - self._tcp_seconds
+        if isinstance(self, HTTPSConnection) and tls_seconds > 0:
+            record_phase('tls', tls_seconds)
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """使用带计时连接的适配器"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    返回进程内共享的会话，所有数据源复用同一组连接池
+
+    Returns:
+        requests.Session 对象
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                http = get_settings().http
+                adapter = TimedHTTPAdapter(pool_connections=http.pool_connections, pool_maxsize=http.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+def connection_seconds(trace) -> float:
+    """返回追踪中已记录的建连耗时（DNS + TCP + TLS）"""
+    if trace is None:
+        return 0.0
+    return sum(trace.phases.get(name, 0.0) for name in ('dns', 'connect', 'tls'))
@@ -0,0 +1,239 @@
+"""
+性能相关的运行参数：超时、重试、连接池、并发、限流、缓存有效期
+
+第一次调用 get_settings() 时才加载，优先级从低到高为：
+    1. 代码中的默认值
+    2. JSON 配置文件（BOOKFINDER_SETTINGS 指定，默认读取项目根目录的 settings.json，不存在时跳过）
+    3. 环境变量和 .env 文件
+单个数据源的值在全局默认值的基础上覆盖，比全局值优先。
+
+环境变量:
+    BOOKFINDER_TIMEOUT=10                 # 所有数据源的默认值
+    BOOKFINDER_AMAZON_TIMEOUT=15          # 单个数据源（DOUBAN/AMAZON/GOOGLE/MEGBOOKHK/MEGBOOKTW/COVER）
+    可用字段: TIMEOUT, MAX_RETRIES, RETRY_DELAY, RETRY_BACKOFF, CONCURRENCY, RATE_LIMIT,
+              CACHE_TTL, NEGATIVE_CACHE_TTL, CACHE_STALE
+    BOOKFINDER_POOL_CONNECTIONS=16, BOOKFINDER_POOL_MAXSIZE=32
+    BOOKFINDER_BLOCK_COOLDOWN=60, BOOKFINDER_BLOCK_COOLDOWN_MAX=900
+    BOOKFINDER_LOOKUP_DEADLINE=60         # 单次查询（搜索或 详情+封面）的时间预算，0 表示不限
+    BOOKFINDER_HOST_CONCURRENCY=8         # 批量任务调度时每个主机同时执行的任务数
+    BOOKFINDER_ISBN_INDEX_ENABLED=true, BOOKFINDER_ISBN_INDEX_DIR=~/.cache/bookfinder/isbn
+    BOOKFINDER_RESULT_CACHE_ENABLED=true, BOOKFINDER_RESULT_CACHE_DIR=~/.cache/bookfinder/results,
+    BOOKFINDER_RESULT_CACHE_MEMORY_ITEMS=1000
+    BOOKFINDER_WATCH_DB=~/.cache/bookfinder/watch.db
+    BOOKFINDER_JOB_QUEUE=~/.cache/bookfinder/jobs.db, BOOKFINDER_JOB_QUEUE_TOKEN=共享令牌
+    BOOKFINDER_COVER_NORMALIZE=true, BOOKFINDER_COVER_MAX_DIMENSION=1200, BOOKFINDER_COVER_FORMAT=jpeg,
+    BOOKFINDER_COVER_QUALITY=85
+    BOOKFINDER_COVER_CACHE_ENABLED=true, BOOKFINDER_COVER_CACHE_DIR=~/.cache/bookfinder/covers,
+    BOOKFINDER_COVER_CACHE_MAX_MB=200
+    以上几项原先写在 config.py 中的变量，不带 BOOKFINDER_ 前缀（如 ISBN_INDEX_DIR、COVER_CACHE_DIR）仍然有效
+
+JSON 配置文件格式:
+    {"http": {"pool_maxsize": 64},
+     "default": {"timeout": 10, "retry": {"max_retries": 3}},
+     "sources": {"amazon": {"timeout": 15, "rate_limit": 2, "concurrency": 4}}}
+
+运行中修改参数后调用 reload_settings()，或直接用 update_settings() 替换。
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass, field, fields, is_dataclass, replace
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SETTINGS_FILE = os.path.join(PROJECT_DIR, 'settings.json')
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """重试策略：第 n 次重试前等待 delay * backoff**(n-1) 秒，最多 max_delay 秒"""
+    max_retries: int = 3
+    delay: float = 1.0
+    backoff: float = 1.0
+    max_delay: float = 30.0
+
+    def wait(self, attempt: int) -> float:
+        """第 attempt 次失败（从0开始）后的等待秒数"""
+        return min(self.delay * (self.backoff ** attempt), self.max_delay)
+
+@dataclass(frozen=True)
+class SourceSettings:
+    """单个数据源的参数"""
+    timeout: float = 10.0            # 单次请求超时（秒）
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    concurrency: int = 0             # 同时进行的请求数上限，0 表示不限
+    rate_limit: float = 0.0          # 每秒请求数上限，0 表示不限
+    cache_ttl: float = 3600.0        # 结果缓存有效期（秒）
+    negative_cache_ttl: float = 300.0  # 空结果缓存有效期（秒）
+    cache_stale: float = 86400.0     # 结果过期后仍可先返回旧结果、同时在后台刷新的时长（秒），0 表示不使用
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """共享连接池参数"""
+    pool_connections: int = 16       # 缓存连接池的主机数
+    pool_maxsize: int = 32           # 每个主机保留的连接数
+
+@dataclass(frozen=True)
+class Settings:
+    """全部运行参数"""
+    http: HttpSettings = field(default_factory=HttpSettings)
+    default: SourceSettings = field(default_factory=SourceSettings)
+    sources: Dict[str, SourceSettings] = field(default_factory=dict)
+    block_cooldown: float = 60.0     # 首次封禁冷却秒数
+    block_cooldown_max: float = 900.0
+    lookup_deadline: float = 60.0    # 单次查询的时间预算（秒），0 表示不限
+    host_concurrency: int = 8        # 调度器中每个主机同时执行的批量任务数（数据源设置了 concurrency 时取该值）
+    isbn_index_enabled: bool = True  # 本地 ISBN 索引
+    isbn_index_dir: str = '~/.cache/bookfinder/isbn'
+    result_cache_enabled: bool = True  # 搜索与详情结果缓存（有效期见 SourceSettings）
+    result_cache_dir: str = '~/.cache/bookfinder/results'
+    result_cache_memory_items: int = 1000  # 内存中保留的条数
+    watch_db: str = '~/.cache/bookfinder/watch.db'  # 价格与库存关注列表（watch.py）
+    job_queue: str = '~/.cache/bookfinder/jobs.db'  # 分布式批量检索的任务队列（batch_queue.py）
+    job_queue_token: str = ''        # HTTP 任务队列的共享令牌，为空时不鉴权
+    cover_normalize: bool = True     # 上传前缩放并重新编码封面（需要 Pillow，未安装时按原图上传）
+    cover_max_dimension: int = 1200  # 最长边像素
+    cover_format: str = 'jpeg'       # jpeg 或 webp
+    cover_quality: int = 85
+    cover_cache_enabled: bool = True  # 按内容哈希去重的本地封面缓存
+    cover_cache_dir: str = '~/.cache/bookfinder/covers'
+    cover_cache_max_mb: float = 200.0  # 封面文件总大小上限，超出后按最近最少使用淘汰
+
+    def source(self, name: str) -> SourceSettings:
+        """返回数据源的参数，未单独配置时使用默认值"""
+        return self.sources.get(name, self.default)
+
+# 环境变量字段名 → SourceSettings 中的路径
+_SOURCE_ENV_FIELDS = {
+    'TIMEOUT': ('timeout',),
+    'MAX_RETRIES': ('retry', 'max_retries'),
+    'RETRY_DELAY': ('retry', 'delay'),
+    'RETRY_BACKOFF': ('retry', 'backoff'),
+    'CONCURRENCY': ('concurrency',),
+    'RATE_LIMIT': ('rate_limit',),
+    'CACHE_TTL': ('cache_ttl',),
+    'NEGATIVE_CACHE_TTL': ('negative_cache_ttl',),
+    'CACHE_STALE': ('cache_stale',),
+}
+
+# 全局字段（同时可在 JSON 配置文件顶层设置）
+TOP_FIELDS = ('block_cooldown', 'block_cooldown_max', 'lookup_deadline', 'host_concurrency',
+              'isbn_index_enabled', 'isbn_index_dir',
+              'result_cache_enabled', 'result_cache_dir', 'result_cache_memory_items', 'watch_db',
+              'job_queue', 'job_queue_token',
+              'cover_normalize', 'cover_max_dimension', 'cover_format', 'cover_quality',
+              'cover_cache_enabled', 'cover_cache_dir', 'cover_cache_max_mb')
+
+# 原先由 config.py 读取的字段，仍然接受不带 BOOKFINDER_ 前缀的环境变量
+_LEGACY_ENV_FIELDS = ('isbn_index_enabled', 'isbn_index_dir',
+                      'result_cache_enabled', 'result_cache_dir', 'result_cache_memory_items', 'watch_db',
+                      'job_queue',
+                      'cover_normalize', 'cover_max_dimension', 'cover_format', 'cover_quality',
+                      'cover_cache_enabled', 'cover_cache_dir', 'cover_cache_max_mb')
+
+# 可以单独配置的数据源（cover 为封面下载和上传）
+KNOWN_SOURCES = ('douban', 'megbookhk', 'megbooktw', 'amazon', 'google', 'cover')
+
+def _merge(obj, values: Dict[str, Any]):
+    """把字典中的值按字段类型合并到 dataclass，嵌套的 dataclass 递归合并"""
+    changes = {}
+    for f in fields(obj):
+        if f.name not in values:
+            continue
+        current = getattr(obj, f.name)
+        value = values[f.name]
+        if is_dataclass(current):
+            changes[f.name] = _merge(current, value)
+        elif isinstance(current, bool):
+            changes[f.name] = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'yes')
+        elif isinstance(current, (int, float)):
+            changes[f.name] = type(current)(value)
+        else:
+            changes[f.name] = value
+    return replace(obj, **changes)
+
+def _set_path(values: Dict[str, Any], path, value):
+    for key in path[:-1]:
+        values = values.setdefault(key, {})
+    values[path[-1]] = value
+
+def _source_env(prefix: str) -> Dict[str, Any]:
+    """读取 {prefix}_TIMEOUT 等环境变量"""
+    values: Dict[str, Any] = {}
+    for name, path in _SOURCE_ENV_FIELDS.items():
+        value = os.getenv(f"{prefix}_{name}", '').strip()
+        if value:
+            _set_path(values, path, value)
+    return values
+
+def load_settings(path: Optional[str] = None) -> Settings:
+    """
+    按 默认值 → JSON 文件 → 环境变量 的顺序加载参数
+
+    Args:
+        path: JSON 配置文件路径，默认读取 BOOKFINDER_SETTINGS 或项目根目录的 settings.json
+
+    Returns:
+        Settings 对象
+    """
+    load_dotenv(os.path.join(PROJECT_DIR, '.env'))
+    path = path or os.getenv('BOOKFINDER_SETTINGS') or DEFAULT_SETTINGS_FILE
+    data: Dict[str, Any] = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    settings = Settings()
+    http = dict(data.get('http', {}))
+    for name in ('pool_connections', 'pool_maxsize'):
+        value = os.getenv(f"BOOKFINDER_{name.upper()}", '').strip()
+        if value:
+            http[name] = value
+    default = _merge(_merge(SourceSettings(), data.get('default', {})), _source_env('BOOKFINDER'))
+
+    # 单个数据源在默认值基础上覆盖
+    source_data = data.get('sources', {})
+    sources = {}
+    for name in set(KNOWN_SOURCES) | set(source_data):
+        overrides = _source_env(f"BOOKFINDER_{name.upper()}")
+        if name in source_data or overrides:
+            sources[name] = _merge(_merge(default, source_data.get(name, {})), overrides)
+
+    top = {k: data[k] for k in TOP_FIELDS if k in data}
+    for name in TOP_FIELDS:
+        value = os.getenv(f"BOOKFINDER_{name.upper()}", '').strip()
+        if not value and name in _LEGACY_ENV_FIELDS:
+            value = os.getenv(name.upper(), '').strip()
+        if value:
+            top[name] = value
+    settings = _merge(settings, top)
+    return replace(settings, http=_merge(settings.http, http), default=default, sources=sources)
+
+_settings: Optional[Settings] = None
+_settings_lock = threading.Lock()
+
+def get_settings() -> Settings:
+    """返回当前参数，第一次调用时加载"""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = load_settings()
+    return _settings
+
+def source_settings(name: str) -> SourceSettings:
+    """返回数据源的参数"""
+    return get_settings().source(name)
+
+def update_settings(settings: Settings):
+    """替换当前参数，之后的请求立即生效（连接池大小只对新建的会话生效）"""
+    global _settings
+    with _settings_lock:
+        _settings = settings
+
+def reload_settings(path: Optional[str] = None) -> Settings:
+    """重新读取配置文件和环境变量"""
+    settings = load_settings(path)
+    update_settings(settings)
+    return settings
@@ -0,0 +1,115 @@
+"""
+合并相同的进行中请求（single-flight）
+
+多个线程同时请求同一个豆瓣条目、同一个 Google volume 或同一张封面时，只有第一个调用者（leader）
+真正访问网络，其余调用者等待并共享它的结果或异常。调用结束后立即移除记录，不做结果缓存。
+
+    @coalesced(DETAILS, key=lambda url: canonical_url(url))
+    def get_book_details(url): ...
+
+leader 因为自己的时间预算用完或被取消而失败时，等待者不共享这个异常，而是各自重新发起。
+"""
+import copy
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from sources.deadline import check_deadline
+from sources.exceptions import DeadlineExceeded
+from sources.metrics import count_coalesced
+
+# 等待 leader 时检查自身截止时间的间隔（秒）
+_POLL_INTERVAL = 0.05
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """按键合并同时进行的相同调用"""
+
+    def __init__(self, group: str, share: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            group: 指标中的分组名称
+            share: 把 leader 的结果交给等待者前的处理，例如对可变的字典做深拷贝；None 表示直接共享
+        """
+        self.group = group
+        self.share = share
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """
+        执行 func(*args, **kwargs)，同一时刻相同 key 的调用只执行一次
+
+        Raises:
+            DeadlineExceeded: 等待期间自己的时间预算用完或被取消
+            其他异常: leader 抛出的异常
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = func(*args, **kwargs)
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        count_coalesced(self.group)
+        while not call.done.wait(_POLL_INTERVAL):
+            check_deadline()
+        error = call.error
+        if error is not None:
+            if isinstance(error, DeadlineExceeded) or not isinstance(error, Exception):
+                # leader 自己超时、被取消或被中断，与本次调用无关
+                return self.do(key, func, *args, **kwargs)
+            raise error
+        return self.share(call.result) if self.share else call.result
+
+    def in_flight(self) -> int:
+        """当前进行中的调用数"""
+        with self._lock:
+            return len(self._calls)
+
+# 请求层：相同 URL 和参数的 GET 请求共享同一个响应（响应体已读入内存，可安全共享）
+REQUESTS = SingleFlight('request')
+# 详情层：相同条目共享解析结果，每个等待者拿到独立的副本，之后可以各自修改（如替换封面地址）
+DETAILS = SingleFlight('details', share=copy.deepcopy)
+# 封面：相同封面URL只下载和上传一次
+COVERS = SingleFlight('cover')
+
+def coalesced(group: SingleFlight, key: Callable[..., Hashable]):
+    """
+    装饰器：用 group 合并参数对应相同 key 的并发调用
+
+    Args:
+        group: SingleFlight 实例
+        key: 根据调用参数计算合并键的函数
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return group.do(key(*args, **kwargs), func, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def canonical_url(url: str) -> str:
+    """合并键使用的规范化URL：协议和主机小写，去掉片段和路径末尾的斜杠"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
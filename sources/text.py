@@ -0,0 +1,85 @@
+"""
+各数据源共用的文本规范化
+
+解析页面时每个字段都要清理一次，亚马逊的一条搜索结果就要清理十几次。
+这里不再逐个执行正则替换，而是用预先编译好的 str.translate 转换表完成单字符处理，再用 str.split() 合并空白：
+    - 删除控制字符、零宽字符和双向文本标记（亚马逊页面中大量出现 U+200E/U+200F）
+    - 全角字母和数字转为半角（ＩＳＢＮ９７８… → ISBN978…），中文全角标点保持不变
+    - 各种空白（含全角空格、不换行空格）合并为一个半角空格，并去除首尾空白
+
+大部分文本不含需要转换的字符，而 translate 对每个字符都要查一次表，
+因此先用一次字符类扫描判断是否需要转换，不需要时只做空白合并。
+
+    normalize('  三体‎\n  第一部 ')           -> '三体 第一部'
+    normalize_many(['Ｈａｒｒｙ', ' Potter '])    -> ['Harry', 'Potter']
+"""
+import re
+from typing import Dict, Iterable, List
+
+def _build_table() -> Dict[int, object]:
+    """构造转换表：值为 None 表示删除该字符"""
+    table: Dict[int, object] = {}
+    # C0/C1 控制字符（\t\n\r 等空白由 split() 处理，不在此删除）
+    for code in list(range(0x00, 0x20)) + list(range(0x7f, 0xa0)):
+        if not chr(code).isspace():
+            table[code] = None
+    # 软连字符、零宽字符、双向文本标记、BOM
+    for code in [0x00ad, 0x200b, 0x200c, 0x200d, 0x200e, 0x200f, 0x2060, 0xfeff] \
+            + list(range(0x202a, 0x202f)) + list(range(0x2066, 0x206a)):
+        table[code] = None
+    # 全角数字和字母
+    for start, end in ((0xff10, 0xff19), (0xff21, 0xff3a), (0xff41, 0xff5a)):
+        for code in range(start, end + 1):
+            table[code] = code - 0xfee0
+    return table
+
+_TABLE = _build_table()
+
+# 匹配转换表中任意字符，用于跳过不需要转换的文本
+_NEEDS_TRANSLATE = re.compile('[%s]' % ''.join(re.escape(chr(code)) for code in sorted(_TABLE)))
+
+# 批量处理时连接各条文本的分隔符（私用区字符，不在转换表中，也不是空白）
+_SEPARATOR = '\ue000'
+
+def normalize(text: str, strip: str = '') -> str:
+    """
+    规范化单条文本
+
+    Args:
+        text: 输入文本，None 或空串返回空串
+        strip: 额外需要从首尾去除的字符，例如 ':：'
+
+    Returns:
+        规范化后的文本
+    """
+    if not text:
+        return ''
+    if _NEEDS_TRANSLATE.search(text):
+        text = text.translate(_TABLE)
+    text = ' '.join(text.split())
+    return text.strip(strip + ' ') if strip else text
+
+def normalize_many(texts: Iterable[str], strip: str = '') -> List[str]:
+    """
+    批量规范化，整批文本只扫描和转换一次
+
+    Args:
+        texts: 输入文本，None 视为空串
+        strip: 额外需要从首尾去除的字符
+
+    Returns:
+        与输入一一对应的规范化结果
+    """
+    texts = [text or '' for text in texts]
+    joined = _SEPARATOR.join(texts)
+    if joined.count(_SEPARATOR) != len(texts) - 1:
+        # 文本中本身含有分隔符，退回逐条处理
+        return [normalize(text, strip) for text in texts]
+    if _NEEDS_TRANSLATE.search(joined):
+        # 只转换确实含有特殊字符的条目
+        joined = _SEPARATOR.join(text.translate(_TABLE) if _NEEDS_TRANSLATE.search(text) else text
+                                 for text in texts)
+    # 分隔符不是空白，整批合并空白后每条首尾最多剩一个空格
+    parts = ' '.join(joined.split()).split(_SEPARATOR)
+    chars = strip + ' '
+    return [part.strip(chars) for part in parts]
@@ -0,0 +1,111 @@
+"""
+按数据源限制并发请求数和请求速率
+
+上限来自 settings 中各数据源的 concurrency 和 rate_limit，默认都为 0（不限制）。
+排队等待的时间记为 queue 阶段，便于和网络耗时区分；排队同样受本次查询的截止时间约束。
+并发名额和速率令牌按 sources.scheduler 的优先级分配，交互查询优先于批量任务和后台刷新。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from sources.deadline import budget, sleep
+from sources.exceptions import DeadlineExceeded
+from sources.metrics import record_phase
+from sources.scheduler import PriorityGate, current_priority
+from sources.settings import source_settings
+
+class SourceLimiter:
+    """单个数据源的并发信号量和令牌桶"""
+
+    def __init__(self, concurrency: int = 0, rate_limit: float = 0.0):
+        """
+        Args:
+            concurrency: 同时进行的请求数上限，0 表示不限
+            rate_limit: 每秒请求数上限，0 表示不限
+        """
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self._gate = PriorityGate(concurrency) if concurrency > 0 else None
+        self._burst = max(1.0, rate_limit)
+        self._tokens = self._burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # 各优先级正在等待令牌的请求数
+        self._token_waiters: Dict[int, int] = {}
+
+    def _take_token(self, level: int):
+        """取一个令牌，不足时等待；有更高优先级的请求在等待时让它先取"""
+        registered = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate_limit)
+                    self._updated = now
+                    ahead = any(count for other, count in self._token_waiters.items() if other < level)
+                    if self._tokens >= 1 and not ahead:
+                        self._tokens -= 1
+                        return
+                    if not registered:
+                        self._token_waiters[level] = self._token_waiters.get(level, 0) + 1
+                        registered = True
+                    wait = max((1 - self._tokens) / self.rate_limit, 0.0) + (0.005 if ahead else 0.0)
+                sleep(wait)
+        finally:
+            if registered:
+                with self._lock:
+                    self._token_waiters[level] -= 1
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """
+        按当前优先级占用一个请求名额，期间最多 concurrency 个请求同时进行
+
+        Raises:
+            DeadlineExceeded: 排队期间超时或被取消
+        """
+        started = time.perf_counter()
+        level = current_priority()
+        if self.rate_limit > 0:
+            self._take_token(level)
+        if self._gate is not None:
+            timeout = budget(None)
+            if not self._gate.acquire(level, timeout=timeout):
+                raise DeadlineExceeded()
+        waited = time.perf_counter() - started
+        if waited > 0.001:
+            record_phase('queue', waited)
+        try:
+            yield
+        finally:
+            if self._gate is not None:
+                self._gate.release()
+
+_limiters: Dict[str, Tuple[Tuple[int, float], SourceLimiter]] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(source: str) -> Optional[SourceLimiter]:
+    """返回数据源的限制器，未配置限制时返回 None；参数变化后重新创建"""
+    settings = source_settings(source)
+    key = (settings.concurrency, settings.rate_limit)
+    if key == (0, 0.0):
+        return None
+    entry = _limiters.get(source)
+    if entry is None or entry[0] != key:
+        with _limiters_lock:
+            entry = _limiters.get(source)
+            if entry is None or entry[0] != key:
+                entry = _limiters[source] = (key, SourceLimiter(*key))
+    return entry[1]
+
+@contextmanager
+def throttle(source: str) -> Iterator[None]:
+    """在数据源的并发和速率限制内执行请求"""
+    limiter = get_limiter(source)
+    if limiter is None:
+        yield
+        return
+    with limiter.slot():
+        yield
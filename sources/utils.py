@@ -1,60 +1,299 @@
 """通用工具函数模块"""
+import codecs
+import functools
 import os
+import json
 import time
 import re
-from typing import Optional, Dict, Any, Callable
+from functools import lru_cache
+from typing import Optional, Dict, Any, Callable, Iterator, List
 import requests
 from requests.exceptions import RequestException
+from bs4 import BeautifulSoup, SoupStrainer
 
-def retry_on_failure(max_retries: int = 3) -> Callable:
+from sources.metrics import (
+    current_trace, current_labels, record_phase, phase, count_request, count_retry, count_failure
+)
+from sources.session import get_session, connection_seconds
+from sources.blocking import check_cooldown, check_response
+from sources.exceptions import BlockedError, DeadlineExceeded
+from sources.deadline import budget, sleep, check_deadline
+from sources.settings import source_settings
+from sources.throttle import throttle
+from sources.text import normalize
+from sources.singleflight import REQUESTS, canonical_url
+
+def retry_on_failure(max_retries: Optional[int] = None) -> Callable:
     """
-    装饰器：在网络请求失败时进行重试
+    装饰器：在网络请求失败时进行重试，遇到封禁（BlockedError）或时间预算用完（DeadlineExceeded）时直接放弃
+
+    重试次数和间隔在每次调用时按当前数据源的 settings 读取，运行中修改参数立即生效；
+    重试前的等待不会超过本次查询剩余的时间。
     
     Args:
-        max_retries: 最大重试次数
+        max_retries: 最大尝试次数，None 表示使用当前数据源的重试策略
     
     Returns:
         装饰后的函数
     """
     def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
+            policy = source_settings(current_labels()['source']).retry
+            attempts = max_retries or policy.max_retries
+            for attempt in range(attempts):
                 try:
                     return func(*args, **kwargs)
+                except (BlockedError, DeadlineExceeded) as e:
+                    count_failure(e)
+                    return None
                 except requests.RequestException as e:
-                    if attempt == max_retries - 1:
+                    if attempt == attempts - 1:
+                        count_failure(e)
+                        return None
+                    count_retry()
+                    try:
+                        sleep(policy.wait(attempt))
+                    except DeadlineExceeded as e:
+                        count_failure(e)
                         return None
-                    time.sleep(1)  # 简单的延迟重试
             return None
         return wrapper
     return decorator
 
 def make_request(url: str, headers: Dict[str, str], params: Optional[Dict] = None, 
-                timeout: int = 10) -> Optional[requests.Response]:
+                timeout: Optional[float] = None) -> Optional[requests.Response]:
     """
-    发送HTTP请求
+    发送HTTP请求，受当前数据源的并发和速率限制
+
+    同时进行的相同请求（URL、参数和条件请求头相同）只发出一次，其余调用等待并共享同一个响应。
     
     Args:
         url: 请求URL
         headers: 请求头
         params: 请求参数
-        timeout: 超时时间（秒）
+        timeout: 超时时间（秒），None 表示使用当前数据源的设置；不超过本次查询剩余的时间
 
     Returns:
         Response对象或None（如果请求失败）
+
+    Raises:
+        BlockedError: 主机处于冷却期，或响应是封禁/验证码/登录墙页面
+        DeadlineExceeded: 本次查询已超时或被取消
     """
-    response = requests.get(url, headers=headers, params=params, timeout=timeout)
+    # 条件请求可能得到不带响应体的 304，不能与普通请求共享
+    key = (canonical_url(url), repr(sorted(params.items())) if params else '',
+           headers.get('If-None-Match'), headers.get('If-Modified-Since'))
+    return REQUESTS.do(key, _send_request, url, headers, params, timeout)
+
+def _send_request(url: str, headers: Dict[str, str], params: Optional[Dict],
+                  timeout: Optional[float]) -> requests.Response:
+    """实际发出请求，由 make_request 在合并相同请求后调用"""
+    check_cooldown(url)
+    source = current_labels()['source']
+    if timeout is None:
+        timeout = source_settings(source).timeout
+    trace = current_trace()
+    with throttle(source):
+        # 排队等待之后再计算剩余时间
+        timeout = budget(timeout)
+        connect_before = connection_seconds(trace)
+        try:
+            response = get_session().get(url, headers=headers, params=params, timeout=timeout, stream=True)
+        except requests.exceptions.Timeout:
+            # 超时被截止时间压缩过时报告为 DeadlineExceeded，不再重试，合并的等待者也会各自重新发起
+            check_deadline()
+            raise
+        # elapsed 从发送请求到收到响应头，扣除本次新建连接的耗时即为首字节时间
+        connect_spent = connection_seconds(trace) - connect_before
+        record_phase('ttfb', max(0.0, response.elapsed.total_seconds() - connect_spent))
+        with phase('body'):
+            content = response.content
+    count_request(response.status_code, len(content))
+    check_response(url, response, content)
     response.raise_for_status()
     return response
 
-def get_with_retry(url: str, max_retries: int = 3, delay: float = 1.0) -> Optional[requests.Response]:
+def response_encoding(response: requests.Response) -> Optional[str]:
+    """
+    返回响应头 Content-Type 中声明的字符集，未声明时返回 None
+
+    与 response.encoding 不同，未声明字符集的 text/* 响应不会被当作 ISO-8859-1，
+    交给解析器根据 <meta charset> 判断。
+
+    Args:
+        response: 响应对象
+
+    Returns:
+        字符集名称或 None
+    """
+    content_type = response.headers.get('Content-Type', '')
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type, re.I)
+    return match.group(1) if match else None
+
+def html_from_bytes(content: bytes, encoding: Optional[str] = None, parser: str = 'html.parser',
+                    parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    """
+    直接从原始字节解析HTML
+
+    字符集由 resolve_encoding() 按声明确定后一次解码，解析器拿到的是字符串，不再做严格解码失败后的
+    逐个尝试和全文字符集检测。
+
+    Args:
+        content: 响应体字节
+        encoding: 数据源已知的字符集或响应头声明的字符集，None 时按页面开头的 <meta charset> 判断
+        parser: BeautifulSoup 解析器名称
+        parse_only: 只为匹配的元素（及其子元素）建树，其余内容扫描后丢弃
+
+    Returns:
+        BeautifulSoup 对象
+    """
+    markup = text_from_bytes(content, encoding)
+    with phase('parse'):
+        return BeautifulSoup(markup, parser, parse_only=parse_only)
+
+def json_from_bytes(content: bytes) -> Any:
+    """
+    直接从原始字节解析JSON，记录 decode 阶段耗时
+
+    Args:
+        content: 响应体字节
+
+    Returns:
+        解析后的数据
+    """
+    with phase('decode'):
+        return json.loads(content)
+
+# 页面开头的 <meta charset> 声明
+META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+# 只在前多少字节中查找 <meta charset>
+SNIFF_BYTES = 4096
+# 按浏览器的做法（WHATWG Encoding 标准）把常见字符集名称换成它的超集：
+# 声明 GB2312 / Big5 的页面常混有 GBK / 香港增补字符，按声明严格解码会失败
+CHARSET_SUPERSETS = {
+    'gb2312': 'gb18030',
+    'gbk': 'gb18030',
+    'big5': 'big5hkscs',
+    'cp950': 'big5hkscs',
+    'iso8859_1': 'cp1252',
+    'ascii': 'cp1252',
+}
+
+@lru_cache(maxsize=64)
+def _codec_name(label: str) -> Optional[str]:
+    """字符集名称对应的 Python 编解码器，未知名称返回 None"""
+    try:
+        name = codecs.lookup(label).name.replace('-', '_')
+    except LookupError:
+        return None
+    return CHARSET_SUPERSETS.get(name, name)
+
+def resolve_encoding(content: bytes, encoding: Optional[str] = None) -> str:
+    """
+    确定页面的字符集，不对全文做检测
+
+    依次取：UTF-8 BOM → 给定的字符集（数据源已知的或响应头声明的）→ 前 SNIFF_BYTES 字节中的 <meta charset> → UTF-8。
+
+    Args:
+        content: 响应体字节
+        encoding: 数据源已知的字符集或响应头声明的字符集
+
+    Returns:
+        Python 编解码器名称
+    """
+    if content.startswith(codecs.BOM_UTF8):
+        return 'utf_8_sig'
+    name = _codec_name(encoding) if encoding else None
+    if name:
+        return name
+    match = META_CHARSET_PATTERN.search(content, 0, SNIFF_BYTES)
+    if match:
+        name = _codec_name(match.group(1).decode('ascii'))
+    return name or 'utf_8'
+
+def text_from_bytes(content: bytes, encoding: Optional[str] = None) -> str:
+    """
+    按 resolve_encoding() 确定的字符集把响应体解码为字符串
+
+    Args:
+        content: 响应体字节
+        encoding: 数据源已知的字符集或响应头声明的字符集，None 时按页面开头的 <meta charset> 判断
+
+    Returns:
+        解码后的文本，无法解码的字节替换为 U+FFFD
+    """
+    name = resolve_encoding(content, encoding)
+    with phase('decode'):
+        return content.decode(name, errors='replace')
+
+def parse_html(response: requests.Response, parser: str = 'html.parser') -> BeautifulSoup:
+    """
+    解析HTML响应
+
+    Args:
+        response: 响应对象
+        parser: BeautifulSoup 解析器名称
+
+    Returns:
+        BeautifulSoup 对象
+    """
+    return html_from_bytes(response.content, response_encoding(response), parser)
+
+def parse_json(response: requests.Response) -> Any:
+    """
+    解析JSON响应
+
+    Args:
+        response: 响应对象
+
+    Returns:
+        解析后的数据
+    """
+    return json_from_bytes(response.content)
+
+def paginate(fetch_page: Callable[[int], Optional[List[Dict]]], key: str = 'url',
+             max_empty_pages: int = 1, max_pages: Optional[int] = None) -> Iterator[Dict]:
+    """
+    惰性翻页：调用方继续迭代时才请求下一页，并跨页去重
+
+    Args:
+        fetch_page: 按页码（从1开始）获取一页结果，返回 None 表示没有更多结果
+        key: 跨页去重使用的字段
+        max_empty_pages: 连续多少页没有新结果后停止
+        max_pages: 最多请求的页数，None 表示不限
+
+    Returns:
+        逐条产出图书信息的迭代器
+    """
+    seen = set()
+    empty_pages = 0
+    page = 1
+    while max_pages is None or page <= max_pages:
+        books = fetch_page(page)
+        if books is None:
+            return
+        new_books = 0
+        for book in books:
+            value = book.get(key)
+            if value in seen:
+                continue
+            seen.add(value)
+            new_books += 1
+            yield book
+        empty_pages = 0 if new_books else empty_pages + 1
+        if empty_pages >= max_empty_pages:
+            return
+        page += 1
+
+def get_with_retry(url: str, max_retries: Optional[int] = None, delay: Optional[float] = None) -> Optional[requests.Response]:
     """
     带重试的GET请求
     
     Args:
         url: 请求URL
-        max_retries: 最大重试次数
-        delay: 重试延迟时间（秒）
+        max_retries: 最大重试次数，None 表示使用默认重试策略
+        delay: 重试延迟时间（秒），None 表示使用默认重试策略
         
     Returns:
         Response对象或None（如果所有重试都失败）
@@ -62,22 +301,24 @@ def get_with_retry(url: str, max_retries: int = 3, delay: float = 1.0) -> Option
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
+    settings = source_settings(current_labels()['source'])
+    max_retries = max_retries or settings.retry.max_retries
     
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = requests.get(url, headers=headers, timeout=settings.timeout)
             response.raise_for_status()
             return response
         except RequestException as e:
             if attempt == max_retries - 1:  # 最后一次重试
                 return None
-            time.sleep(delay)
+            time.sleep(delay if delay is not None else settings.retry.wait(attempt))
     
     return None
 
 def clean_text(text: str) -> str:
     """
-    清理文本，移除多余的空白字符
+    清理文本，移除控制字符和多余的空白字符，全角字母数字转为半角
     
     Args:
         text: 输入文本
@@ -85,26 +326,37 @@ def clean_text(text: str) -> str:
     Returns:
         清理后的文本
     """
-    if not text:
-        return ""
-    # 替换多个空白字符为单个空格
-    text = re.sub(r'\s+', ' ', text)
-    # 移除首尾空白
-    return text.strip()
+    return normalize(text)
 
-def clean_text_new(text: str) -> str:
+# 旧名称，保留以兼容外部调用
+clean_text_new = clean_text
+
+def canonical_isbn(text: str) -> Optional[str]:
     """
-    清理文本，去除多余的空白字符
-    
+    把 ISBN-10 或 ISBN-13 规范化为不带分隔符的 ISBN-13
+
     Args:
-        text: 输入文本
-        
+        text: ISBN 文本，可以带连字符或空格，例如 978-7-5366-9293-0、7536692935
+
     Returns:
-        清理后的文本
+        13位 ISBN，校验位不正确或不是 ISBN 时返回 None
     """
     if not text:
-        return ""
-    return ' '.join(text.split())
+        return None
+    isbn = re.sub(r'[\s-]', '', text).upper()
+    if isbn.startswith('ISBN'):
+        isbn = isbn[4:].lstrip(':：')
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        total = sum((10 - i) * int(c) for i, c in enumerate(isbn[:9])) + (10 if isbn[9] == 'X' else int(isbn[9]))
+        if total % 11:
+            return None
+        isbn = '978' + isbn[:9]
+        return isbn + str((10 - sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(isbn)) % 10) % 10)
+    if len(isbn) == 13 and isbn.isdigit() and isbn[:3] in ('978', '979'):
+        if sum((3 if i % 2 else 1) * int(c) for i, c in enumerate(isbn)) % 10:
+            return None
+        return isbn
+    return None
 
 def extract_year(text: str) -> Optional[str]:
     """
@@ -0,0 +1,288 @@
+"""
+价格与库存关注列表
+
+关注列表保存在 SQLite 中（settings 的 watch_db），每条记录一本书在某个数据源的详情地址、上次看到的易变字段
+（数据源的 VOLATILE_FIELDS，如售价、库存状态）、ETag/Last-Modified 以及检查和变化次数。
+字段的每次变化作为一条增量写入 changes 表。
+
+每轮刷新按“上次检查以来已经变化的概率”排序，只在预算内刷新最可能变化的条目：
+    平均变化间隔 = (已观察的时长 + prior_interval) / (变化次数 + 1)
+    变化概率     = 1 - exp(-距上次检查的时长 / 平均变化间隔)
+经常变价的书很快排到前面，长期不变的书间隔自动拉长；新加入的书总是优先检查一次。
+检查失败的条目同样记下检查时间，连续失败时最短检查间隔翻倍，不会每轮都占用预算。
+
+刷新时带上 If-None-Match / If-Modified-Since，服务器返回 304 时不下载也不解析；
+返回新页面时只调用数据源的 parse_volatile_fields 提取易变字段，不做完整的详情解析。
+"""
+import json
+import math
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from sources.deadline import check_deadline, deadline
+from sources.exceptions import DeadlineExceeded
+from sources.metrics import count_failure, count_watch_refresh, trace
+from sources.registry import get_source
+from sources.scheduler import HostScheduler, REFRESH
+from sources.settings import get_settings
+from sources.utils import make_request, response_encoding, retry_on_failure
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watches (
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    fields TEXT NOT NULL DEFAULT '{}',
+    etag TEXT,
+    last_modified TEXT,
+    added REAL NOT NULL,
+    last_checked REAL,
+    last_changed REAL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    changes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, url)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    field TEXT NOT NULL,
+    old TEXT,
+    new TEXT,
+    observed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_observed ON changes (observed);
+"""
+
+# 没有观察到变化时假定的平均变化间隔（秒）
+PRIOR_INTERVAL = 86400.0
+# 同一条目两次检查之间的最短间隔（秒）
+MIN_INTERVAL = 300.0
+# 变化概率低于该值的条目本轮不检查
+MIN_PROBABILITY = 0.05
+# 连续失败时最短检查间隔按 2 的失败次数次方增长，最多增长到该倍数
+MAX_FAILURE_BACKOFF = 2 ** 8
+
+# 网络请求失败时的重试包装，最终失败返回 None
+fetch = retry_on_failure()(make_request)
+
+def supports_watch(source: str) -> bool:
+    """数据源是否提供 parse_volatile_fields，可以加入关注列表"""
+    try:
+        return hasattr(get_source(source), 'parse_volatile_fields')
+    except KeyError:
+        return False
+
+def change_probability(item: Dict, now: float, prior_interval: float = PRIOR_INTERVAL) -> float:
+    """
+    估计条目自上次检查以来已经变化的概率（变化按泊松过程估计）
+
+    Args:
+        item: 关注列表中的一条记录
+        now: 当前时间戳
+        prior_interval: 没有观察到变化时假定的平均变化间隔（秒）
+
+    Returns:
+        0 到 1 之间的概率，从未检查过的条目为 1
+    """
+    if item['last_checked'] is None:
+        return 1.0
+    observed = max(0.0, item['last_checked'] - item['added'])
+    interval = (observed + prior_interval) / (item['changes'] + 1)
+    return 1.0 - math.exp(-(now - item['last_checked']) / interval)
+
+class WatchList:
+    """关注列表，只在创建它的线程中使用"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite 数据库文件，默认取 settings 的 watch_db
+        """
+        path = os.path.expanduser(path or get_settings().watch_db)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+
+    def add(self, source: str, url: str, title: str = '') -> bool:
+        """
+        加入关注列表
+
+        Returns:
+            是否为新加入的条目（已存在时只更新书名）
+        """
+        cursor = self._db.execute('INSERT OR IGNORE INTO watches (source, url, title, added) VALUES (?, ?, ?, ?)',
+                                  (source, url, title, time.time()))
+        if not cursor.rowcount and title:
+            self._db.execute('UPDATE watches SET title = ? WHERE source = ? AND url = ?', (title, source, url))
+        self._db.commit()
+        return cursor.rowcount > 0
+
+    def remove(self, source: str, url: str) -> bool:
+        """移出关注列表，变化记录保留"""
+        cursor = self._db.execute('DELETE FROM watches WHERE source = ? AND url = ?', (source, url))
+        self._db.commit()
+        return cursor.rowcount > 0
+
+    def items(self) -> List[Dict]:
+        """全部条目"""
+        return [dict(row) for row in self._db.execute('SELECT * FROM watches')]
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM watches').fetchone()[0]
+
+    def due(self, budget: int, now: Optional[float] = None, prior_interval: float = PRIOR_INTERVAL,
+            min_interval: float = MIN_INTERVAL, min_probability: float = MIN_PROBABILITY) -> List[Dict]:
+        """
+        选出本轮要刷新的条目
+
+        Args:
+            budget: 本轮最多刷新的条数
+            now: 当前时间戳，默认 time.time()
+            prior_interval: 没有观察到变化时假定的平均变化间隔（秒）
+            min_interval: 距上次检查不足该秒数的条目不刷新（连续失败的条目按失败次数翻倍）
+            min_probability: 变化概率低于该值的条目不刷新
+
+        Returns:
+            按变化概率从高到低排列的条目，每条带有 probability 字段
+        """
+        now = time.time() if now is None else now
+        candidates = []
+        for item in self.items():
+            backoff = min(2 ** item['failures'], MAX_FAILURE_BACKOFF)
+            if item['last_checked'] is not None and now - item['last_checked'] < min_interval * backoff:
+                continue
+            item['probability'] = change_probability(item, now, prior_interval)
+            if item['probability'] >= min_probability:
+                candidates.append(item)
+        candidates.sort(key=lambda item: item['probability'], reverse=True)
+        return candidates[:budget]
+
+    def record(self, item: Dict, outcome: Dict) -> str:
+        """
+        保存一次刷新结果，字段有变化时写入增量
+
+        Args:
+            item: 刷新的条目
+            outcome: refresh_item() 的返回值
+
+        Returns:
+            changed / unchanged / not_modified / failed
+        """
+        now = outcome.get('checked', time.time())
+        key = (item['source'], item['url'])
+        if outcome['status'] == 'failed':
+            # 记下检查时间，变化概率从零重新累积，失败的条目不会每轮都排在最前面
+            self._db.execute('UPDATE watches SET last_checked = ?, failures = failures + 1 '
+                             'WHERE source = ? AND url = ?', (now,) + key)
+            self._db.commit()
+            return 'failed'
+        if outcome['status'] == 'not_modified':
+            self._db.execute('UPDATE watches SET last_checked = ?, checks = checks + 1, failures = 0 '
+                             'WHERE source = ? AND url = ?', (now,) + key)
+            self._db.commit()
+            return 'not_modified'
+
+        old = json.loads(item['fields'])
+        new = outcome['fields']
+        # 第一次检查只记录当前值，不算变化
+        deltas = [(name, old.get(name), new.get(name)) for name in sorted(set(old) | set(new))
+                  if old and old.get(name) != new.get(name)]
+        for name, before, after in deltas:
+            self._db.execute('INSERT INTO changes (source, url, field, old, new, observed) VALUES (?, ?, ?, ?, ?, ?)',
+                             key + (name, before, after, now))
+        self._db.execute(
+            'UPDATE watches SET fields = ?, etag = ?, last_modified = ?, last_checked = ?, checks = checks + 1, '
+            'changes = changes + ?, last_changed = CASE WHEN ? THEN ? ELSE last_changed END, failures = 0 '
+            'WHERE source = ? AND url = ?',
+            (json.dumps(new, ensure_ascii=False), outcome.get('etag'), outcome.get('last_modified'), now,
+             1 if deltas else 0, bool(deltas), now) + key)
+        self._db.commit()
+        return 'changed' if deltas else 'unchanged'
+
+    def changes(self, since: Optional[float] = None, limit: int = 100) -> List[Dict]:
+        """最近的字段变化，新的在前"""
+        rows = self._db.execute(
+            'SELECT c.*, w.title FROM changes c LEFT JOIN watches w ON w.source = c.source AND w.url = c.url '
+            'WHERE c.observed >= ? ORDER BY c.observed DESC, c.id DESC LIMIT ?', (since or 0, limit))
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self._db.close()
+
+def _out_of_time() -> bool:
+    """本轮的时间预算是否已用完或已取消"""
+    try:
+        check_deadline()
+    except DeadlineExceeded:
+        return True
+    return False
+
+def refresh_item(item: Dict) -> Dict:
+    """
+    重新获取一个条目的易变字段（不访问数据库，可在线程池中执行）
+
+    本轮时间预算用完时返回 skipped：条目没有真正检查过，不算数据源失败，也不推迟下一次检查。
+
+    Returns:
+        {'status': 'not_modified'|'fetched'|'failed'|'skipped', 'fields': ..., 'etag': ..., 'last_modified': ..., 'checked': ...}
+    """
+    if _out_of_time():
+        return {'status': 'skipped'}
+    source = item['source']
+    module = get_source(source)
+    with trace(source, 'refresh'):
+        try:
+            url, headers, params = module.build_details_request(item['url'])
+            headers = dict(headers)
+            if item.get('etag'):
+                headers['If-None-Match'] = item['etag']
+            if item.get('last_modified'):
+                headers['If-Modified-Since'] = item['last_modified']
+            response = fetch(url, headers, params)
+            if response is None:
+                # retry_on_failure 遇到超时也返回 None，此时不能算作数据源失败
+                return {'status': 'skipped'} if _out_of_time() else {'status': 'failed', 'error': '请求失败'}
+            if response.status_code == 304:
+                return {'status': 'not_modified', 'checked': time.time()}
+            fields = module.parse_volatile_fields(response.content, item['url'], response_encoding(response))
+            return {'status': 'fetched', 'fields': fields, 'checked': time.time(),
+                    'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        except DeadlineExceeded:
+            return {'status': 'skipped'}
+        except Exception as e:
+            count_failure(e)
+            return {'status': 'failed', 'error': str(e)}
+
+def run_cycle(watch: WatchList, budget: int, workers: int = 8, seconds: Optional[float] = None,
+              **schedule) -> Dict[str, int]:
+    """
+    执行一轮刷新
+
+    Args:
+        watch: 关注列表
+        budget: 本轮最多刷新的条数
+        workers: 并发线程数（按数据源轮转，每个数据源的并发和限流仍按 settings 生效）
+        seconds: 本轮的时间预算，None 或 0 表示不限；用完后未开始的条目留到下一轮
+        **schedule: 传给 WatchList.due() 的调度参数
+
+    Returns:
+        各结果的条数，例如 {'changed': 3, 'unchanged': 40, 'not_modified': 150, 'failed': 1, 'skipped': 0}；
+        skipped 为预算用完而没有检查的条目，不写入数据库
+    """
+    stats = {'changed': 0, 'unchanged': 0, 'not_modified': 0, 'failed': 0, 'skipped': 0}
+    items = watch.due(budget, **schedule)
+    # 以最低优先级刷新，同一进程中的交互查询和批量任务优先取得数据源的请求名额
+    with deadline(seconds), HostScheduler(workers, thread_name_prefix='bookfinder-watch') as scheduler:
+        futures = [(item, scheduler.submit(item['source'], refresh_item, item, level=REFRESH)) for item in items]
+        for item, future in futures:
+            outcome = future.result()
+            result = 'skipped' if outcome['status'] == 'skipped' else watch.record(item, outcome)
+            count_watch_refresh(item['source'], result)
+            stats[result] += 1
+    return stats
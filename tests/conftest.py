@@ -0,0 +1,44 @@
+"""
+测试共用的模拟服务器和隔离的缓存目录
+
+config.py 在导入时读取 BOOKFINDER_MOCK_URL，所以模拟服务器在 pytest_configure 中启动，
+早于任何测试模块导入 sources。缓存、索引和关注列表都放在临时目录中，不会读写用户目录下的数据。
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from mock_server import Behaviour, MockServer
+
+_server = None
+_temp_dir = None
+
+def pytest_configure(config):
+    global _server, _temp_dir
+    _temp_dir = tempfile.mkdtemp(prefix='bookfinder-test-')
+    _server = MockServer(('127.0.0.1', 0), Behaviour(), {})
+    threading.Thread(target=_server.serve_forever, name='mock-server', daemon=True).start()
+    os.environ.update({
+        'BOOKFINDER_MOCK_URL': f"http://127.0.0.1:{_server.server_address[1]}",
+        'BOOKFINDER_SETTINGS': os.path.join(_temp_dir, 'settings.json'),
+        'BOOKFINDER_RESULT_CACHE_DIR': os.path.join(_temp_dir, 'results'),
+        'BOOKFINDER_ISBN_INDEX_DIR': os.path.join(_temp_dir, 'isbn'),
+        'BOOKFINDER_COVER_CACHE_DIR': os.path.join(_temp_dir, 'covers'),
+        'IMGHOST_ENABLED': 'false',
+        'IMGHOST_TOKEN_FILE': os.path.join(_temp_dir, 'token.json'),
+    })
+
+def pytest_unconfigure(config):
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+    if _temp_dir is not None:
+        shutil.rmtree(_temp_dir, ignore_errors=True)
+
+@pytest.fixture
+def mock_server() -> MockServer:
+    """运行中的模拟服务器，可在测试中修改其行为（如 price_drift）"""
+    return _server
@@ -0,0 +1,32 @@
+import json
+
+from batch import drop_unfinished
+from sources.dedupe import ProcessedFilter
+
+def write_records(path, records):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.write('{"source": "douban", "qu')  # 中断时写了一半
+
+def test_resume_keeps_one_record_per_key(tmp_path):
+    output = str(tmp_path / 'results.jsonl')
+    processed = ProcessedFilter(output, capacity=100)
+    for keyword in ('三体', '活着', '围城'):
+        assert processed.claim(f"douban\t{keyword}")
+    processed.complete('douban\t三体')
+    processed.close()
+    write_records(output, [
+        {'source': 'douban', 'query': '三体', 'results': [{'title': '三体'}]},
+        {'source': 'douban', 'query': '活着', 'results': [], 'error': '搜索请求失败'},
+        # 写入了结果但中断前没来得及标记完成
+        {'source': 'douban', 'query': '围城', 'results': [{'title': '围城'}]},
+    ])
+
+    processed = ProcessedFilter(output, capacity=100, resume=True)
+    assert drop_unfinished(output, processed) == 3
+    claimed = [k for k in ('三体', '活着', '围城') if processed.claim(f"douban\t{k}")]
+    processed.close()
+    assert claimed == ['活着', '围城']
+    with open(output, encoding='utf-8') as f:
+        assert [json.loads(line)['query'] for line in f] == ['三体']
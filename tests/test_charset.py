@@ -0,0 +1,59 @@
+import codecs
+
+import pytest
+
+from sources.megbookhk import search as megbookhk
+from sources.megbooktw import search as megbooktw
+from sources.utils import SNIFF_BYTES, html_from_bytes, resolve_encoding, text_from_bytes
+
+@pytest.mark.parametrize('label, codec', [
+    ('gb2312', 'gb18030'),
+    ('GBK', 'gb18030'),
+    ('gb18030', 'gb18030'),
+    ('big5', 'big5hkscs'),
+    ('Big5', 'big5hkscs'),
+    ('cp950', 'big5hkscs'),
+    ('ISO-8859-1', 'cp1252'),
+    ('latin1', 'cp1252'),
+    ('us-ascii', 'cp1252'),
+    ('UTF-8', 'utf_8'),
+    ('utf8', 'utf_8'),
+])
+def test_declared_charset_maps_to_superset(label, codec):
+    assert resolve_encoding(b'', label) == codec
+
+def test_superset_decodes_characters_outside_declared_charset():
+    # “镕” 不在 GB2312 中，“堃” 是香港增补字符，按声明的字符集严格解码会失败
+    gbk_page = '<meta charset="gb2312"><p>朱镕基</p>'.encode('gbk')
+    assert '朱镕基' in text_from_bytes(gbk_page)
+    hkscs_page = '<meta charset="big5"><p>堃</p>'.encode('big5hkscs')
+    assert '堃' in text_from_bytes(hkscs_page)
+
+def test_bom_wins_over_declarations():
+    content = codecs.BOM_UTF8 + '<meta charset="big5"><p>三体</p>'.encode('utf-8')
+    assert resolve_encoding(content, 'gbk') == 'utf_8_sig'
+    assert text_from_bytes(content, 'gbk') == '<meta charset="big5"><p>三体</p>'
+
+def test_given_charset_wins_over_meta():
+    content = '<meta charset="big5"><p>三体</p>'.encode('gb18030')
+    assert resolve_encoding(content, 'gb2312') == 'gb18030'
+
+def test_meta_charset_used_when_nothing_given():
+    assert resolve_encoding(b'<html><head><meta http-equiv="Content-Type" content="text/html; charset=big5">') \
+        == 'big5hkscs'
+    assert resolve_encoding(b'<meta charset=\'GBK\'>') == 'gb18030'
+
+def test_unknown_or_late_declaration_falls_back_to_utf8():
+    assert resolve_encoding(b'<meta charset="x-no-such-charset">', 'also-unknown') == 'utf_8'
+    late = b' ' * SNIFF_BYTES + b'<meta charset="big5">'
+    assert resolve_encoding(late) == 'utf_8'
+
+def test_html_from_bytes_uses_resolved_charset():
+    soup = html_from_bytes('<meta charset="gb2312"><title>朱镕基</title>'.encode('gbk'))
+    assert soup.title.get_text() == '朱镕基'
+
+@pytest.mark.parametrize('module', [megbookhk, megbooktw])
+def test_megbook_pages_without_content_type(module):
+    # 模拟服务器的书店页面不发送 Content-Type，只能依赖数据源已知的字符集
+    results = module.search_books('三体', limit=None)
+    assert results and results[0]['title'] == '三体'
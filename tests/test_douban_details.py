@@ -0,0 +1,40 @@
+import re
+
+import pytest
+
+from config import DOUBAN_BASE_URL
+from sources.douban import search as douban
+from sources.utils import html_from_bytes, make_request, response_encoding, text_from_bytes
+
+JSON_LD_SCRIPT = re.compile(rb'<script type="application/ld\+json">.*?</script>', re.S)
+
+def fetch_page(book_id: int):
+    url = f"{DOUBAN_BASE_URL}/subject/{book_id}/"
+    response = make_request(*douban.build_details_request(url))
+    return url, response.content, response_encoding(response)
+
+@pytest.mark.parametrize('book_id', [1000001, 1000002, 1000007, 1000042])
+def test_fast_path_matches_dom_parser(book_id):
+    url, content, encoding = fetch_page(book_id)
+    fast = douban.parse_book_details_fast(text_from_bytes(content, encoding), url)
+    dom = douban.parse_book_details_dom(html_from_bytes(content, encoding), url)
+    assert fast is not None
+    assert fast['title'] and fast['isbn']
+    assert fast == dom
+    assert list(fast) == list(dom)
+    assert douban.parse_book_details(content, url, encoding) == dom
+
+def test_page_without_structured_data_still_matches():
+    url, content, encoding = fetch_page(1000003)
+    stripped = JSON_LD_SCRIPT.sub(b'', content)
+    assert stripped != content
+    dom = douban.parse_book_details_dom(html_from_bytes(content, encoding), url)
+    assert douban.parse_book_details(stripped, url, encoding) == dom
+
+def test_unexpected_layout_falls_back_to_dom():
+    url, content, encoding = fetch_page(1000004)
+    # 没有 #info 时快速路径放弃，由整页解析给出结果
+    broken = content.replace(b'id="info"', b'id="info-moved"')
+    assert douban.parse_book_details_fast(text_from_bytes(broken, encoding), url) is None
+    assert douban.parse_book_details(broken, url, encoding) == \
+        douban.parse_book_details_dom(html_from_bytes(broken, encoding), url)
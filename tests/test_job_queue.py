@@ -0,0 +1,121 @@
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+import requests
+
+from sources.job_queue import DEAD, PENDING, HttpJobQueue, JobQueue, QueueServer, SqliteJobQueue, open_queue
+
+def make_jobs(count: int, source: str = 'douban'):
+    return [{'line': i + 1, 'source': source, 'keyword': f"关键词{i}", 'details': 0} for i in range(count)]
+
+def record(job, **extra):
+    return dict({'source': job['source'], 'query': job['keyword'], 'results': []}, **extra)
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SqliteJobQueue(str(tmp_path / 'jobs.db'))
+    yield queue
+    queue.close()
+
+def drain(path: str, worker: str, out):
+    """工作进程：领取并完成任务直到队列为空，返回领取到的任务编号"""
+    queue = open_queue(path)
+    taken = []
+    while True:
+        jobs = queue.lease(worker, 7)
+        if not jobs:
+            break
+        for job in jobs:
+            assert queue.complete(job['token'], record(job, worker=worker))
+            taken.append(job['id'])
+    queue.close()
+    out.put(taken)
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        JobQueue()
+
+def test_enqueue_skips_duplicates(queue):
+    assert queue.enqueue(make_jobs(10)) == 10
+    assert queue.enqueue(make_jobs(12)) == 2
+    assert queue.stats()[PENDING] == 12
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='需要 fork')
+def test_concurrent_workers_take_each_job_once(queue):
+    queue.enqueue(make_jobs(300))
+    context = multiprocessing.get_context('fork')
+    out = context.Queue()
+    workers = [context.Process(target=drain, args=(queue.path, f"w{i}", out)) for i in range(3)]
+    for worker in workers:
+        worker.start()
+    taken = [job_id for _ in workers for job_id in out.get(timeout=60)]
+    for worker in workers:
+        worker.join()
+    assert sorted(taken) == list(range(1, 301))
+    assert queue.finished()
+    records = [json.loads(line) for line in queue.results()]
+    assert [r['query'] for r in records] == [f"关键词{i}" for i in range(300)]
+
+def test_expired_lease_token_cannot_commit(queue):
+    queue.enqueue(make_jobs(1))
+    [first] = queue.lease('a', 1, lease_seconds=0.05)
+    time.sleep(0.1)
+    [second] = queue.lease('b', 1)
+    assert second['id'] == first['id'] and second['token'] != first['token']
+    assert queue.heartbeat([first['token'], second['token']]) == [second['token']]
+    assert not queue.complete(first['token'], record(first, worker='a'))
+    assert queue.fail(first['token'], record(first, error='x')) is None
+    assert queue.complete(second['token'], record(second, worker='b'))
+    assert [json.loads(line)['worker'] for line in queue.results()] == ['b']
+
+def test_failed_job_retries_then_dead_letters(queue):
+    queue.enqueue(make_jobs(1), max_attempts=2)
+    [job] = queue.lease('a', 1)
+    assert queue.fail(job['token'], record(job, error='boom'), retry_delay=0) == PENDING
+    [job] = queue.lease('a', 1)
+    assert job['attempts'] == 2
+    assert queue.fail(job['token'], record(job, error='boom'), retry_delay=0) == DEAD
+    assert queue.finished()
+    assert json.loads(next(queue.results()))['error'] == 'boom'
+    assert queue.requeue_dead() == 1
+    assert not queue.finished()
+
+class BrokenQueue(SqliteJobQueue):
+    def stats(self):
+        raise RuntimeError('disk on fire')
+
+@pytest.fixture
+def served(tmp_path):
+    """带令牌鉴权的 HTTP 队列服务"""
+    local = BrokenQueue(str(tmp_path / 'served.db'))
+    server = QueueServer(('127.0.0.1', 0), local, token='secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    local.close()
+
+def test_http_queue_requires_token(served):
+    with HttpJobQueue(served, token='wrong') as remote:
+        with pytest.raises(requests.HTTPError) as error:
+            remote.lease('a', 1)
+    assert error.value.response.status_code == 401
+
+def test_http_queue_round_trip(served):
+    with HttpJobQueue(served, token='secret') as remote:
+        assert remote.enqueue(make_jobs(3)) == 3
+        jobs = remote.lease('a', 5)
+        assert len(jobs) == 3
+        assert all(remote.complete(job['token'], record(job)) for job in jobs)
+        assert not remote.complete(jobs[0]['token'], record(jobs[0]))
+        assert len(list(remote.results())) == 3
+
+def test_http_queue_reports_server_errors(served):
+    with HttpJobQueue(served, token='secret') as remote:
+        with pytest.raises(requests.HTTPError) as error:
+            remote.stats()
+    assert error.value.response.status_code == 500
+    assert 'disk on fire' in error.value.response.json()['error']
@@ -0,0 +1,92 @@
+from dataclasses import replace
+
+import pytest
+
+from sources.result_cache import cached, get_result_cache
+from sources.settings import get_settings, update_settings
+from sources.utils import retry_on_failure
+
+@pytest.fixture(autouse=True)
+def fresh_cache(tmp_path):
+    """每个测试使用独立的缓存目录"""
+    original = get_settings()
+    update_settings(replace(original, result_cache_enabled=True, result_cache_dir=str(tmp_path)))
+    yield get_result_cache()
+    update_settings(original)
+
+def test_functions_with_same_arguments_do_not_share_entries():
+    @cached('douban', 'search')
+    @retry_on_failure()
+    def search_books(keyword, page=1):
+        return [{'title': f"books:{keyword}:{page}"}]
+
+    @cached('douban', 'search')
+    @retry_on_failure()
+    def search_page(keyword, page=1):
+        return [{'title': f"page:{keyword}:{page}"}]
+
+    assert search_books('三体') == [{'title': 'books:三体:1'}]
+    assert search_page('三体') == [{'title': 'page:三体:1'}]
+    assert search_books('三体') == [{'title': 'books:三体:1'}]
+
+def test_explicit_name_separates_entries():
+    @cached('douban', 'search', name='first')
+    def first(keyword):
+        return ['first']
+
+    @cached('douban', 'search', name='second')
+    def second(keyword):
+        return ['second']
+
+    assert first('x') == ['first']
+    assert second('x') == ['second']
+
+def test_default_arguments_share_entry():
+    calls = []
+
+    @cached('douban', 'search')
+    def search(keyword, page=1, limit=None):
+        calls.append((keyword, page, limit))
+        return [keyword]
+
+    search('三体')
+    search('三体', 1)
+    search('三体', page=1, limit=None)
+    search(keyword='三体')
+    assert calls == [('三体', 1, None)]
+    search('三体', 2)
+    assert len(calls) == 2
+
+def test_query_is_normalized():
+    calls = []
+
+    @cached('douban', 'search')
+    def search(keyword):
+        calls.append(keyword)
+        return [keyword]
+
+    assert search('ＡＢＣ ') == ['ＡＢＣ ']
+    assert search('abc') == ['ＡＢＣ ']
+    assert len(calls) == 1
+
+def test_disabled_cache_calls_through():
+    calls = []
+
+    @cached('douban', 'search')
+    def search(keyword):
+        calls.append(keyword)
+        return [keyword]
+
+    update_settings(replace(get_settings(), result_cache_enabled=False))
+    search('x')
+    search('x')
+    assert len(calls) == 2
+
+def test_douban_search_functions_use_separate_entries():
+    from sources.douban import search as douban
+
+    books = douban.search_books('三体')
+    page = douban.search_page('三体')
+    assert books and page
+    keys = [key for key in get_result_cache()._memory if key.startswith('douban:')]
+    assert {key.split(':')[1] for key in keys} == {'search_books', 'search_page'}
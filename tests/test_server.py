@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+import requests
+
+import server
+from server import ApiServer
+
+class BrokenSource:
+    def get_book_details(self, book_id):
+        raise RuntimeError('parser exploded')
+
+@pytest.fixture
+def api():
+    api = ApiServer(('127.0.0.1', 0), workers=2)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{api.server_address[1]}"
+    api.shutdown()
+    api.server_close()
+
+def test_health(api):
+    response = requests.get(f"{api}/health", timeout=5)
+    assert response.status_code == 200 and response.json()['status'] == 'ok'
+
+def test_source_error_returns_500(api, monkeypatch):
+    monkeypatch.setattr(server, 'get_source', lambda name: BrokenSource())
+    response = requests.get(f"{api}/details", params={'source': 'douban', 'id': '1'}, timeout=5)
+    assert response.status_code == 500
+    assert 'parser exploded' in response.json()['error']
+    # 出错后服务仍然正常响应
+    assert requests.get(f"{api}/health", timeout=5).status_code == 200
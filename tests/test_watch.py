@@ -0,0 +1,75 @@
+import json
+import time
+
+import pytest
+
+from config import MEGBOOKHK_BASE_URL, MEGBOOKTW_BASE_URL
+from sources.megbookhk import search as megbookhk
+from sources.megbooktw import search as megbooktw
+from sources.utils import make_request, response_encoding
+from sources.watch import MIN_INTERVAL, WatchList, run_cycle
+
+def detail_url(module, book_id: int) -> str:
+    base = MEGBOOKHK_BASE_URL if module is megbookhk else MEGBOOKTW_BASE_URL
+    return f"{base}/mall/detail.jsp?proID={book_id}"
+
+@pytest.fixture
+def watch(tmp_path):
+    watch = WatchList(str(tmp_path / 'watch.db'))
+    yield watch
+    watch.close()
+
+@pytest.mark.parametrize('module', [megbookhk, megbooktw])
+def test_volatile_fields_match_full_parser(module):
+    url = detail_url(module, 1000001)
+    response = make_request(*module.build_details_request(url))
+    encoding = response_encoding(response)
+    # 模拟页面的售价写作 “售價：&nbsp;HK$ ...”，快速路径需要先还原实体
+    assert b'&nbsp;' in response.content
+    details = module.parse_book_details(response.content, url, encoding)
+    assert details['price']
+    assert module.parse_volatile_fields(response.content, url, encoding) == {'price': details['price']}
+
+def test_volatile_fields_decode_entities():
+    page = '<td>售價：&nbsp;HK$ 88.0<br></td>'.encode('gb18030')
+    assert megbookhk.parse_volatile_fields(page, 'http://example.com/') == {'price': 'HK$ 88.0'}
+
+def test_price_change_recorded_as_delta(watch, mock_server):
+    url = detail_url(megbookhk, 1000004)  # 编号能被 4 整除的图书会随 price_drift 变价
+    watch.add('megbookhk', url, '测试')
+    assert run_cycle(watch, budget=10)['unchanged'] == 1
+    first = watch.items()[0]
+    assert watch.changes() == []
+
+    mock_server.price_drift = 1.0
+    try:
+        stats = run_cycle(watch, budget=10, now=first['last_checked'] + MIN_INTERVAL * 1000)
+    finally:
+        mock_server.price_drift = 0.0
+    assert stats['changed'] == 1
+    changes = watch.changes()
+    assert [(c['field'], c['url']) for c in changes] == [('price', url)]
+    item = watch.items()[0]
+    assert changes[0]['old'] == json.loads(first['fields'])['price']
+    assert changes[0]['new'] == json.loads(item['fields'])['price'] != changes[0]['old']
+    assert item['changes'] == 1 and item['checks'] == 2
+
+def test_failures_back_off(watch):
+    watch.add('megbookhk', 'http://example.com/a')
+    item = watch.items()[0]
+    now = time.time()
+    assert watch.record(item, {'status': 'failed', 'checked': now}) == 'failed'
+    item = watch.items()[0]
+    assert item['last_checked'] == now and item['failures'] == 1
+    assert watch.due(10, now=now + MIN_INTERVAL * 1.5, min_probability=0) == []
+    assert len(watch.due(10, now=now + MIN_INTERVAL * 2.5, min_probability=0)) == 1
+
+def test_items_past_deadline_are_skipped(watch):
+    for book_id in (1000001, 1000002, 1000003):
+        watch.add('megbookhk', detail_url(megbookhk, book_id))
+    before = {item['url']: (item['last_checked'], item['failures']) for item in watch.items()}
+    stats = run_cycle(watch, budget=10, seconds=1e-6)
+    assert stats['skipped'] == 3 and stats['failed'] == 0
+    # 没有检查过的条目不记录失败，也不推迟下一次检查
+    assert {item['url']: (item['last_checked'], item['failures']) for item in watch.items()} == before
+    assert len(watch.due(10, min_probability=0)) == 3
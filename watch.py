@@ -0,0 +1,146 @@
+"""
+价格与库存关注列表
+
+把书店和亚马逊的图书加入关注列表后定期运行 run，每轮在预算内优先刷新最可能变化的条目，
+价格和库存的变化记录为增量:
+    python watch.py add megbookhk "https://www.megbook.com.hk/mall/detail.jsp?proID=123" --title 三体
+    python watch.py import results.jsonl          # 导入 batch.py --details 的输出
+    python watch.py run --budget 200 --loop 600   # 每 10 分钟一轮，每轮最多刷新 200 条
+    python watch.py changes --since 24            # 最近 24 小时的变化
+    python watch.py list                          # 按变化概率查看下一轮的刷新顺序
+"""
+import argparse
+import json
+import os
+import time
+from typing import Iterator, Tuple
+
+from sources.metrics import write_metrics
+from sources.watch import (WatchList, run_cycle, supports_watch, change_probability,
+                           PRIOR_INTERVAL, MIN_INTERVAL, MIN_PROBABILITY)
+
+def iter_entries(path: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    读取要导入的条目，返回 (数据源, 详情地址, 书名)
+
+    支持 batch.py 的输出（取 details，没有时取 results）和每行 “数据源 详情地址” 的文本文件。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                for book in record.get('details') or record.get('results') or []:
+                    if book and book.get('url'):
+                        yield record.get('source', ''), book['url'], book.get('title', '')
+            else:
+                parts = line.split(None, 2)
+                if len(parts) >= 2:
+                    yield parts[0], parts[1], parts[2] if len(parts) > 2 else ''
+
+def main():
+    parser = argparse.ArgumentParser(description='BookFinder 价格与库存关注列表')
+    parser.add_argument('--db', default=None, help='关注列表数据库文件，默认取 settings 的 watch_db')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = commands.add_parser('add', help='加入关注列表')
+    add_parser.add_argument('source', help='数据源代号（megbookhk/megbooktw/amazon）')
+    add_parser.add_argument('urls', nargs='+', help='详情页地址')
+    add_parser.add_argument('--title', default='', help='书名，仅用于显示')
+
+    import_parser = commands.add_parser('import', help='从 batch.py 输出或 “数据源 地址” 文本文件导入')
+    import_parser.add_argument('file')
+
+    remove_parser = commands.add_parser('remove', help='移出关注列表')
+    remove_parser.add_argument('source')
+    remove_parser.add_argument('url')
+
+    run_parser = commands.add_parser('run', help='刷新最可能变化的条目')
+    run_parser.add_argument('--budget', type=int, default=200, help='每轮最多刷新的条数')
+    run_parser.add_argument('--workers', type=int, default=8, help='并发线程数')
+    run_parser.add_argument('--deadline', type=float, default=None, help='每轮的时间预算（秒）')
+    run_parser.add_argument('--prior-interval', type=float, default=PRIOR_INTERVAL,
+                            help='没有观察到变化时假定的平均变化间隔（秒）')
+    run_parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL, help='同一条目两次检查的最短间隔（秒）')
+    run_parser.add_argument('--min-probability', type=float, default=MIN_PROBABILITY,
+                            help='变化概率低于该值的条目本轮不刷新')
+    run_parser.add_argument('--loop', type=float, default=0, help='每隔多少秒运行一轮，0 表示只运行一轮')
+
+    list_parser = commands.add_parser('list', help='按变化概率列出条目')
+    list_parser.add_argument('--limit', type=int, default=20)
+    list_parser.add_argument('--prior-interval', type=float, default=PRIOR_INTERVAL)
+
+    changes_parser = commands.add_parser('changes', help='列出最近的变化')
+    changes_parser.add_argument('--since', type=float, default=24, help='最近多少小时')
+    changes_parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    watch = WatchList(args.db)
+    try:
+        if args.command == 'add':
+            if not supports_watch(args.source):
+                print(f"数据源 {args.source} 不支持关注价格和库存")
+                return
+            added = sum(watch.add(args.source, url, args.title) for url in args.urls)
+            print(f"新加入 {added} 条，关注列表共 {len(watch)} 条")
+
+        elif args.command == 'import':
+            added = skipped = 0
+            supported = {}
+            for source, url, title in iter_entries(args.file):
+                if source not in supported:
+                    supported[source] = supports_watch(source)
+                if not supported[source]:
+                    skipped += 1
+                    continue
+                added += watch.add(source, url, title)
+            print(f"新加入 {added} 条，跳过不支持的数据源 {skipped} 条，关注列表共 {len(watch)} 条")
+
+        elif args.command == 'remove':
+            print("已移除" if watch.remove(args.source, args.url) else "关注列表中没有该条目")
+
+        elif args.command == 'run':
+            while True:
+                started = time.perf_counter()
+                stats = run_cycle(watch, args.budget, args.workers, args.deadline,
+                                  prior_interval=args.prior_interval, min_interval=args.min_interval,
+                                  min_probability=args.min_probability)
+                print(f"[{time.strftime('%H:%M:%S')}] 刷新 {sum(stats.values()) - stats['skipped']}/{len(watch)} 条: "
+                      f"变化 {stats['changed']}，未变 {stats['unchanged']}，未修改(304) {stats['not_modified']}，"
+                      f"失败 {stats['failed']}，超时未检查 {stats['skipped']}，耗时 {time.perf_counter() - started:.1f} 秒")
+                metrics_file = os.getenv('BOOKFINDER_METRICS_FILE')
+                if metrics_file:
+                    write_metrics(metrics_file)
+                if not args.loop:
+                    break
+                time.sleep(args.loop)
+
+        elif args.command == 'list':
+            now = time.time()
+            items = watch.items()
+            for item in items:
+                item['probability'] = change_probability(item, now, args.prior_interval)
+            items.sort(key=lambda item: item['probability'], reverse=True)
+            for item in items[:args.limit]:
+                fields = json.loads(item['fields'])
+                print(f"{item['probability']:5.2f}  {item['source']:<10} 检查 {item['checks']:>3} 次 "
+                      f"变化 {item['changes']:>3} 次  {json.dumps(fields, ensure_ascii=False)}  "
+                      f"{item['title'] or item['url']}")
+
+        elif args.command == 'changes':
+            for change in watch.changes(time.time() - args.since * 3600, args.limit):
+                observed = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(change['observed']))
+                print(f"{observed}  {change['source']:<10} {change['title'] or change['url']}  "
+                      f"{change['field']}: {change['old']} → {change['new']}")
+    except KeyboardInterrupt:
+        print("\n已中断")
+    finally:
+        watch.close()
+
+if __name__ == '__main__':
+    main()